@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -78,11 +80,52 @@ WSGI_APPLICATION = 'allowanceBackend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Selected with the DATABASE_PROFILE environment variable (or .env file):
+#   sqlite   - local file database, tuned by SQLITE_PRAGMAS below
+#   postgres - needs `pip install "psycopg[binary,pool]"`
+DATABASE_PROFILE = config('DATABASE_PROFILE', default='sqlite')
+
+if DATABASE_PROFILE == 'postgres':
+    DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('POSTGRES_DB', default='allowance'),
+            'USER': config('POSTGRES_USER', default='allowance'),
+            'PASSWORD': config('POSTGRES_PASSWORD', default=''),
+            'HOST': config('POSTGRES_HOST', default='localhost'),
+            'PORT': config('POSTGRES_PORT', default='5432'),
+            # Persistent connections and psycopg's pool are mutually exclusive
+            'CONN_MAX_AGE': 0 if DATABASE_POOL else config('DATABASE_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+                    'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+                },
+            } if DATABASE_POOL else {},
+        }
     }
+elif DATABASE_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+            'TEST': {
+                # Point at a file (e.g. /tmp/test.sqlite3) to load test WAL mode;
+                # the default is an in-memory database.
+                'NAME': config('SQLITE_TEST_PATH', default='') or None,
+            },
+        }
+    }
+else:
+    raise ValueError(f'Unknown DATABASE_PROFILE: {DATABASE_PROFILE}')
+
+# Applied to every new SQLite connection by api.signals.configure_sqlite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',      # readers no longer block the single writer
+    'synchronous': 'NORMAL',    # fsync at checkpoints instead of every commit (safe with WAL)
+    'busy_timeout': 5000,       # ms to wait for the write lock instead of failing
 }
 
 
@@ -130,11 +173,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication that caches the token's user (see AUTH_CACHE)
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Renders api.money.Money amounts in plain dict responses
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # JWT Configuration
@@ -180,3 +229,167 @@ CORS_ALLOW_ALL_ORIGINS = True
 import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+
+# Exchange rate cache used by every quote (see api/rate_cache.py; defaults in api/conf.py)
+RATE_CACHE = {
+    'ENABLED': True,
+    'TTL': 60,
+    'STALE_TTL': 300,
+    # Set to a CACHES alias (e.g. a shared Redis/Memcached cache) so several
+    # workers reuse one snapshot; None keeps the snapshot in process memory.
+    'CACHE_ALIAS': None,
+}
+
+# Background exchange rate polling (see api/refresher.py). Run
+# `python manage.py refresh_rates` alongside the web workers, or set
+# AUTOSTART to poll from a thread inside a single web process.
+RATE_REFRESH = {
+    'INTERVAL': 60,
+    'JITTER': 0.1,
+    'MAX_BACKOFF': 600,
+    'STALE_AFTER': 300,
+    'AUTOSTART': False,
+    # Concurrent refreshes are coalesced; set LOCK_CACHE_ALIAS to a shared
+    # cache to also allow only one refresh per window across processes.
+    'COALESCE_WINDOW': 10,
+    'LOCK_CACHE_ALIAS': None,
+    # Currency codes stored from the provider feed (None stores every code)
+    'CURRENCIES': ['USD', 'GBP', 'ZAR'],
+}
+
+# Exchange rate history retention, applied by `python manage.py prune_rate_history`.
+# GET /api/exchange-rates/history/ returns at most MAX_POINTS points per request.
+RATE_HISTORY = {
+    'RETENTION_DAYS': 365,
+    'DOWNSAMPLE_AFTER_DAYS': 7,
+    'BUCKET_MINUTES': 60,
+    'MAX_POINTS': 1000,
+}
+
+# Exchange rate provider (see api/providers.py). Use
+# 'api.providers.StaticRateProvider' with OPTIONS={'rates': {...}} to work offline.
+RATE_PROVIDER = {
+    'CLASS': 'api.providers.MockApiRateProvider',
+    'OPTIONS': {
+        'timeout': 10,
+        'retries': 3,
+        'backoff_factor': 0.5,
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+    },
+}
+
+# Conditional GET (ETag/Cache-Control) for the public rates and
+# ads lists (see api/http_cache.py). RESPONSE_CACHE also keeps serialized
+# bodies in CACHE_ALIAS, keyed by the data version.
+HTTP_CACHE = {
+    'MAX_AGE': 30,
+    'RESPONSE_CACHE': False,
+    'CACHE_ALIAS': 'default',
+}
+
+# Idempotency-Key support on POST /api/transactions/send/. Point CACHE_ALIAS at
+# a cache shared by every worker so concurrent retries queue on one lock;
+# expired keys are removed by `python manage.py prune_idempotency_keys`.
+IDEMPOTENCY = {
+    'TTL': 86400,
+    'CACHE_ALIAS': 'default',
+    'WAIT': 10,
+}
+
+# Signed quotes: calculate returns a quote_token that send honors for MAX_AGE seconds
+QUOTE_TOKEN = {
+    'MAX_AGE': 300,
+}
+
+# Transfers are saved as PENDING and settled by `python manage.py process_transfers`
+# (see api/settlement.py). Set ASYNC to False to settle inside the request, or
+# AUTOSTART to run a worker thread in a single web process.
+SETTLEMENT = {
+    'ASYNC': True,
+    'HANDLER': None,
+    'WORKERS': 4,
+    'AUTOSTART': False,
+}
+
+# GET /api/transactions/export/ and the admin export actions stream rows in
+# chunks of CHUNK_SIZE (a server-side cursor on PostgreSQL)
+EXPORT = {
+    'CHUNK_SIZE': 2000,
+}
+
+# Admin transaction search matches substrings of the transaction ID, username
+# and recipient name, which scans the table. INDEXED_ONLY limits it to lookups
+# the indexes answer: a full transaction ID, an exact username (any case) or
+# the start of a recipient name (any case).
+ADMIN_SEARCH = {
+    'INDEXED_ONLY': False,
+}
+
+# Authenticated requests resolve the token's user from CACHE_ALIAS for TTL
+# seconds. Saving a user clears its entry; with a per-process cache other
+# workers pick the change up when the TTL expires.
+AUTH_CACHE = {
+    'ENABLED': True,
+    'TTL': 60,
+    'CACHE_ALIAS': 'default',
+}
+
+# Token-bucket rate limits (see api/throttling.py): login and register per
+# client IP, calculate and send per user. Each rate is the bucket size and
+# the period it takes to refill. CACHE_ALIAS must point at a shared cache
+# (Redis/Memcached) for the limits to hold across worker processes. The
+# `default` LocMemCache above is per process and does not enforce limits
+# across workers: with N workers a client gets up to N times each rate.
+# Django's file and database caches are shared but their incr() is not
+# atomic, so concurrent workers can lose updates; don't use them here either.
+THROTTLE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'RATES': {
+        'login': '10/min',
+        'register': '5/min',
+        'calculate': '120/min',
+        'send': '30/min',
+        'ad-events': '120/min',
+    },
+}
+
+# Uploaded ad images are resized to each of WIDTHS (never upscaled) in every
+# FORMAT on a background thread after the ad is saved; the API returns them
+# as srcset strings. Set ASYNC to False to resize inside the request, and run
+# `python manage.py generate_ad_renditions` to backfill existing ads.
+AD_RENDITIONS = {
+    'WIDTHS': [320, 640, 960],
+    'FORMATS': ['WEBP', 'JPEG'],
+    'QUALITY': 80,
+    'ASYNC': True,
+}
+
+# Ad impressions and clicks are counted in memory and written to
+# AdvertisementStats every FLUSH_INTERVAL seconds (by a background thread)
+# or MAX_PENDING events, whichever comes first; a crashed process loses at
+# most that much.
+AD_STATS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 10,
+    'MAX_PENDING': 1000,
+}
+
+# Per-route latency, query counts and cache hit/miss counters, served in
+# Prometheus text format at /metrics. Each worker process keeps its own
+# numbers, so scrape every worker. Set SLOW_REQUEST_SECONDS to log slower
+# requests together with the SQL they ran.
+#
+# Scrapes are allowed from ALLOWED_IPS, or from anywhere with an
+# `Authorization: Bearer <TOKEN>` header. Behind a reverse proxy on the same
+# host every request arrives from 127.0.0.1: requests carrying X-Forwarded-For
+# or Forwarded are never allowed by address, so make sure the proxy sets one
+# of them, or set ALLOWED_IPS to [] and scrape with TOKEN.
+METRICS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_SECONDS': None,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'TOKEN': None,
+}
@@ -14,16 +14,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+
+from api import views as api_views
+from api.conf import app_settings
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', api_views.metrics, name='metrics'),
 ]
 
 # Serve media files during development
 if settings.DEBUG:
+    # Rendition names are content hashes, so they never change under a URL
+    urlpatterns += static(
+        settings.MEDIA_URL + app_settings('AD_RENDITIONS')['UPLOAD_TO'],
+        cache_control(public=True, max_age=31536000, immutable=True)(serve),
+        document_root=os.path.join(settings.MEDIA_ROOT, app_settings('AD_RENDITIONS')['UPLOAD_TO']),
+    )
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
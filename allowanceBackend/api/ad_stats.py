@@ -0,0 +1,133 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .conf import app_settings
+from .services import AdStatsService
+
+logger = logging.getLogger(__name__)
+
+
+class AdEventBuffer:
+    """
+    Per-process counters for advertisement impressions and clicks.
+
+    record() only bumps an in-memory counter, so showing an ad never writes
+    to the database. The counts are flushed to AdvertisementStats once
+    AD_STATS['MAX_PENDING'] events are waiting (by the request that finds
+    them due) and every AD_STATS['FLUSH_INTERVAL'] seconds by a background
+    thread, so they reach the admin even after traffic stops. A process
+    that dies loses at most one interval's or MAX_PENDING events, whichever
+    is fewer, and a failed flush keeps its counts for the next attempt.
+    Pending counts are also flushed when the process exits normally.
+    """
+
+    EVENTS = AdStatsService.FIELDS
+
+    def __init__(self):
+        self._counts = Counter()    # (advertisement_id, date, event) -> count
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def record(self, ad_ids, event):
+        """Count one `event` ('impressions' or 'clicks') for each ad id."""
+        if event not in self.EVENTS:
+            raise ValueError(f'Unknown advertisement event {event!r}')
+        options = app_settings('AD_STATS')
+        if not options['ENABLED'] or not ad_ids:
+            return
+        if options['BACKGROUND_FLUSH']:
+            self.start()
+        day = timezone.localdate()
+        with self._lock:
+            for ad_id in ad_ids:
+                self._counts[ad_id, day, event] += 1
+            self._pending += len(ad_ids)
+            due = (self._pending >= options['MAX_PENDING']
+                   or time.monotonic() - self._last_flush >= options['FLUSH_INTERVAL'])
+        if due:
+            # Whoever finds the counts due writes them; concurrent requests don't wait
+            self.flush(block=False)
+
+    def flush(self, block=True):
+        """Write pending counts to the database; returns the number of events written."""
+        if not self._flush_lock.acquire(blocking=block):
+            return 0
+        try:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                self._pending = 0
+                self._last_flush = time.monotonic()
+            if not counts:
+                return 0
+            try:
+                AdStatsService.add(counts)
+            except Exception:
+                logger.exception('Flushing %d advertisement events failed; keeping them for the next flush',
+                                 sum(counts.values()))
+                # Not counted as pending, so a database outage doesn't
+                # make every following request retry the flush
+                with self._lock:
+                    self._counts.update(counts)
+                return 0
+            return sum(counts.values())
+        finally:
+            self._flush_lock.release()
+
+    def run(self):
+        while not self._stop.wait(app_settings('AD_STATS')['FLUSH_INTERVAL']):
+            try:
+                self.flush(block=False)
+            except Exception:
+                logger.exception('Advertisement event flusher failed')
+            finally:
+                close_old_connections()
+
+    def start(self):
+        """Start the interval flusher, once per process; called by the first record()."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self.run, name='ad-stats-flusher', daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def discard(self):
+        with self._lock:
+            self._counts.clear()
+            self._pending = 0
+
+
+ad_events = AdEventBuffer()
+
+
+def _flush_at_exit():
+    try:
+        ad_events.flush()
+    except Exception:
+        logger.exception('Flushing advertisement events at exit failed')
+    finally:
+        close_old_connections()
+
+
+atexit.register(_flush_at_exit)
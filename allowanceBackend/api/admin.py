@@ -1,5 +1,16 @@
+import uuid
 from django.contrib import admin
-from .models import Transaction, ExchangeRate, Advertisement
+from django.contrib.auth.models import User
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+from datetime import timedelta
+from .conf import app_settings
+from .exports import export_response
+from .models import (
+    Transaction, TransactionSummary, ExchangeRate, ExchangeRateHistory, IdempotencyKey, Advertisement,
+    AdvertisementStats,
+)
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
@@ -7,6 +18,52 @@ class TransactionAdmin(admin.ModelAdmin):
     list_filter = ('target_currency', 'status', 'created_at')
     search_fields = ('transaction_id', 'user__username', 'recipient_name')
     readonly_fields = ('id', 'transaction_id', 'created_at', 'updated_at')
+    actions = ('export_csv', 'export_ndjson')
+    
+    @admin.action(description='Export selected transactions as CSV')
+    def export_csv(self, request, queryset):
+        return export_response(queryset, 'csv', 'transactions')
+    
+    @admin.action(description='Export selected transactions as NDJSON')
+    def export_ndjson(self, request, queryset):
+        return export_response(queryset, 'ndjson', 'transactions')
+    
+    @property
+    def search_help_text(self):
+        if app_settings('ADMIN_SEARCH')['INDEXED_ONLY']:
+            return 'Transaction ID, username, or the start of the recipient name (any case)'
+        return 'Part of the transaction ID, username or recipient name'
+    
+    def get_search_results(self, request, queryset, search_term):
+        # A full transaction ID is answered from its unique index. Anything else
+        # gets the admin's icontains search on every field, which can only be
+        # answered by a full table scan, unless ADMIN_SEARCH['INDEXED_ONLY']
+        # restricts it to indexable lookups. Names then match by case-insensitive
+        # prefix: a range over LOWER(), which the expression index answers (LIKE
+        # can't use it).
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        try:
+            return queryset.filter(transaction_id=uuid.UUID(search_term)), False
+        except ValueError:
+            pass
+        if not app_settings('ADMIN_SEARCH')['INDEXED_ONLY']:
+            return super().get_search_results(request, queryset, search_term)
+        prefix = search_term.lower()
+        return queryset.alias(recipient_lower=Lower('recipient_name')).filter(
+            Q(user__in=User.objects.filter(username__iexact=search_term).values('pk'))
+            | Q(recipient_lower__gte=prefix, recipient_lower__lt=prefix + '\U0010ffff')
+        ), False
+
+@admin.register(TransactionSummary)
+class TransactionSummaryAdmin(admin.ModelAdmin):
+    # Derived data: edit transactions, then run rebuild_transaction_summaries
+    list_display = ('user', 'month', 'target_currency', 'transfer_count', 'total_usd', 'total_fees', 'total_final')
+    list_filter = ('target_currency', 'month')
+    list_select_related = ('user',)
+    search_fields = ('=user__username',)
+    readonly_fields = ('id', 'user', 'month', 'target_currency', 'transfer_count', 'total_usd', 'total_fees', 'total_final')
 
 @admin.register(ExchangeRate)
 class ExchangeRateAdmin(admin.ModelAdmin):
@@ -14,9 +71,57 @@ class ExchangeRateAdmin(admin.ModelAdmin):
     list_filter = ('currency_code', 'last_updated')
     readonly_fields = ('id',)
 
+@admin.register(ExchangeRateHistory)
+class ExchangeRateHistoryAdmin(admin.ModelAdmin):
+    list_display = ('currency_code', 'rate_to_usd', 'effective_at')
+    list_filter = ('currency_code',)
+    date_hierarchy = 'effective_at'
+    readonly_fields = ('id', 'currency_code', 'rate_to_usd', 'effective_at')
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'response_status', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('=key',)
+    readonly_fields = ('id', 'user', 'key', 'request_fingerprint', 'response_status', 'response_body', 'created_at')
+
 @admin.register(Advertisement)
 class AdvertisementAdmin(admin.ModelAdmin):
-    list_display = ('title', 'is_active', 'order', 'created_at')
+    # Totals over the last AD_STATS['ADMIN_DAYS'] days. Impressions and clicks
+    # reach the stats table in batches (api/ad_stats.py), so they can trail
+    # live traffic by up to AD_STATS['FLUSH_INTERVAL'] seconds.
+    list_display = ('title', 'is_active', 'order', 'recent_impressions', 'recent_clicks', 'click_through_rate', 'created_at')
     list_filter = ('is_active', 'created_at')
     ordering = ('order',)
-    readonly_fields = ('id',)
+    readonly_fields = ('id', 'created_at', 'updated_at')
+    
+    def get_queryset(self, request):
+        since = timezone.localdate() - timedelta(days=app_settings('AD_STATS')['ADMIN_DAYS'])
+        recent = Q(stats__date__gt=since)
+        return super().get_queryset(request).annotate(
+            recent_impressions=Coalesce(Sum('stats__impressions', filter=recent), 0),
+            recent_clicks=Coalesce(Sum('stats__clicks', filter=recent), 0),
+        )
+    
+    @admin.display(description='Recent impressions', ordering='recent_impressions')
+    def recent_impressions(self, obj):
+        return obj.recent_impressions
+    
+    @admin.display(description='Recent clicks', ordering='recent_clicks')
+    def recent_clicks(self, obj):
+        return obj.recent_clicks
+    
+    @admin.display(description='CTR')
+    def click_through_rate(self, obj):
+        if not obj.recent_impressions:
+            return '-'
+        return f'{obj.recent_clicks / obj.recent_impressions:.1%}'
+
+@admin.register(AdvertisementStats)
+class AdvertisementStatsAdmin(admin.ModelAdmin):
+    # Written by the event buffer in api/ad_stats.py
+    list_display = ('advertisement', 'date', 'impressions', 'clicks')
+    list_filter = ('advertisement',)
+    list_select_related = ('advertisement',)
+    date_hierarchy = 'date'
+    readonly_fields = ('id', 'advertisement', 'date', 'impressions', 'clicks')
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .conf import app_settings
+        from .refresher import RateRefresher
+        from .settlement import SettlementWorker
+
+        if app_settings('RATE_REFRESH')['AUTOSTART']:
+            RateRefresher().start()
+        if app_settings('SETTLEMENT')['AUTOSTART']:
+            SettlementWorker().start()
@@ -0,0 +1,81 @@
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .authentication import CachedJWTAuthentication
+from .models import ExchangeRate
+from .renderers import JSONRenderer
+from .serializers import ExchangeRateSerializer, TransactionCalculationSerializer
+from .services import TransactionService
+from .throttling import CalculateThrottle
+
+# ASGI-native counterparts of the quote and rates endpoints. DRF views are
+# synchronous, so these are plain Django async views that render the same
+# JSON as their DRF equivalents. Serve them with an ASGI server (uvicorn,
+# daphne) to keep a worker responsive while a rate refresh is in flight.
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def unauthorized(detail, auth):
+    response = render(detail, status.HTTP_401_UNAUTHORIZED)
+    response['WWW-Authenticate'] = auth.authenticate_header(None)
+    return response
+
+
+async def authenticate(request):
+    """Resolve the JWT bearer user as the DRF views would, or return a 401 response."""
+    auth = CachedJWTAuthentication()
+    header = auth.get_header(request)
+    try:
+        raw_token = auth.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None, unauthorized({'detail': 'Authentication credentials were not provided.'}, auth)
+        user = await sync_to_async(auth.get_user)(auth.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed) as e:
+        return None, unauthorized(e.detail if isinstance(e.detail, dict) else {'detail': e.detail}, auth)
+    return user, None
+
+
+@csrf_exempt
+@require_POST
+async def calculate_transaction(request):
+    user, error = await authenticate(request)
+    if error is not None:
+        return error
+    request.user = user
+    throttle = CalculateThrottle()
+    if not throttle.allow_request(request, None):
+        exc = Throttled(throttle.wait())
+        response = render({'detail': exc.detail}, exc.status_code)
+        response['Retry-After'] = str(math.ceil(throttle.wait()))
+        return response
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return render({'detail': 'JSON parse error'}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = TransactionCalculationSerializer(data=data)
+    if serializer.is_valid():
+        result = await TransactionService.acalculate_transaction(
+            serializer.validated_data['amount_usd'],
+            serializer.validated_data['target_currency']
+        )
+        result.update(TransactionService.issue_quote(user, result))
+        return render(result)
+    return render(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+
+@require_GET
+async def exchange_rate_list(request):
+    rates = [rate async for rate in ExchangeRate.objects.filter(currency_code__in=['GBP', 'ZAR'])]
+    return render(ExchangeRateSerializer(rates, many=True).data)
@@ -0,0 +1,60 @@
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .conf import app_settings
+from .metrics import cache_requests
+
+
+def user_cache_key(user_id, options):
+    return f"{options['KEY_PREFIX']}:{user_id}"
+
+
+def invalidate_user(user):
+    """Drop a user's cached copy; called from the User save/delete signals."""
+    options = app_settings('AUTH_CACHE')
+    user_id = getattr(user, jwt_settings.USER_ID_FIELD)
+    caches[options['CACHE_ALIAS']].delete(user_cache_key(user_id, options))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the token's User in a Django cache for
+    AUTH_CACHE['TTL'] seconds instead of loading the row on every request.
+
+    Saving or deleting a User drops its entry (api/signals.py). Bulk
+    QuerySet.update() sends no signals, and a per-process cache is only
+    cleared in the process that saved, so those changes take effect once
+    the TTL runs out; point CACHE_ALIAS at a shared cache to make
+    invalidation immediate everywhere.
+    """
+
+    def get_user(self, validated_token):
+        options = app_settings('AUTH_CACHE')
+        if not options['ENABLED']:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        cache = caches[options['CACHE_ALIAS']]
+        key = user_cache_key(user_id, options)
+        user = cache.get(key)
+        if user is None:
+            cache_requests.inc(cache='auth-user', result='miss')
+            user = super().get_user(validated_token)
+            cache.set(key, user, options['TTL'])
+            return user
+        cache_requests.inc(cache='auth-user', result='hit')
+
+        # The same checks super() applies to a freshly loaded row
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
@@ -0,0 +1,445 @@
+import asyncio
+import json
+import random
+import string
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import ROUND_UP, Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.paginator import Paginator
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .ad_stats import ad_events
+from .conf import app_settings
+from .exports import csv_lines
+from .metrics import render_text
+from .models import Advertisement, AdvertisementStats, ExchangeRate, Transaction
+from .money import Money
+from .pagination import encode_cursor, paginate_keyset
+from .rate_cache import rate_cache
+from .renderers import JSONRenderer
+from .serializers import TransactionSerializer
+from .services import AdStatsService, ExchangeRateService, TransactionService
+from .throttling import take_token
+
+
+def seed_rates():
+    for currency_code, rate in (('USD', '1.0000'), ('GBP', '0.7400'), ('ZAR', '17.7500')):
+        ExchangeRate.objects.update_or_create(
+            currency_code=currency_code,
+            defaults={'rate_to_usd': Decimal(rate)}
+        )
+
+
+def timed(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return time.perf_counter() - start
+
+
+def bench_quotes(out, iterations=5000):
+    seed_rates()
+    amounts = [Decimal('10.00') + i for i in range(100)]
+
+    def quote(i):
+        TransactionService.calculate_transaction(amounts[i % 100], 'GBP' if i % 2 else 'ZAR')
+
+    with override_settings(RATE_CACHE={'ENABLED': False}):
+        uncached = timed(quote, iterations)
+    rate_cache.invalidate()
+    rate_cache.reset_stats()
+    cached = timed(quote, iterations)
+
+    out(f'quotes/sec without rate cache: {iterations / uncached:,.0f}')
+    out(f'quotes/sec with rate cache:    {iterations / cached:,.0f}')
+    out(f'rate cache stats: {rate_cache.stats()}')
+
+
+def bench_quote_grid(out, points=1000, rounds=50):
+    """A slider's worth of quotes: scalar quote() per amount vs the batch quote engine."""
+    seed_rates()
+    amounts = [Decimal('10.00') + i * 10 for i in range(points)]
+    rate = ExchangeRateService.get_rate('ZAR')
+
+    scalar = timed(lambda i: [TransactionService.quote(amount, 'ZAR', rate) for amount in amounts], rounds)
+    batch = timed(lambda i: TransactionService.quote_many(amounts, 'ZAR', rate), rounds)
+    grid = timed(lambda i: TransactionService.quote_grid('ZAR', amounts[0], amounts[-1], Decimal('10.00')), rounds)
+
+    out(f'{points} quotes via quote():       {scalar / rounds * 1000:6.2f} ms')
+    out(f'{points} quotes via quote_many():  {batch / rounds * 1000:6.2f} ms')
+    out(f'{points} quotes via quote_grid():  {grid / rounds * 1000:6.2f} ms')
+
+
+def decimal_quote(amount_usd, target_currency, rate):
+    # TransactionService.quote as it was before amounts became Money
+    fee_percentage = TransactionService.fee_rate(target_currency)
+    fee_amount = amount_usd * fee_percentage
+    amount_after_fee = amount_usd - fee_amount
+    return {
+        'amount_usd': amount_usd,
+        'target_currency': target_currency,
+        'exchange_rate': rate,
+        'fee_percentage': fee_percentage * 100,
+        'fee_amount': fee_amount.quantize(Decimal('0.01'), rounding=ROUND_UP),
+        'amount_after_fee': amount_after_fee.quantize(Decimal('0.01'), rounding=ROUND_UP),
+        'final_amount': (amount_after_fee * rate).quantize(Decimal('0.01'), rounding=ROUND_UP),
+    }
+
+
+def bench_money(out, iterations=20000, batch=1000):
+    """Per-quote CPU: Decimal arithmetic vs integer Money, for quoting and for JSON rendering."""
+    rate = Decimal('17.7500')
+    amounts = [Decimal(random.Random(i).randint(1000, 1000000)).scaleb(-2) for i in range(batch)]
+
+    # Serializers hand the service Money, so the Money path starts from Money
+    money_amounts = [Money.from_decimal(amount) for amount in amounts]
+    decimal_time = timed(lambda i: decimal_quote(amounts[i % batch], 'ZAR', rate), iterations)
+    money_time = timed(lambda i: TransactionService.quote(money_amounts[i % batch], 'ZAR', rate), iterations)
+
+    renderer = JSONRenderer()
+    decimal_quotes = [decimal_quote(amount, 'ZAR', rate) for amount in amounts]
+    money_quotes = [TransactionService.quote(amount, 'ZAR', rate) for amount in amounts]
+    assert renderer.render(decimal_quotes) == renderer.render(money_quotes)
+    decimal_render = timed(lambda i: renderer.render(decimal_quotes), 20)
+    money_render = timed(lambda i: renderer.render(money_quotes), 20)
+
+    out(f'quote with Decimal:  {decimal_time / iterations * 1e6:6.2f} us')
+    out(f'quote with Money:    {money_time / iterations * 1e6:6.2f} us')
+    out(f'JSON render Decimal: {decimal_render / 20 / batch * 1e6:6.2f} us per quote')
+    out(f'JSON render Money:   {money_render / 20 / batch * 1e6:6.2f} us per quote (identical bytes)')
+
+
+def synthetic_feed(size, seed=0):
+    rng = random.Random(seed)
+    codes = set()
+    while len(codes) < size:
+        codes.add(''.join(rng.choices(string.ascii_uppercase, k=3)))
+    return {code: Decimal(rng.randint(1000, 99999999)) / 10000 for code in sorted(codes)}
+
+
+def bench_rate_ingest(out, size=200, rounds=20):
+    rng = random.Random(1)
+    feeds = []
+    feed = synthetic_feed(size)
+    for _ in range(rounds):
+        # Roughly one rate in ten moves between polls
+        feed = {code: rate + Decimal('0.0001') if rng.random() < 0.1 else rate for code, rate in feed.items()}
+        feeds.append(feed)
+
+    def per_row_upsert(rates):
+        for currency_code, rate in rates.items():
+            ExchangeRate.objects.update_or_create(currency_code=currency_code, defaults={'rate_to_usd': rate})
+
+    for label, ingest in (('update_or_create loop', per_row_upsert), ('bulk upsert', ExchangeRateService.store_rates)):
+        ExchangeRate.objects.all().delete()
+        start = time.perf_counter()
+        ingest(feeds[0])
+        initial = time.perf_counter() - start
+        start = time.perf_counter()
+        for rates in feeds[1:]:
+            ingest(rates)
+        steady = (time.perf_counter() - start) / (rounds - 1)
+        out(f'{label:>22}: initial load {initial * 1000:8.1f} ms, steady-state poll {steady * 1000:8.1f} ms ({size} currencies)')
+
+
+def seed_transactions(user, rows, batch=10000):
+    """Insert `rows` transactions for `user` with raw executemany (bulk_create is too slow for millions)."""
+    table = Transaction._meta.db_table
+    columns = [
+        'id', 'transaction_id', 'user_id', 'amount_usd', 'target_currency', 'exchange_rate', 'fee_percentage',
+        'fee_amount', 'final_amount', 'recipient_name', 'status', 'attempts', 'created_at', 'updated_at',
+    ]
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))})'
+    start = timezone.now() - timedelta(seconds=rows)
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, batch):
+            values = []
+            for i in range(offset, min(offset + batch, rows)):
+                created_at = start + timedelta(seconds=i)
+                values.append((
+                    uuid.uuid4().hex, uuid.uuid4().hex, user.pk, '100.00', 'GBP', '0.7400', '10.00',
+                    '10.00', '66.60', f'Recipient {i}', 'COMPLETED', 1, created_at, created_at,
+                ))
+            cursor.executemany(sql, values)
+
+
+def bench_history_pagination(out, rows=1_000_000, samples=20):
+    user = User.objects.create_user('bench-history', password='x')
+    start = time.perf_counter()
+    seed_transactions(user, rows)
+    out(f'seeded {rows:,} transactions in {time.perf_counter() - start:.1f}s')
+    queryset = Transaction.objects.filter(user=user)
+    page_size = 10
+
+    pages = rows // page_size
+    for page in sorted({1, max(pages // 100, 1), max(pages // 10, 1), max(pages // 2, 1), pages}):
+
+        def offset_page(_):
+            paginator = Paginator(queryset, page_size)
+            page_obj = paginator.get_page(page)
+            list(page_obj)
+            paginator.num_pages
+
+        # Cursor pointing just before the same page, as a client walking forward would hold
+        anchor = queryset.order_by('-created_at', '-id')[(page - 1) * page_size - 1] if page > 1 else None
+        cursor = encode_cursor(anchor.created_at, anchor.id) if anchor else None
+
+        def keyset_page(_):
+            paginate_keyset(queryset, cursor, page_size)
+
+        offset_ms = timed(offset_page, samples) / samples * 1000
+        keyset_ms = timed(keyset_page, samples) / samples * 1000
+        out(f'page {page:>9,}: OFFSET + COUNT {offset_ms:8.2f} ms   keyset {keyset_ms:6.2f} ms')
+
+
+def bench_history_serialization(out, rounds=20):
+    """History pages through TransactionSerializer(instances) vs the .values() fast path, fetch + render."""
+    user = User.objects.create_user('bench-serialize', password='x')
+    seed_transactions(user, 1000)
+    queryset = Transaction.objects.filter(user=user)
+    renderer = JSONRenderer()
+
+    for page_size in (10, 100, 1000):
+
+        def model_page(_):
+            return renderer.render(TransactionSerializer(queryset[:page_size], many=True).data)
+
+        def values_page(_):
+            rows = TransactionSerializer.values_queryset(queryset)[:page_size]
+            return renderer.render(TransactionSerializer.values_data(rows))
+
+        assert model_page(0) == values_page(0)
+        samples = max(rounds * 100 // page_size, 5)
+        model = page_size * samples / timed(model_page, samples)
+        lean = page_size * samples / timed(values_page, samples)
+        out(f'page size {page_size:>4}: serializer {model:9,.0f} rows/s   values {lean:9,.0f} rows/s   ({lean / model:.1f}x)')
+
+
+def bench_export(out, rows=200_000):
+    """Peak Python memory of a streamed CSV export against serializing the same rows in one go."""
+    user = User.objects.create_user('bench-export', password='x')
+    seed_transactions(user, rows)
+    out(f'seeded {rows:,} transactions')
+    queryset = Transaction.objects.filter(user=user)
+
+    for size in (rows // 10, rows):
+        subset = queryset.filter(pk__in=queryset.order_by('created_at').values('pk')[:size])
+
+        def streamed():
+            return sum(len(line) for line in csv_lines(subset))
+
+        def materialized():
+            return len(TransactionSerializer(subset.order_by('created_at'), many=True).data)
+
+        for label, func in (('streamed csv', streamed), ('serializer', materialized)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            out(f'{size:>9,} rows {label:>12}: {elapsed:6.2f}s, peak {peak / 2**20:7.1f} MiB')
+
+
+def run_sends(users, requests_per_thread):
+    ok, failed = [0], [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(users))
+
+    def worker(user):
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        for i in range(requests_per_thread):
+            try:
+                response = client.post('/api/transactions/send/', {
+                    'amount_usd': '100.00', 'target_currency': 'GBP' if i % 2 else 'ZAR', 'recipient_name': 'Load Test',
+                })
+                succeeded = response.status_code == 201
+            except Exception:
+                succeeded = False
+            with lock:
+                (ok if succeeded else failed)[0] += 1
+        close_old_connections()
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return ok[0], failed[0], time.perf_counter() - start
+
+
+def bench_send_throughput(out, threads=8, requests=50):
+    """Concurrent POST /transactions/send/ against the active DATABASE_PROFILE."""
+    seed_rates()
+    users = [User.objects.create_user(f'bench-send-{i}') for i in range(threads)]
+    profiles = [('configured', None)]
+    if connection.vendor == 'sqlite':
+        if connection.is_in_memory_db():
+            out('note: SQLite test database is in memory; set SQLITE_TEST_PATH for representative numbers')
+        profiles = [
+            ('sqlite defaults', {'journal_mode': 'DELETE', 'synchronous': 'FULL'}),
+            ('sqlite tuned', None),
+        ]
+    for label, pragmas in profiles:
+        connection.close()
+        settings_override = override_settings(SQLITE_PRAGMAS=pragmas) if pragmas else override_settings()
+        with settings_override:
+            ok, failed, elapsed = run_sends(users, requests)
+        out(f'{label:>16}: {ok / elapsed:8.1f} sends/sec ({threads} threads, {ok} ok, {failed} failed)')
+
+
+def bench_auth(out, requests=500):
+    """Queries and latency per JWT-authenticated GET with and without the cached user lookup."""
+    user = User.objects.create_user('bench-auth', password='x')
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    url = '/api/transactions/summary/'
+
+    for label, enabled in (('JWTAuthentication', False), ('CachedJWTAuthentication', True)):
+        with override_settings(AUTH_CACHE={'ENABLED': enabled}):
+            client.get(url)  # warm the cache
+            with CaptureQueriesContext(connection) as queries:
+                elapsed = timed(lambda i: client.get(url), requests)
+        out(f'{label:>24}: {len(queries) / requests:.1f} queries/request, {elapsed / requests * 1000:.2f} ms/request')
+
+
+def bench_throttle(out, requests=1000):
+    """Cost of the token-bucket check: on its own, and on POST /transactions/calculate/."""
+    seed_rates()
+    bucket = caches[app_settings('THROTTLE')['CACHE_ALIAS']]
+    elapsed = timed(lambda i: take_token(bucket, f'bench-throttle:{i % 100}', 10**9, 60), requests * 10)
+    out(f'take_token(): {elapsed / (requests * 10) * 1e6:.1f} us/check')
+
+    user = User.objects.create_user('bench-throttle', password='x')
+    client = APIClient()
+    client.force_authenticate(user)
+    body = {'amount_usd': '100.00', 'target_currency': 'GBP', 'recipient_name': 'Bench'}
+    for label, enabled in (('throttle off', False), ('throttle on', True)):
+        with override_settings(THROTTLE={'ENABLED': enabled, 'RATES': {'calculate': f'{requests * 10}/min'}}):
+            elapsed = timed(lambda i: client.post('/api/transactions/calculate/', body, format='json'), requests)
+        out(f'{label:>13}: {elapsed / requests * 1000:.3f} ms/request')
+
+
+def bench_asgi_quotes(out, concurrency=50, requests=2000):
+    """POST calculate through the WSGI handler (thread pool) vs the ASGI handler (event loop)."""
+    seed_rates()
+    user = User.objects.create_user('bench-asgi')
+    headers = {'authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+    body = json.dumps({'amount_usd': '250.00', 'target_currency': 'GBP', 'recipient_name': 'Bench'})
+
+    def wsgi_quote(_):
+        response = Client().post('/api/transactions/calculate/', body, content_type='application/json', headers=headers)
+        connection.close()
+        return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        statuses = list(pool.map(wsgi_quote, range(requests)))
+    wsgi = time.perf_counter() - start
+
+    async def asgi_run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def quote():
+            async with semaphore:
+                response = await client.post(
+                    '/api/async/transactions/calculate/', body, content_type='application/json', headers=headers,
+                )
+                return response.status_code
+
+        return await asyncio.gather(*(quote() for _ in range(requests)))
+
+    start = time.perf_counter()
+    async_statuses = asyncio.run(asgi_run())
+    asgi = time.perf_counter() - start
+
+    out(f'WSGI /transactions/calculate/:       {requests / wsgi:8.1f} req/s (statuses {set(statuses)})')
+    out(f'ASGI /async/transactions/calculate/: {requests / asgi:8.1f} req/s (statuses {set(async_statuses)})')
+
+
+def bench_ad_events(out, threads=8, events=500):
+    """Concurrent impressions written one UPDATE per event vs buffered in memory and flushed in batches."""
+    ads = [Advertisement.objects.create(title=f'bench-ad-{i}', description='bench') for i in range(4)]
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        out('note: SQLite test database is in memory; set SQLITE_TEST_PATH for representative numbers')
+
+    def per_event(ad_id):
+        AdStatsService.add({(ad_id, timezone.localdate(), 'impressions'): 1})
+
+    def buffered(ad_id):
+        ad_events.record([ad_id], 'impressions')
+
+    for label, record in (('write per event', per_event), ('write-behind', buffered)):
+        AdvertisementStats.objects.all().delete()
+        ad_events.discard()
+        failed = [0]
+        barrier = threading.Barrier(threads)
+
+        def worker(n):
+            barrier.wait()
+            for i in range(events):
+                try:
+                    record(ads[(n + i) % len(ads)].pk)
+                except Exception:
+                    failed[0] += 1
+            connection.close()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        ad_events.flush()
+        stored = AdvertisementStats.objects.aggregate(total=Sum('impressions'))['total'] or 0
+        out(f'{label:>15}: {threads * events / elapsed:9.1f} events/sec, {stored} of {threads * events} stored, '
+            f'{failed[0]} failed')
+
+
+def bench_metrics(out, requests=2000):
+    """Per-request cost of MetricsMiddleware on GET /exchange-rates/, and of rendering /metrics."""
+    seed_rates()
+    client = Client()
+    for label, enabled in (('metrics off', False), ('metrics on', True)):
+        with override_settings(METRICS={'ENABLED': enabled}):
+            client.get('/api/exchange-rates/')
+            elapsed = timed(lambda i: client.get('/api/exchange-rates/'), requests)
+        out(f'{label:>12}: {elapsed / requests * 1000:.3f} ms/request')
+    elapsed = timed(lambda i: render_text(), 100)
+    out(f'render_text(): {elapsed / 100 * 1000:.2f} ms/scrape ({len(render_text().splitlines())} lines)')
+
+
+BENCHMARKS = {
+    'quotes': bench_quotes,
+    'quote-grid': bench_quote_grid,
+    'money': bench_money,
+    'rate-ingest': bench_rate_ingest,
+    'history-pagination': bench_history_pagination,
+    'history-serialization': bench_history_serialization,
+    'export': bench_export,
+    'send-throughput': bench_send_throughput,
+    'asgi-quotes': bench_asgi_quotes,
+    'auth': bench_auth,
+    'throttle': bench_throttle,
+    'ad-events': bench_ad_events,
+    'metrics': bench_metrics,
+}
@@ -0,0 +1,125 @@
+from django.conf import settings
+
+DEFAULTS = {
+    # Exchange rate cache used by every quote (api/rate_cache.py)
+    'RATE_CACHE': {
+        'ENABLED': True,
+        'TTL': 60,                  # seconds a snapshot is served as fresh
+        'STALE_TTL': 300,           # extra seconds a snapshot may be served while it is reloaded
+        'CACHE_ALIAS': None,        # Django cache alias to share snapshots between workers
+        'KEY_PREFIX': 'rates',
+        'BACKGROUND_REVALIDATE': True,
+    },
+    # Background exchange rate polling (api/refresher.py)
+    'RATE_REFRESH': {
+        'INTERVAL': 60,             # seconds between successful polls
+        'JITTER': 0.1,              # +/- fraction of the interval added to every delay
+        'MAX_BACKOFF': 600,         # upper bound for the delay after repeated failures
+        'STALE_AFTER': 300,         # rates older than this are flagged as stale
+        'AUTOSTART': False,         # start a refresher thread inside the web process
+        'COALESCE_WINDOW': 10,      # seconds after a refresh during which new refreshes are skipped
+        'LOCK_CACHE_ALIAS': None,   # Django cache alias used as a cross-process refresh lock
+        'CURRENCIES': ['USD', 'GBP', 'ZAR'],  # codes stored from the provider feed; None keeps all
+    },
+    # Retention for ExchangeRateHistory (`manage.py prune_rate_history`)
+    'RATE_HISTORY': {
+        'RETENTION_DAYS': 365,      # history older than this is deleted
+        'DOWNSAMPLE_AFTER_DAYS': 7,  # history older than this keeps one point per bucket
+        'BUCKET_MINUTES': 60,
+        'MAX_POINTS': 1000,         # points returned by one GET /exchange-rates/history/
+    },
+    # Conditional GET and response caching for public lists (api/http_cache.py)
+    'HTTP_CACHE': {
+        'MAX_AGE': 30,              # Cache-Control max-age for browsers and CDNs
+        'RESPONSE_CACHE': False,    # keep serialized list bodies in a Django cache
+        'CACHE_ALIAS': 'default',
+        'KEY_PREFIX': 'response',
+        'TIMEOUT': 300,             # seconds a cached body for one version is kept
+    },
+    # Signed quotes returned by calculate and honored by send (TransactionService.issue_quote)
+    'QUOTE_TOKEN': {
+        'MAX_AGE': 300,             # seconds a quoted price can still be sent
+    },
+    # Transfer settlement queue (SettlementService, api/settlement.py)
+    'SETTLEMENT': {
+        'ASYNC': True,              # queue sends as PENDING for workers; False settles inside the request
+        'HANDLER': None,            # dotted path to a callable(transaction) that performs the payout
+        'WORKERS': 4,               # settlement threads per worker process
+        'BATCH_SIZE': 50,           # transfers claimed per poll
+        'POLL_INTERVAL': 1,         # seconds to wait when the queue is empty
+        'LEASE': 300,               # seconds before a PROCESSING claim is considered abandoned
+        'MAX_ATTEMPTS': 5,          # failed attempts before a transfer is marked FAILED
+        'AUTOSTART': False,         # run a worker thread inside the web process
+    },
+    # Idempotency-Key handling for POST /transactions/send/ (IdempotencyService)
+    'IDEMPOTENCY': {
+        'TTL': 86400,               # seconds a key replays its first response
+        'CACHE_ALIAS': 'default',   # stored responses and the duplicate lock; share it between workers
+        'WAIT': 10,                 # seconds a duplicate waits for the first request before a 409
+        'KEY_PREFIX': 'idempotency',
+    },
+    # Streaming CSV/NDJSON exports of transactions (api/exports.py)
+    'EXPORT': {
+        'CHUNK_SIZE': 2000,         # rows fetched from the database per round trip
+    },
+    # Transaction search in the admin (TransactionAdmin.get_search_results)
+    'ADMIN_SEARCH': {
+        'INDEXED_ONLY': False,      # only exact id, exact username and recipient prefix; no substring scan
+    },
+    # User lookups behind JWT authentication (api/authentication.py)
+    'AUTH_CACHE': {
+        'ENABLED': True,
+        'TTL': 60,                  # seconds a user is served without re-reading the row
+        'CACHE_ALIAS': 'default',   # a shared cache makes invalidation reach every worker
+        'KEY_PREFIX': 'auth-user',
+    },
+    # Token-bucket rate limits per endpoint scope (api/throttling.py)
+    'THROTTLE': {
+        'ENABLED': True,
+        'CACHE_ALIAS': 'default',   # must be shared (Redis/Memcached) for limits to span workers
+        'KEY_PREFIX': 'throttle',
+        'RATES': {                  # bucket size / refill period; a missing scope is unthrottled
+            'login': '10/min',          # per IP
+            'register': '5/min',        # per IP
+            'calculate': '120/min',     # per user
+            'send': '30/min',           # per user, shared by send and send-batch
+            'ad-events': '120/min',     # per IP, impression and click beacons
+        },
+    },
+    # Resized advertisement images (api/renditions.py)
+    'AD_RENDITIONS': {
+        'WIDTHS': [320, 640, 960],  # never wider than the uploaded image
+        'FORMATS': ['WEBP', 'JPEG'],
+        'QUALITY': 80,
+        'PLACEHOLDER_WIDTH': 16,    # blurred inline preview shown while the image loads
+        'UPLOAD_TO': 'ads/renditions/',
+        'ASYNC': True,              # generate on a background thread after the ad is saved
+        'WORKERS': 2,
+    },
+    # Write-behind impression and click counters (api/ad_stats.py)
+    'AD_STATS': {
+        'ENABLED': True,
+        'FLUSH_INTERVAL': 10,       # seconds between batched writes; bounds what a crashed process loses
+        'MAX_PENDING': 1000,        # events buffered before a write, whatever the interval
+        'BACKGROUND_FLUSH': True,   # flush every interval from a thread, not only when events arrive
+        'ADMIN_DAYS': 30,           # window for the totals in the advertisement admin list
+    },
+    # Request instrumentation and the Prometheus endpoint (api/middleware.py, GET /metrics)
+    'METRICS': {
+        'ENABLED': True,            # record latency and query counts per route
+        'SLOW_REQUEST_SECONDS': None,  # log requests at least this slow, with their SQL; None disables
+        'SLOW_REQUEST_MAX_QUERIES': 50,  # statements kept per request for that log
+        'ALLOWED_IPS': ['127.0.0.1', '::1'],  # clients that may scrape /metrics unproxied; None allows any
+        'TOKEN': None,              # bearer token that may scrape /metrics from anywhere
+    },
+    # Where exchange rates come from (api/providers.py)
+    'RATE_PROVIDER': {
+        'CLASS': 'api.providers.MockApiRateProvider',
+        'OPTIONS': {},              # keyword arguments for the provider class
+    },
+}
+
+
+def app_settings(name):
+    """Return a settings dict merged over the app defaults."""
+    return {**DEFAULTS[name], **getattr(settings, name, {})}
@@ -0,0 +1,43 @@
+import inspect
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from api.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run the api benchmarks against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Benchmarks to run ({', '.join(BENCHMARKS)}); all by default")
+        parser.add_argument(
+            '--set', action='append', default=[], metavar='NAME=VALUE', dest='params',
+            help='Integer parameter passed to the benchmarks, e.g. --set rows=100000',
+        )
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+        params = {}
+        for param in options['params']:
+            name, _, value = param.partition('=')
+            try:
+                params[name] = int(value)
+            except ValueError:
+                raise CommandError(f'Invalid --set value: {param}')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'== {name} =='))
+                benchmark = BENCHMARKS[name]
+                accepted = inspect.signature(benchmark).parameters
+                benchmark(self.stdout.write, **{k: v for k, v in params.items() if k in accepted})
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Advertisement
+from api.renditions import generate
+
+
+class Command(BaseCommand):
+    help = 'Create missing or outdated resized images for advertisements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate even when the image is unchanged')
+
+    def handle(self, *args, **options):
+        updated = 0
+        for ad_id in Advertisement.objects.values_list('pk', flat=True):
+            if generate(ad_id, force=options['force']):
+                updated += 1
+        self.stdout.write(self.style.SUCCESS(f'Updated renditions for {updated} advertisements'))
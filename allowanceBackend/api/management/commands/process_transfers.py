@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.settlement import SettlementWorker
+
+
+class Command(BaseCommand):
+    help = 'Settle PENDING transfers from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Settle one batch and exit')
+        parser.add_argument('--workers', type=int, help='Settlement threads (SETTLEMENT["WORKERS"])')
+        parser.add_argument('--batch-size', type=int, help='Transfers claimed per poll (SETTLEMENT["BATCH_SIZE"])')
+        parser.add_argument('--poll-interval', type=float, help='Seconds to wait on an empty queue (SETTLEMENT["POLL_INTERVAL"])')
+
+    def handle(self, *args, **options):
+        worker = SettlementWorker(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+        )
+        if options['once']:
+            claimed = worker.run_once()
+            worker.stop()
+            self.stdout.write(self.style.SUCCESS(f'Processed {claimed} transfers'))
+            return
+
+        self.stdout.write(f'Settling transfers with {worker.workers} workers (Ctrl+C to stop)')
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.stop()
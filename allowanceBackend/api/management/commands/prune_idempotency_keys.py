@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.services import IdempotencyService
+
+
+class Command(BaseCommand):
+    help = 'Delete Idempotency-Key records older than IDEMPOTENCY["TTL"]'
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyService.prune()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.conf import app_settings
+from api.services import RateHistoryService
+
+
+class Command(BaseCommand):
+    help = 'Expire and downsample old exchange rate history'
+
+    def add_arguments(self, parser):
+        options = app_settings('RATE_HISTORY')
+        parser.add_argument('--retention-days', type=float, default=options['RETENTION_DAYS'])
+        parser.add_argument('--downsample-after-days', type=float, default=options['DOWNSAMPLE_AFTER_DAYS'])
+        parser.add_argument('--bucket-minutes', type=float, default=options['BUCKET_MINUTES'])
+
+    def handle(self, *args, **options):
+        expired, downsampled = RateHistoryService.prune(
+            retention=timedelta(days=options['retention_days']),
+            downsample_after=timedelta(days=options['downsample_after_days']),
+            bucket=timedelta(minutes=options['bucket_minutes']),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Deleted {expired} expired and {downsampled} downsampled history rows'))
@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services import TransactionSummaryService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user transaction summary table from the Transaction table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the summaries of this username')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+        rows = TransactionSummaryService.rebuild(user)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} transaction summary rows'))
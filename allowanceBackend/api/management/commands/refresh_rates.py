@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.refresher import RateRefresher
+
+
+class Command(BaseCommand):
+    help = 'Poll the exchange rate provider and store the latest rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Refresh a single time and exit')
+        parser.add_argument('--interval', type=float, help='Seconds between polls (RATE_REFRESH["INTERVAL"])')
+        parser.add_argument('--jitter', type=float, help='Fraction of the interval to randomise (RATE_REFRESH["JITTER"])')
+        parser.add_argument('--max-backoff', type=float, help='Longest delay after failures (RATE_REFRESH["MAX_BACKOFF"])')
+
+    def handle(self, *args, **options):
+        refresher = RateRefresher(
+            interval=options['interval'],
+            jitter=options['jitter'],
+            max_backoff=options['max_backoff'],
+        )
+        if options['once']:
+            if not refresher.refresh():
+                raise CommandError('Exchange rate refresh failed')
+            self.stdout.write(self.style.SUCCESS('Exchange rates refreshed'))
+            return
+
+        self.stdout.write(f'Refreshing exchange rates every {refresher.interval}s (Ctrl+C to stop)')
+        try:
+            refresher.run()
+        except KeyboardInterrupt:
+            pass
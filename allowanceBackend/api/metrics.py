@@ -0,0 +1,143 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+class Metric:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Yield (sample name, labels, value) for the Prometheus exposition."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels):
+        series = self._values.get(self._key(labels))
+        if series is None:
+            return {'buckets': {}, 'sum': 0.0, 'count': 0}
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {'buckets': buckets, 'sum': series['sum'], 'count': series['count']}
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(series['counts']), series['sum'], series['count'])
+                      for key, series in self._values.items()]
+        for key, counts, total, count in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', {**labels, 'le': format_value(bound)}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+def _register(cls, name, *args, **kwargs):
+    with _registry_lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = cls(name, *args, **kwargs)
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+# Hits and misses of the rate snapshot, JWT user and list response caches;
+# the hit ratio is a rate() over result="hit" divided by the total
+cache_requests = counter('cache_requests_total', 'Lookups in application caches', ('cache', 'result'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+TYPES = {Counter: 'counter', Histogram: 'histogram'}
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def escape(value, label=True):
+    value = value.replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if label else value
+
+
+def render_text(registry=None):
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    registry = REGISTRY if registry is None else registry
+    lines = []
+    for name, metric in sorted(registry.items()):
+        lines.append(f'# HELP {name} {escape(metric.documentation, label=False)}')
+        lines.append(f'# TYPE {name} {TYPES[type(metric)]}')
+        for sample, labels, value in metric.samples():
+            if labels:
+                pairs = ','.join(f'{label}="{escape(label_value)}"' for label, label_value in labels.items())
+                sample = f'{sample}{{{pairs}}}'
+            lines.append(f'{sample} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,139 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .conf import app_settings
+from .metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+request_latency = histogram(
+    'http_request_duration_seconds', 'Time to build a response, by route', ('route', 'method', 'status'),
+)
+request_queries = histogram(
+    'http_request_db_queries', 'Database queries per request, by route', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+request_query_seconds = histogram(
+    'http_request_db_seconds', 'Time spent in database queries per request, by route', ('route',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+class QueryStats:
+    def __init__(self, max_statements=0):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_statements = max_statements
+        self.statements = []    # (seconds, sql), only kept for the slow-request log
+
+
+# Set by MetricsMiddleware for the duration of a request. A ContextVar rather
+# than a thread-local so queries run through sync_to_async by the async views
+# are still counted against their request.
+current_queries = ContextVar('current_queries', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper installed on every connection (api/signals.py)."""
+    stats = current_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats.count += 1
+        stats.seconds += duration
+        if len(stats.statements) < stats.max_statements:
+            stats.statements.append((duration, sql))
+
+
+# Any other method is labelled 'other': the method comes from the client, and
+# each distinct value would otherwise start a new series
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'))
+
+
+def method_of(request):
+    return request.method if request.method in METHODS else 'other'
+
+
+def route_of(request):
+    # Named routes keep the label set bounded; ids in the path never become labels
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """
+    Records latency, query count and query time per route for METRICS.
+
+    Streaming responses are measured up to the point the response is
+    returned, not while the body is sent. With METRICS['SLOW_REQUEST_SECONDS']
+    set, slower requests are logged as warnings with the SQL they ran
+    (statements only, never parameters).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        options = app_settings('METRICS')
+        if not options['ENABLED']:
+            return self.get_response(request)
+        stats, token = self.start(options)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats, options)
+        return response
+
+    async def __acall__(self, request):
+        options = app_settings('METRICS')
+        if not options['ENABLED']:
+            return await self.get_response(request)
+        stats, token = self.start(options)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats, options)
+        return response
+
+    def start(self, options):
+        slow_log = options['SLOW_REQUEST_SECONDS'] is not None
+        stats = QueryStats(options['SLOW_REQUEST_MAX_QUERIES'] if slow_log else 0)
+        return stats, current_queries.set(stats)
+
+    def record(self, request, response, duration, stats, options):
+        route = route_of(request)
+        request_latency.observe(duration, route=route, method=method_of(request), status=response.status_code)
+        request_queries.observe(stats.count, route=route)
+        request_query_seconds.observe(stats.seconds, route=route)
+
+        threshold = options['SLOW_REQUEST_SECONDS']
+        if threshold is not None and duration >= threshold:
+            statements = ''.join(
+                f'\n  {seconds * 1000:8.2f} ms  {sql}'
+                for seconds, sql in sorted(stats.statements, key=lambda statement: -statement[0])
+            )
+            logger.warning(
+                'Slow request %s %s (%s): %d in %.3fs, %d queries in %.3fs%s',
+                request.method, request.path, route, response.status_code, duration,
+                stats.count, stats.seconds, statements,
+            )
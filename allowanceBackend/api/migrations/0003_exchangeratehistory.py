@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:02
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+def seed_history(apps, schema_editor):
+    ExchangeRate = apps.get_model('api', 'ExchangeRate')
+    ExchangeRateHistory = apps.get_model('api', 'ExchangeRateHistory')
+    ExchangeRateHistory.objects.bulk_create(
+        ExchangeRateHistory(currency_code=rate.currency_code, rate_to_usd=rate.rate_to_usd, effective_at=rate.last_updated)
+        for rate in ExchangeRate.objects.all()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_remove_advertisement_image_url_advertisement_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRateHistory',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('currency_code', models.CharField(max_length=3)),
+                ('rate_to_usd', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('effective_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'exchange rate history',
+                'ordering': ['-effective_at'],
+                'indexes': [models.Index(fields=['currency_code', 'effective_at'], name='rate_history_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(seed_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_transaction_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:17
+
+import api.money
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_advertisement_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount_usd',
+            field=api.money.MoneyField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='fee_amount',
+            field=api.money.MoneyField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='final_amount',
+            field=api.money.MoneyField(decimal_places=2, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:28
+
+import api.money
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_transaction_settlement_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionSummary',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target_currency', models.CharField(choices=[('GBP', 'British Pound'), ('ZAR', 'South African Rand')], max_length=3)),
+                ('month', models.DateField()),
+                ('transfer_count', models.PositiveIntegerField()),
+                ('total_usd', api.money.MoneyField(decimal_places=2, max_digits=14)),
+                ('total_fees', api.money.MoneyField(decimal_places=2, max_digits=14)),
+                ('total_final', api.money.MoneyField(decimal_places=2, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'transaction summaries',
+                'ordering': ['-month', 'target_currency'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'month', 'target_currency'), name='transaction_summary_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_transactionsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:42
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_advertisement_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvertisementStats',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('impressions', models.PositiveBigIntegerField(default=0)),
+                ('clicks', models.PositiveBigIntegerField(default=0)),
+                ('advertisement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='api.advertisement')),
+            ],
+            options={
+                'verbose_name_plural': 'advertisement stats',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('advertisement', 'date'), name='advertisement_stats_unique')],
+            },
+        ),
+    ]
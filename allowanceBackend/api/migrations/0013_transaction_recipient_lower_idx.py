@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:54
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_advertisement_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transaction_recipient_idx',
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(django.db.models.functions.text.Lower('recipient_name'), name='transaction_recipient_idx'),
+        ),
+    ]
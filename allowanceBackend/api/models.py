@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from django.utils import timezone
 from decimal import Decimal
 import uuid
+from .money import MoneyField
 
 class ExchangeRate(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -12,6 +15,23 @@ class ExchangeRate(models.Model):
     def __str__(self):
         return f"{self.currency_code}: {self.rate_to_usd}"
 
+class ExchangeRateHistory(models.Model):
+    # Append-only: a row is written whenever a currency's rate changes
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    currency_code = models.CharField(max_length=3)
+    rate_to_usd = models.DecimalField(max_digits=10, decimal_places=4)
+    effective_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-effective_at']
+        indexes = [
+            models.Index(fields=['currency_code', 'effective_at'], name='rate_history_lookup_idx'),
+        ]
+        verbose_name_plural = 'exchange rate history'
+    
+    def __str__(self):
+        return f"{self.currency_code}: {self.rate_to_usd} @ {self.effective_at:%Y-%m-%d %H:%M}"
+
 class Transaction(models.Model):
     CURRENCY_CHOICES = [
         ('GBP', 'British Pound'),
@@ -20,6 +40,7 @@ class Transaction(models.Model):
     
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
         ('COMPLETED', 'Completed'),
         ('FAILED', 'Failed'),
     ]
@@ -27,35 +48,116 @@ class Transaction(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     transaction_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    amount_usd = models.DecimalField(max_digits=10, decimal_places=2)
+    amount_usd = MoneyField(max_digits=10)
     target_currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
     exchange_rate = models.DecimalField(max_digits=10, decimal_places=4)
     fee_percentage = models.DecimalField(max_digits=5, decimal_places=2)
-    fee_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    final_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    fee_amount = MoneyField(max_digits=10)
+    final_amount = MoneyField(max_digits=10)
     recipient_name = models.CharField(max_length=100)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    # Settlement queue bookkeeping (see api/settlement.py)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)  # identifies the current claim
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Backs per-user history, including keyset pagination on (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='transaction_user_created_idx'),
+            # Admin list filters, each paired with the admin's (-created_at, -pk) ordering
+            models.Index(fields=['status', '-created_at', '-id'], name='transaction_status_created_idx'),
+            models.Index(fields=['target_currency', '-created_at', '-id'], name='transaction_currency_idx'),
+            models.Index(fields=['-created_at', '-id'], name='transaction_created_idx'),
+            # Admin search by recipient name prefix, ignoring case
+            models.Index(Lower('recipient_name'), name='transaction_recipient_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - ${self.amount_usd} to {self.target_currency}"
 
+class TransactionSummary(models.Model):
+    # Per-user totals by currency and month, kept up to date by
+    # TransactionSummaryService as transfers are created
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    target_currency = models.CharField(max_length=3, choices=Transaction.CURRENCY_CHOICES)
+    month = models.DateField()  # first day of the month
+    transfer_count = models.PositiveIntegerField()
+    total_usd = MoneyField(max_digits=14)
+    total_fees = MoneyField(max_digits=14)
+    total_final = MoneyField(max_digits=14)
+    
+    class Meta:
+        ordering = ['-month', 'target_currency']
+        constraints = [
+            # Also serves the per-user lookups behind /transactions/summary/
+            models.UniqueConstraint(fields=['user', 'month', 'target_currency'], name='transaction_summary_unique'),
+        ]
+        verbose_name_plural = 'transaction summaries'
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.month:%Y-%m} {self.target_currency}: {self.transfer_count}"
+
+class IdempotencyKey(models.Model):
+    # Stored response for an Idempotency-Key sent to POST /transactions/send/.
+    # The unique constraint picks one winner among concurrent duplicates.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    request_fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username}: {self.key}"
+
 class Advertisement(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=200)
     description = models.TextField()
     image = models.ImageField(upload_to='ads/', blank=True, null=True)
+    # Resized copies of image, filled in by api/renditions.py
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     link_url = models.URLField(blank=True)
     is_active = models.BooleanField(default=True)
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['order']
     
     def __str__(self):
         return self.title
+
+class AdvertisementStats(models.Model):
+    # Impressions and clicks per ad and day, written in batches by
+    # api/ad_stats.py rather than on every request
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    advertisement = models.ForeignKey(Advertisement, on_delete=models.CASCADE, related_name='stats')
+    date = models.DateField()
+    impressions = models.PositiveBigIntegerField(default=0)
+    clicks = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['advertisement', 'date'], name='advertisement_stats_unique'),
+        ]
+        verbose_name_plural = 'advertisement stats'
+    
+    def __str__(self):
+        return f"{self.advertisement.title} {self.date}: {self.impressions} impressions, {self.clicks} clicks"
@@ -0,0 +1,120 @@
+from decimal import Decimal
+from functools import total_ordering
+
+from django.core import exceptions
+from django.db import models
+
+CENT = Decimal('0.01')
+
+
+@total_ordering
+class Money:
+    """
+    A USD or payout amount held as integer cents.
+
+    Arithmetic, comparison and formatting stay on ints, so amounts only
+    become Decimals at the database boundary (MoneyField) and never need
+    quantizing. Compares and hashes equal to the Decimal of the same value.
+    """
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents):
+        self.cents = cents
+
+    @classmethod
+    def from_decimal(cls, value):
+        cents = value.scaleb(2)
+        if cents != cents.to_integral_value():
+            raise ValueError(f'{value} has more than two decimal places')
+        return cls(int(cents))
+
+    @classmethod
+    def coerce(cls, value):
+        if type(value) is cls:
+            return value
+        return cls.from_decimal(value if isinstance(value, Decimal) else Decimal(str(value)))
+
+    def to_decimal(self):
+        # Exact: keeps the 0.01 exponent, so 1200 cents becomes Decimal('12.00')
+        return Decimal(self.cents) * CENT
+
+    def __str__(self):
+        units, cents = divmod(abs(self.cents), 100)
+        return f"{'-' if self.cents < 0 else ''}{units}.{cents:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __hash__(self):
+        return hash(self.to_decimal())
+
+    def _other_cents(self, other):
+        if isinstance(other, Money):
+            return other.cents
+        if isinstance(other, (Decimal, int)):
+            return other * 100
+        return None
+
+    def __eq__(self, other):
+        other_cents = self._other_cents(other)
+        return NotImplemented if other_cents is None else self.cents == other_cents
+
+    def __lt__(self, other):
+        other_cents = self._other_cents(other)
+        return NotImplemented if other_cents is None else self.cents < other_cents
+
+    def __add__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.cents + other.cents)
+
+    def __sub__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.cents - other.cents)
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+
+class MoneyField(models.DecimalField):
+    """DecimalField(decimal_places=2) that loads as Money and accepts Money or Decimal."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['decimal_places'] = 2
+        super().__init__(*args, **kwargs)
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else Money.from_decimal(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Money):
+            return value
+        try:
+            return Money.from_decimal(super().to_python(value))
+        except ValueError:
+            raise exceptions.ValidationError(
+                self.error_messages['invalid'], code='invalid', params={'value': value},
+            )
+
+    def get_prep_value(self, value):
+        # DecimalField.get_prep_value goes through to_python, which yields Money
+        value = super().get_prep_value(value)
+        return value.to_decimal() if isinstance(value, Money) else value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if hasattr(value, 'as_sql') or value is None:
+            return value
+        return connection.ops.adapt_decimalfield_value(value, self.max_digits, self.decimal_places)
+
+    def run_validators(self, value):
+        super().run_validators(value.to_decimal() if isinstance(value, Money) else value)
@@ -0,0 +1,60 @@
+import base64
+import binascii
+import json
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    payload = json.dumps({'c': created_at.isoformat(), 'i': pk.hex}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(payload['c'])
+        pk = uuid.UUID(hex=payload['i'])
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+        raise InvalidCursor('Invalid cursor')
+    if created_at is None:
+        raise InvalidCursor('Invalid cursor')
+    return created_at, pk
+
+
+def seek(queryset, cursor=None):
+    """Order newest first and skip everything up to and including the row `cursor` points at."""
+    queryset = queryset.order_by('-created_at', '-id')
+    if not cursor:
+        return queryset
+    created_at, pk = decode_cursor(cursor)
+    # The redundant created_at__lte bound lets the database seek the index
+    # instead of evaluating the OR over every row
+    return queryset.filter(created_at__lte=created_at).filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    )
+
+
+def paginate_keyset(queryset, cursor=None, page_size=10):
+    """
+    Return (rows, next_cursor) for the page after `cursor`, newest first.
+
+    Seeks on (created_at, id) instead of using OFFSET, so every page costs
+    the same however deep it is, and fetches one extra row to tell whether
+    there is a next page instead of running COUNT(*).
+    """
+    rows = list(seek(queryset, cursor)[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):  # a .values() queryset
+        return rows, encode_cursor(last['created_at'], last['id'])
+    return rows, encode_cursor(last.created_at, last.id)
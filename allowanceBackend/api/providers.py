@@ -0,0 +1,173 @@
+import threading
+import time
+from decimal import Decimal
+
+import requests
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .conf import app_settings
+from .metrics import counter, histogram
+
+provider_latency = histogram(
+    'rate_provider_request_seconds', 'Latency of exchange rate provider fetches', ('provider', 'outcome'),
+)
+provider_errors = counter(
+    'rate_provider_errors_total', 'Failed exchange rate provider fetches', ('provider', 'reason'),
+)
+
+
+class RateProviderError(Exception):
+    pass
+
+
+class CircuitOpenError(RateProviderError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing provider for reset_timeout seconds after
+    failure_threshold consecutive failures, then lets one trial call through.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def call(self, func):
+        with self._lock:
+            state = self.state
+            if state == self.OPEN:
+                raise CircuitOpenError('Circuit open; skipping exchange rate provider call')
+            if state == self.HALF_OPEN:
+                # Only one trial call; everyone else keeps failing fast
+                self.opened_at = time.monotonic()
+        try:
+            result = func()
+        except Exception:
+            with self._lock:
+                self.failures += 1
+                if state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                    self.opened_at = time.monotonic()
+            raise
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+        return result
+
+
+class RateProvider:
+    """
+    Source of exchange rates. Subclasses implement _fetch(), returning a
+    {currency_code: Decimal} mapping or raising RateProviderError.
+    """
+
+    name = 'base'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def _fetch(self):
+        raise NotImplementedError
+
+    def fetch_rates(self):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            rates = self.breaker.call(self._fetch)
+            outcome = 'success'
+            return rates
+        except CircuitOpenError:
+            outcome = 'short-circuit'
+            provider_errors.inc(provider=self.name, reason='circuit-open')
+            raise
+        except RateProviderError:
+            provider_errors.inc(provider=self.name, reason='provider')
+            raise
+        except Exception as e:
+            provider_errors.inc(provider=self.name, reason=type(e).__name__)
+            raise RateProviderError(str(e)) from e
+        finally:
+            provider_latency.observe(time.perf_counter() - start, provider=self.name, outcome=outcome)
+
+
+class MockApiRateProvider(RateProvider):
+    name = 'mockapi'
+    DEFAULT_URL = "https://68976304250b078c2041c7fc.mockapi.io/api/wiremit/InterviewAPIS"
+
+    def __init__(self, url=DEFAULT_URL, timeout=10, retries=3, backoff_factor=0.5, pool_maxsize=10, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET',),
+        )
+        # One keep-alive session for the life of the provider
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize))
+        self.session.mount('http://', HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize))
+
+    def _fetch(self):
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+
+        # Parse the non-flat structure
+        rates = {}
+        for item in data:
+            for currency, rate in item.items():
+                rates[currency] = Decimal(str(rate))
+        return rates
+
+
+class StaticRateProvider(RateProvider):
+    """Serves fixed rates; used in tests and for offline development."""
+
+    name = 'static'
+
+    def __init__(self, rates=None, **kwargs):
+        super().__init__(**kwargs)
+        self.rates = {code: Decimal(str(rate)) for code, rate in (rates or {}).items()}
+
+    def _fetch(self):
+        return dict(self.rates)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            options = app_settings('RATE_PROVIDER')
+            _provider = import_string(options['CLASS'])(**options['OPTIONS'])
+        return _provider
+
+
+@receiver(setting_changed)
+def reset_provider(setting, **kwargs):
+    global _provider
+    if setting == 'RATE_PROVIDER':
+        _provider = None
@@ -0,0 +1,50 @@
+from functools import lru_cache
+
+
+class QuoteFactors:
+    """
+    Exact integer form of a quote for one (fee, rate) pair.
+
+    Every quoted figure is `amount_cents * numerator / denominator` rounded
+    away from zero to whole cents, which is what Decimal.quantize(ROUND_UP)
+    does to the exact product. Working in integers skips building and
+    quantizing four Decimals per amount.
+    """
+
+    def __init__(self, fee_rate, rate):
+        self.fee_rate = fee_rate
+        self.fee_percentage = fee_rate * 100
+        self.rate = rate
+        fee_num, fee_den = fee_rate.as_integer_ratio()
+        rate_num, rate_den = rate.as_integer_ratio()
+        self.fee = (fee_num, fee_den)
+        self.after_fee = (fee_den - fee_num, fee_den)
+        self.final = ((fee_den - fee_num) * rate_num, fee_den * rate_den)
+
+    def quote_one(self, cents):
+        """Return (fee, after_fee, final) cents for one USD amount in cents."""
+        if cents < 0:
+            return tuple(round_up(cents * n, d) for n, d in (self.fee, self.after_fee, self.final))
+        # Ceiling division, inlined for the common non-negative case
+        (fee_n, fee_d), (after_n, after_d), (final_n, final_d) = self.fee, self.after_fee, self.final
+        return -(-cents * fee_n // fee_d), -(-cents * after_n // after_d), -(-cents * final_n // final_d)
+
+    def quote_cents(self, amounts_cents):
+        """Return (fee, after_fee, final) lists of cents for a list of USD amounts in cents."""
+        return tuple(
+            [round_up(cents * numerator, denominator) for cents in amounts_cents]
+            for numerator, denominator in (self.fee, self.after_fee, self.final)
+        )
+
+
+@lru_cache(maxsize=64)
+def quote_factors(fee_rate, rate):
+    """Factors for a fee and rate, built once per distinct rate rather than per quote."""
+    return QuoteFactors(fee_rate, rate)
+
+
+def round_up(numerator, denominator):
+    """numerator / denominator rounded away from zero (denominator > 0)."""
+    quotient = -(-abs(numerator) // denominator)
+    return quotient if numerator >= 0 else -quotient
+
@@ -0,0 +1,153 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from .conf import app_settings
+from .metrics import cache_requests
+from .models import ExchangeRate
+
+
+class RateCache:
+    """
+    Versioned in-memory snapshot of the ExchangeRate table.
+
+    Every quote reads from the snapshot instead of querying ExchangeRate.
+    Writers call invalidate(), which bumps the version so snapshots loaded
+    before the write are never served again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+        self._revalidating = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @property
+    def options(self):
+        return app_settings('RATE_CACHE')
+
+    def _shared_cache(self, options):
+        if options['CACHE_ALIAS']:
+            return caches[options['CACHE_ALIAS']]
+        return None
+
+    def _keys(self, options):
+        prefix = options['KEY_PREFIX']
+        return f'{prefix}:version', f'{prefix}:snapshot'
+
+    def _current(self, options):
+        shared = self._shared_cache(options)
+        if shared is None:
+            return self._version, self._snapshot
+        version_key, snapshot_key = self._keys(options)
+        values = shared.get_many([version_key, snapshot_key])
+        return values.get(version_key, 0), values.get(snapshot_key)
+
+    def _store(self, options, snapshot):
+        shared = self._shared_cache(options)
+        if shared is None:
+            with self._lock:
+                if snapshot['version'] == self._version:
+                    self._snapshot = snapshot
+            return
+        _, snapshot_key = self._keys(options)
+        shared.set(snapshot_key, snapshot, options['TTL'] + options['STALE_TTL'])
+
+    def reload(self):
+        options = self.options
+        version, _ = self._current(options)
+        rates = dict(ExchangeRate.objects.values_list('currency_code', 'rate_to_usd'))
+        snapshot = {'version': version, 'rates': rates, 'loaded_at': time.time()}
+        self._store(options, snapshot)
+        return snapshot
+
+    def _revalidate_in_background(self):
+        with self._lock:
+            if self._revalidating:
+                return
+            self._revalidating = True
+
+        def run():
+            try:
+                self.reload()
+            finally:
+                self._revalidating = False
+                close_old_connections()
+
+        threading.Thread(target=run, name='rate-cache-revalidate', daemon=True).start()
+
+    def get_snapshot(self):
+        options = self.options
+        version, snapshot = self._current(options)
+        if snapshot is not None and snapshot['version'] == version:
+            age = time.time() - snapshot['loaded_at']
+            if age < options['TTL']:
+                self.hits += 1
+                cache_requests.inc(cache='rates', result='hit')
+                return snapshot
+            if age < options['TTL'] + options['STALE_TTL']:
+                self.stale_hits += 1
+                cache_requests.inc(cache='rates', result='stale')
+                if options['BACKGROUND_REVALIDATE']:
+                    self._revalidate_in_background()
+                else:
+                    self.reload()
+                return snapshot
+        self.misses += 1
+        cache_requests.inc(cache='rates', result='miss')
+        return self.reload()
+
+    def get_rate(self, currency_code):
+        if not self.options['ENABLED']:
+            rate = ExchangeRate.objects.filter(currency_code=currency_code).first()
+            return rate.rate_to_usd if rate else None
+        return self.get_snapshot()['rates'].get(currency_code)
+
+    async def aget_rate(self, currency_code):
+        options = self.options
+        snapshot = self._snapshot
+        # A fresh in-process snapshot needs no I/O, so skip the thread hop
+        if (
+            options['ENABLED'] and not options['CACHE_ALIAS'] and snapshot is not None
+            and snapshot['version'] == self._version and time.time() - snapshot['loaded_at'] < options['TTL']
+        ):
+            self.hits += 1
+            cache_requests.inc(cache='rates', result='hit')
+            return snapshot['rates'].get(currency_code)
+        return await sync_to_async(self.get_rate)(currency_code)
+
+    def invalidate(self):
+        options = self.options
+        shared = self._shared_cache(options)
+        with self._lock:
+            self._version += 1
+            self._snapshot = None
+        if shared is not None:
+            version_key, snapshot_key = self._keys(options)
+            shared.add(version_key, 0, None)
+            try:
+                shared.incr(version_key)
+            except ValueError:
+                shared.set(version_key, 1, None)
+            shared.delete(snapshot_key)
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = self.stale_hits = self.misses = 0
+
+
+rate_cache = RateCache()
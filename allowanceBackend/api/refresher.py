@@ -0,0 +1,55 @@
+import logging
+import random
+import threading
+
+from django.db import close_old_connections
+
+from .conf import app_settings
+from .services import ExchangeRateService
+
+logger = logging.getLogger(__name__)
+
+
+class RateRefresher:
+    """Polls the rates provider on an interval, backing off exponentially on failure."""
+
+    def __init__(self, interval=None, jitter=None, max_backoff=None):
+        options = app_settings('RATE_REFRESH')
+        self.interval = options['INTERVAL'] if interval is None else interval
+        self.jitter = options['JITTER'] if jitter is None else jitter
+        self.max_backoff = options['MAX_BACKOFF'] if max_backoff is None else max_backoff
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        try:
+            succeeded = ExchangeRateService.update_rates()
+        except Exception:
+            logger.exception('Exchange rate refresh failed')
+            succeeded = False
+        finally:
+            close_old_connections()
+        self.failures = 0 if succeeded else self.failures + 1
+        return succeeded
+
+    def next_delay(self):
+        delay = min(self.interval * 2 ** self.failures, self.max_backoff)
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.next_delay())
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='rate-refresher', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
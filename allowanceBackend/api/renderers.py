@@ -0,0 +1,16 @@
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+from .money import Money
+
+
+class MoneyJSONEncoder(JSONEncoder):
+    def default(self, obj):
+        # Same float DRF produces for the equivalent Decimal
+        if isinstance(obj, Money):
+            return obj.cents / 100
+        return super().default(obj)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    encoder_class = MoneyJSONEncoder
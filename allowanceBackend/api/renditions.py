@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+from .conf import app_settings
+from .models import Advertisement
+
+logger = logging.getLogger(__name__)
+
+# Pillow format name -> (file extension, MIME type)
+FORMATS = {
+    'WEBP': ('webp', 'image/webp'),
+    'JPEG': ('jpg', 'image/jpeg'),
+}
+
+
+def file_digest(field_file):
+    digest = hashlib.sha256()
+    with field_file.open('rb') as f:
+        for chunk in f.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def store(content, width, extension, options):
+    """Save under a name derived from the bytes, so the URL can be cached forever."""
+    name = f"{options['UPLOAD_TO']}{hashlib.sha256(content).hexdigest()[:20]}-{width}w.{extension}"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def render(field_file, options):
+    """Build every rendition of an image and return its Advertisement.renditions record."""
+    with field_file.open('rb') as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode != 'RGB':
+        # JPEG has no alpha; flatten onto white so both formats look the same
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+
+    files = []
+    # Never upscale: widths past the original collapse onto the original width
+    for width in sorted({min(width, image.width) for width in options['WIDTHS']}):
+        resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for image_format in options['FORMATS']:
+            extension, content_type = FORMATS[image_format]
+            content = encode(resized, image_format, options['QUALITY'])
+            files.append({'name': store(content, width, extension, options), 'width': width, 'type': content_type})
+
+    width = options['PLACEHOLDER_WIDTH']
+    tiny = image.resize((width, max(1, round(image.height * width / image.width))), Image.BILINEAR)
+    placeholder = encode(tiny.filter(ImageFilter.GaussianBlur(1)), 'JPEG', 40)
+    return {
+        'width': image.width,
+        'height': image.height,
+        'files': files,
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(placeholder).decode(),
+    }
+
+
+def generate(ad_id, force=False):
+    """
+    Bring an ad's renditions in line with its image; returns True if they changed.
+
+    The record remembers the SHA-256 of the source image, so re-saving an ad
+    whose image is unchanged costs one hash.
+    """
+    ad = Advertisement.objects.filter(pk=ad_id).first()
+    if ad is None:
+        return False
+    if not ad.image:
+        renditions = {}
+    else:
+        source = file_digest(ad.image)
+        if not force and ad.renditions.get('source') == source:
+            return False
+        renditions = {'image': ad.image.name, 'source': source, **render(ad.image, app_settings('AD_RENDITIONS'))}
+    if renditions == ad.renditions:
+        return False
+    # update() skips post_save, so storing the result doesn't schedule another
+    # run; the image filter drops the result if the image was replaced meanwhile,
+    # and bumping updated_at changes the ads list ETag
+    rows = Advertisement.objects.filter(pk=ad_id)
+    if ad.image:
+        rows = rows.filter(image=ad.image.name)
+    return bool(rows.update(renditions=renditions, updated_at=timezone.now()))
+
+
+def is_stale(ad):
+    """Cheap check for the save signal: does the stored record describe a different image?"""
+    return (ad.image.name or '') != ad.renditions.get('image', '')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _generate_in_background(ad_id):
+    try:
+        generate(ad_id)
+    except Exception:
+        logger.exception('Generating renditions for advertisement %s failed', ad_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(ad_id):
+    """Generate renditions on the background pool (inline when AD_RENDITIONS['ASYNC'] is off)."""
+    global _executor
+    options = app_settings('AD_RENDITIONS')
+    if not options['ASYNC']:
+        generate(ad_id)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(options['WORKERS'], thread_name_prefix='ad-renditions')
+    _executor.submit(_generate_in_background, ad_id)
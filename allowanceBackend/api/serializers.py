@@ -1,10 +1,110 @@
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from .models import Transaction, ExchangeRate, Advertisement
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from .models import Transaction, TransactionSummary, ExchangeRate, Advertisement
+from .conf import app_settings
+from .money import Money, MoneyField as MoneyModelField
+from .renditions import is_stale
+from datetime import timedelta
 from decimal import Decimal
 import math
 
+class MoneyField(serializers.DecimalField):
+    """DecimalField that validates like one but yields and renders Money."""
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', 10)
+        kwargs['decimal_places'] = 2
+        super().__init__(**kwargs)
+    
+    def to_internal_value(self, data):
+        return Money.from_decimal(super().to_internal_value(data))
+    
+    def to_representation(self, value):
+        if isinstance(value, Money):
+            return str(value)
+        return super().to_representation(value)
+
+def value_converter(field):
+    """
+    A callable turning a non-null .values() value into what
+    field.to_representation() returns for the same model attribute.
+    """
+    if isinstance(field, serializers.RelatedField):
+        if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+            raise TypeError(f'{field.field_name}: only plain primary key relations can be read from .values()')
+        return lambda value: value  # .values() already yields the pk
+    if type(field) is serializers.UUIDField and field.uuid_format == 'hex_verbose':
+        return str
+    if type(field) is serializers.CharField:
+        return str
+    if type(field) is serializers.IntegerField:
+        return int
+    if type(field) is serializers.ChoiceField:
+        choices = field.choice_strings_to_values
+        return lambda value: choices.get(str(value), value)
+    if type(field) is serializers.DecimalField:
+        places = -field.decimal_places
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        plain = coerce_to_string and not field.localize and not field.normalize_output
+        
+        def decimal(value):
+            # Values at the column's own scale need no quantize()
+            if plain and isinstance(value, Decimal) and value.as_tuple().exponent == places:
+                return f'{value:f}'
+            return field.to_representation(value)
+        return decimal
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if type(field) is serializers.DateTimeField and output_format and output_format.lower() == ISO_8601:
+        # enforce_timezone() looks the zone up per value; resolve it once per response
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        
+        def iso_datetime(value):
+            if field_timezone is not None and value.tzinfo is not None:
+                value = value.astimezone(field_timezone).isoformat()
+            else:
+                value = field.enforce_timezone(value).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return iso_datetime
+    return field.to_representation
+
+class ValuesSerializerMixin:
+    """
+    Read fast path for a ModelSerializer: render rows fetched with .values()
+    instead of model instances, skipping instance construction and the
+    per-field get_attribute() walk.
+    
+    The readable fields are collected once per class and compiled into one
+    converter each per response; every converter returns what that field's
+    to_representation() would, so the JSON is byte-identical.
+    """
+    
+    @classmethod
+    def values_fields(cls):
+        fields = cls.__dict__.get('_values_fields')
+        if fields is None:
+            fields = cls._values_fields = [field for field in cls().fields.values() if not field.write_only]
+        return fields
+    
+    @classmethod
+    def values_queryset(cls, queryset):
+        return queryset.values(*{field.source.replace('.', '__'): None for field in cls.values_fields()})
+    
+    @classmethod
+    def values_data(cls, rows):
+        """Serialize dicts from values_queryset() as `cls(instances, many=True).data` would."""
+        columns = [
+            (field.field_name, field.source.replace('.', '__'), value_converter(field))
+            for field in cls.values_fields()
+        ]
+        return [
+            {name: None if (value := row[lookup]) is None else convert(value) for name, lookup, convert in columns}
+            for row in rows
+        ]
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     password_confirm = serializers.CharField(write_only=True)
@@ -41,14 +141,25 @@ class UserLoginSerializer(serializers.Serializer):
         return data
 
 class ExchangeRateSerializer(serializers.ModelSerializer):
+    is_stale = serializers.SerializerMethodField()
+
     class Meta:
         model = ExchangeRate
         fields = '__all__'
 
+    def get_is_stale(self, obj):
+        stale_after = timedelta(seconds=app_settings('RATE_REFRESH')['STALE_AFTER'])
+        return timezone.now() - obj.last_updated > stale_after
+
+class RatePointSerializer(serializers.Serializer):
+    effective_at = serializers.DateTimeField()
+    rate_to_usd = serializers.DecimalField(max_digits=10, decimal_places=4)
+
 class TransactionCalculationSerializer(serializers.Serializer):
-    amount_usd = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=1)
+    amount_usd = MoneyField(min_value=1)
     target_currency = serializers.ChoiceField(choices=['GBP', 'ZAR'])
     recipient_name = serializers.CharField(max_length=100)
+    quote_token = serializers.CharField(required=False, write_only=True)
     
     def validate_amount_usd(self, value):
         # Set minimum and maximum limits
@@ -58,24 +169,105 @@ class TransactionCalculationSerializer(serializers.Serializer):
             raise serializers.ValidationError('Maximum transfer amount is $10,000.00')
         return value
 
-class TransactionSerializer(serializers.ModelSerializer):
+class QuoteGridSerializer(serializers.Serializer):
+    MAX_POINTS = 2000
+    
+    currency = serializers.ChoiceField(choices=['GBP', 'ZAR'])
+    min = MoneyField(min_value=Decimal('10.00'), default=Money(1000))
+    max = MoneyField(max_value=Decimal('10000.00'), default=Money(1000000))
+    step = MoneyField(min_value=Decimal('0.01'), default=Money(1000))
+    
+    def validate(self, data):
+        if data['min'] > data['max']:
+            raise serializers.ValidationError('min must not be greater than max')
+        if (data['max'] - data['min']).cents // data['step'].cents >= self.MAX_POINTS:
+            raise serializers.ValidationError(f'A grid can have at most {self.MAX_POINTS} points')
+        return data
+
+class TransactionBatchSerializer(serializers.Serializer):
+    transfers = TransactionCalculationSerializer(many=True, allow_empty=False, max_length=100)
+
+class TransactionExportSerializer(serializers.Serializer):
+    # `format` is taken by DRF's renderer override, hence `type`
+    type = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    currency = serializers.ChoiceField(choices=['GBP', 'ZAR'], required=False)
+    
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
+
+class TransactionSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        MoneyModelField: MoneyField,
+    }
+    
     class Meta:
         model = Transaction
-        fields = '__all__'
+        exclude = ('claim_token',)
         read_only_fields = ('user', 'id', 'transaction_id', 'exchange_rate', 'fee_percentage', 'fee_amount', 'final_amount')
 
+class TransactionSummarySerializer(serializers.ModelSerializer):
+    serializer_field_mapping = TransactionSerializer.serializer_field_mapping
+    
+    class Meta:
+        model = TransactionSummary
+        fields = ('month', 'target_currency', 'transfer_count', 'total_usd', 'total_fees', 'total_final')
+
+class TransactionTotalSerializer(serializers.Serializer):
+    target_currency = serializers.CharField()
+    transfer_count = serializers.IntegerField()
+    total_usd = MoneyField(max_digits=14)
+    total_fees = MoneyField(max_digits=14)
+    total_final = MoneyField(max_digits=14)
+
+class AdImpressionSerializer(serializers.Serializer):
+    # Ads shown together are reported in one beacon
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=50)
+
 class AdvertisementSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_src = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    image_placeholder = serializers.SerializerMethodField()
 
     class Meta:
         model = Advertisement
-        fields = '__all__'
+        exclude = ('renditions',)
         read_only_fields = ('id',)
 
-    def get_image_url(self, obj):
+    def absolute(self, url):
         request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image_url(self, obj):
         if obj.image and hasattr(obj.image, 'url'):
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url
+            return self.absolute(obj.image.url)
         return None
+
+    def rendition_files(self, obj):
+        # A record left over from a replaced image is ignored until the
+        # background job catches up (or forever, if it failed)
+        if is_stale(obj):
+            return []
+        return obj.renditions.get('files', [])
+
+    def get_image_src(self, obj):
+        # Largest JPEG rendition: content-hashed, so it can be cached forever
+        jpegs = [f for f in self.rendition_files(obj) if f['type'] == 'image/jpeg']
+        if jpegs:
+            return self.absolute(default_storage.url(jpegs[-1]['name']))
+        return self.get_image_url(obj)
+
+    def get_image_srcset(self, obj):
+        """{'image/webp': 'url 320w, url 640w', ...}, one entry per <source> type."""
+        srcset = {}
+        for f in self.rendition_files(obj):
+            srcset.setdefault(f['type'], []).append(f"{self.absolute(default_storage.url(f['name']))} {f['width']}w")
+        return {content_type: ', '.join(candidates) for content_type, candidates in srcset.items()}
+
+    def get_image_placeholder(self, obj):
+        return None if is_stale(obj) else obj.renditions.get('placeholder')
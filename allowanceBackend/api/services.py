@@ -1,57 +1,216 @@
-import requests
-from decimal import Decimal, ROUND_UP
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from decimal import Decimal
+from django.core import signing
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction as db_transaction
+from django.db.models import Case, Count, DateField, F, Q, Subquery, Sum, Value, When
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
-from .models import ExchangeRate, Transaction
+from django.utils.module_loading import import_string
+from .conf import app_settings
+from .metrics import counter, histogram
+from .models import (
+    Advertisement, AdvertisementStats, ExchangeRate, ExchangeRateHistory, IdempotencyKey, Transaction,
+    TransactionSummary,
+)
+from .money import Money
+from .providers import RateProviderError, get_provider
+from .quotes import quote_factors
+from .rate_cache import rate_cache
+from .renderers import JSONRenderer
+from .singleflight import SingleFlight
 import math
 
+logger = logging.getLogger(__name__)
+
+settlement_latency = histogram(
+    'transfer_settlement_seconds', 'Time spent settling one transfer', ('outcome',),
+)
+rate_refreshes = counter(
+    'rate_refreshes_total', 'Exchange rate refresh attempts (provider latency and errors are rate_provider_*)',
+    ('outcome',),
+)
+
+RATE_PRECISION = Decimal('0.0001')  # ExchangeRate.rate_to_usd decimal places
+
 class ExchangeRateService:
-    API_URL = "https://68976304250b078c2041c7fc.mockapi.io/api/wiremit/InterviewAPIS"
+    REFRESH_LOCK_KEY = 'rates:refresh-lock'
+    
+    _refresh_flight = SingleFlight()
+    _last_refresh = None  # time.monotonic() of the last successful refresh in this process
     
     @classmethod
     def fetch_rates_from_api(cls):
         try:
-            response = requests.get(cls.API_URL, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Parse the non-flat structure
-            rates = {}
-            for item in data:
-                for currency, rate in item.items():
-                    rates[currency] = Decimal(str(rate))
-            
-            return rates
-        except Exception as e:
-            print(f"Error fetching exchange rates: {e}")
+            return get_provider().fetch_rates()
+        except RateProviderError as e:
+            logger.warning("Error fetching exchange rates: %s", e)
             return None
     
     @classmethod
     def update_rates(cls):
-        rates_data = cls.fetch_rates_from_api()
-        if rates_data:
-            for currency_code, rate in rates_data.items():
-                if currency_code in ['USD', 'GBP', 'ZAR']:
-                    ExchangeRate.objects.update_or_create(
-                        currency_code=currency_code,
-                        defaults={'rate_to_usd': rate}
-                    )
+        # Concurrent callers in this process share a single upstream fetch
+        return cls._refresh_flight.do('update_rates', cls._update_rates_once)
+    
+    @classmethod
+    def _update_rates_once(cls):
+        options = app_settings('RATE_REFRESH')
+        window = options['COALESCE_WINDOW']
+        if cls._last_refresh is not None and time.monotonic() - cls._last_refresh < window:
+            rate_refreshes.inc(outcome='coalesced')
+            return True
+        
+        # The cross-process lock is held for the whole window after a
+        # successful refresh, and released straight away on any failure,
+        # including an exception from the provider or store_rates().
+        lock = caches[options['LOCK_CACHE_ALIAS']] if options['LOCK_CACHE_ALIAS'] else None
+        if lock is not None and not lock.add(cls.REFRESH_LOCK_KEY, 1, window):
+            rate_refreshes.inc(outcome='coalesced')
             return True
-        return False
+        
+        succeeded = False
+        try:
+            rates_data = cls.fetch_rates_from_api()
+            if rates_data:
+                currencies = options['CURRENCIES']
+                if currencies is not None:
+                    rates_data = {code: rate for code, rate in rates_data.items() if code in currencies}
+                changed = cls.store_rates(rates_data)
+                logger.info("Exchange rates refreshed: %d of %d changed", changed, len(rates_data))
+                cls._last_refresh = time.monotonic()
+                succeeded = True
+        finally:
+            rate_refreshes.inc(outcome='updated' if succeeded else 'failed')
+            if not succeeded and lock is not None:
+                lock.delete(cls.REFRESH_LOCK_KEY)
+        return succeeded
+    
+    @classmethod
+    def store_rates(cls, rates):
+        """Upsert {currency_code: rate} in one transaction and return how many rows changed."""
+        rates = {code: Decimal(str(rate)).quantize(RATE_PRECISION) for code, rate in rates.items()}
+        now = timezone.now()
+        with db_transaction.atomic():
+            stored = dict(
+                ExchangeRate.objects.filter(currency_code__in=rates).values_list('currency_code', 'rate_to_usd')
+            )
+            changed = [
+                ExchangeRate(currency_code=code, rate_to_usd=rate, last_updated=now)
+                for code, rate in rates.items() if stored.get(code) != rate
+            ]
+            if changed:
+                ExchangeRate.objects.bulk_create(
+                    changed,
+                    batch_size=500,
+                    update_conflicts=True,
+                    unique_fields=['currency_code'],
+                    update_fields=['rate_to_usd', 'last_updated'],
+                )
+                ExchangeRateHistory.objects.bulk_create(
+                    [ExchangeRateHistory(currency_code=rate.currency_code, rate_to_usd=rate.rate_to_usd, effective_at=now)
+                     for rate in changed],
+                    batch_size=500,
+                )
+            unchanged = [code for code, rate in rates.items() if stored.get(code) == rate]
+            if unchanged:
+                # Unchanged rates were still confirmed just now; one UPDATE keeps is_stale accurate
+                ExchangeRate.objects.filter(currency_code__in=unchanged).update(last_updated=now)
+        if changed:
+            rate_cache.invalidate()
+        return len(changed)
     
     @classmethod
     def get_rate(cls, currency_code):
-        try:
-            rate = ExchangeRate.objects.get(currency_code=currency_code)
-            return rate.rate_to_usd
-        except ExchangeRate.DoesNotExist:
+        rate = rate_cache.get_rate(currency_code)
+        if rate is None:
             cls.update_rates()
-            try:
-                rate = ExchangeRate.objects.get(currency_code=currency_code)
-                return rate.rate_to_usd
-            except ExchangeRate.DoesNotExist:
-                return None
+            rate = rate_cache.get_rate(currency_code)
+        return rate
+    
+    @classmethod
+    async def aupdate_rates(cls):
+        # The provider's pooled session runs in a worker thread so the event
+        # loop keeps serving requests, and the refresh still coalesces with
+        # synchronous callers through update_rates' single flight.
+        return await sync_to_async(cls.update_rates, thread_sensitive=False)()
+    
+    @classmethod
+    async def aget_rate(cls, currency_code):
+        rate = await rate_cache.aget_rate(currency_code)
+        if rate is None:
+            await cls.aupdate_rates()
+            rate = await rate_cache.aget_rate(currency_code)
+        return rate
+
+class RateHistoryService:
+    @classmethod
+    def rate_as_of(cls, currency_code, at):
+        """Rate in effect for currency_code at timestamp `at`, or None if none was recorded yet."""
+        return (
+            ExchangeRateHistory.objects
+            .filter(currency_code=currency_code, effective_at__lte=at)
+            .order_by('-effective_at')
+            .values_list('rate_to_usd', flat=True)
+            .first()
+        )
+    
+    @classmethod
+    def rate_series(cls, currency_code, start, end, limit=None):
+        """
+        (effective_at, rate) points in [start, end], oldest first, plus the point
+        in effect at start; only the oldest `limit` points when a limit is given.
+        """
+        points = list(
+            ExchangeRateHistory.objects
+            .filter(currency_code=currency_code, effective_at__gte=start, effective_at__lte=end)
+            .order_by('effective_at')
+            .values_list('effective_at', 'rate_to_usd')[:limit]
+        )
+        if not points or points[0][0] > start:
+            opening = cls.rate_as_of(currency_code, start)
+            if opening is not None:
+                points.insert(0, (start, opening))
+        return points[:limit]
+    
+    @classmethod
+    def prune(cls, retention, downsample_after, bucket):
+        """
+        Delete history older than `retention`, and keep only the last point per
+        `bucket` (all timedeltas) for history older than `downsample_after`.
+        Returns (expired, downsampled) row counts.
+        """
+        now = timezone.now()
+        expired, _ = ExchangeRateHistory.objects.filter(effective_at__lt=now - retention).delete()
+        
+        bucket_seconds = bucket.total_seconds()
+        old = (
+            ExchangeRateHistory.objects
+            .filter(effective_at__lt=now - downsample_after)
+            .order_by('currency_code', '-effective_at')
+            .values_list('id', 'currency_code', 'effective_at')
+        )
+        seen, doomed = set(), []
+        for pk, currency_code, effective_at in old.iterator(chunk_size=2000):
+            key = (currency_code, int(effective_at.timestamp() // bucket_seconds))
+            if key in seen:
+                doomed.append(pk)
+            else:
+                seen.add(key)
+        for i in range(0, len(doomed), 500):
+            ExchangeRateHistory.objects.filter(id__in=doomed[i:i + 500]).delete()
+        return expired, len(doomed)
+
+class QuoteTokenError(ValueError):
+    pass
 
 class TransactionService:
+    QUOTE_TOKEN_SALT = 'api.quote'
     FEE_RATES = {
         'GBP': Decimal('0.10'),  # 10%
         'ZAR': Decimal('0.20'),  # 20%
@@ -63,48 +222,552 @@ class TransactionService:
         rate = ExchangeRateService.get_rate(target_currency)
         if not rate:
             raise ValueError(f"Exchange rate not available for {target_currency}")
-        
-        # Calculate fee
-        fee_percentage = cls.FEE_RATES.get(target_currency, Decimal('0.15'))
-        fee_amount = amount_usd * fee_percentage
-        
-        # Amount after fee deduction
-        amount_after_fee = amount_usd - fee_amount
-        
-        # Convert to target currency
-        converted_amount = amount_after_fee * rate
-        
-        # Round UP to maintain accuracy
-        final_amount = converted_amount.quantize(Decimal('0.01'), rounding=ROUND_UP)
+        return cls.quote(amount_usd, target_currency, rate)
+    
+    @classmethod
+    async def acalculate_transaction(cls, amount_usd, target_currency):
+        rate = await ExchangeRateService.aget_rate(target_currency)
+        if not rate:
+            raise ValueError(f"Exchange rate not available for {target_currency}")
+        return cls.quote(amount_usd, target_currency, rate)
+    
+    @classmethod
+    def fee_rate(cls, target_currency):
+        return cls.FEE_RATES.get(target_currency, Decimal('0.15'))
+    
+    @classmethod
+    def quote(cls, amount_usd, target_currency, rate):
+        # Fee and conversion are done in integer cents and rounded UP to the
+        # cent, exactly as quantize(Decimal('0.01'), ROUND_UP) would
+        amount_usd = Money.coerce(amount_usd)
+        factors = quote_factors(cls.fee_rate(target_currency), rate)
+        fee, after_fee, final = factors.quote_one(amount_usd.cents)
         
         return {
             'amount_usd': amount_usd,
             'target_currency': target_currency,
             'exchange_rate': rate,
-            'fee_percentage': fee_percentage * 100,  # Convert to percentage
-            'fee_amount': fee_amount.quantize(Decimal('0.01'), rounding=ROUND_UP),
-            'amount_after_fee': amount_after_fee.quantize(Decimal('0.01'), rounding=ROUND_UP),
-            'final_amount': final_amount,
+            'fee_percentage': factors.fee_percentage,
+            'fee_amount': Money(fee),
+            'amount_after_fee': Money(after_fee),
+            'final_amount': Money(final),
         }
     
     @classmethod
-    def create_transaction(cls, user, amount_usd, target_currency, recipient_name):
-        calculation = cls.calculate_transaction(amount_usd, target_currency)
+    def quote_many(cls, amounts_usd, target_currency, rate):
+        """quote() for many amounts in one currency."""
+        amounts_usd = [Money.coerce(amount) for amount in amounts_usd]
+        factors = quote_factors(cls.fee_rate(target_currency), rate)
+        fees, after_fees, finals = factors.quote_cents([amount.cents for amount in amounts_usd])
+        fee_percentage = factors.fee_percentage
+        return [
+            {
+                'amount_usd': amount_usd,
+                'target_currency': target_currency,
+                'exchange_rate': rate,
+                'fee_percentage': fee_percentage,
+                'fee_amount': Money(fee),
+                'amount_after_fee': Money(after_fee),
+                'final_amount': Money(final),
+            }
+            for amount_usd, fee, after_fee, final in zip(amounts_usd, fees, after_fees, finals)
+        ]
+    
+    @classmethod
+    def quote_grid(cls, target_currency, min_usd, max_usd, step_usd):
+        """Quotes for every amount from min_usd to max_usd in steps of step_usd, for a slider."""
+        rate = ExchangeRateService.get_rate(target_currency)
+        if not rate:
+            raise ValueError(f"Exchange rate not available for {target_currency}")
+        factors = quote_factors(cls.fee_rate(target_currency), rate)
+        amounts = range(Money.coerce(min_usd).cents, Money.coerce(max_usd).cents + 1, Money.coerce(step_usd).cents)
+        fees, _, finals = factors.quote_cents(amounts)
+        return {
+            'target_currency': target_currency,
+            'exchange_rate': rate,
+            'fee_percentage': factors.fee_percentage,
+            'points': [
+                {'amount_usd': Money(amount), 'fee_amount': Money(fee), 'final_amount': Money(final)}
+                for amount, fee, final in zip(amounts, fees, finals)
+            ],
+        }
+    
+    @classmethod
+    def issue_quote(cls, user, calculation):
+        """
+        Sign `calculation` for `user`. Sending with the token within
+        QUOTE_TOKEN['MAX_AGE'] seconds uses these exact figures instead of
+        looking the rate up again.
+        """
+        payload = [
+            user.pk,
+            calculation['target_currency'],
+            str(calculation['exchange_rate']),
+            str(calculation['fee_percentage']),
+            calculation['amount_usd'].cents,
+            calculation['fee_amount'].cents,
+            calculation['amount_after_fee'].cents,
+            calculation['final_amount'].cents,
+        ]
+        max_age = app_settings('QUOTE_TOKEN')['MAX_AGE']
+        return {
+            'quote_token': signing.dumps(payload, salt=cls.QUOTE_TOKEN_SALT, compress=True),
+            'quote_expires_at': timezone.now() + timedelta(seconds=max_age),
+        }
+    
+    @classmethod
+    def redeem_quote(cls, token, user, amount_usd, target_currency):
+        """Return the calculation signed into `token`, checked against the transfer it is sent with."""
+        try:
+            payload = signing.loads(token, salt=cls.QUOTE_TOKEN_SALT, max_age=app_settings('QUOTE_TOKEN')['MAX_AGE'])
+        except signing.SignatureExpired:
+            raise QuoteTokenError('Quote has expired; please calculate again')
+        except signing.BadSignature:
+            raise QuoteTokenError('Invalid quote token')
+        user_id, currency, rate, fee_percentage, amount, fee, after_fee, final = payload
+        if user_id != user.pk or currency != target_currency or amount != Money.coerce(amount_usd).cents:
+            raise QuoteTokenError('Quote token does not match this transfer')
+        return {
+            'amount_usd': Money(amount),
+            'target_currency': currency,
+            'exchange_rate': Decimal(rate),
+            'fee_percentage': Decimal(fee_percentage),
+            'fee_amount': Money(fee),
+            'amount_after_fee': Money(after_fee),
+            'final_amount': Money(final),
+        }
+    
+    @classmethod
+    def create_transaction(cls, user, amount_usd, target_currency, recipient_name, quote_token=None):
+        if quote_token:
+            calculation = cls.redeem_quote(quote_token, user, amount_usd, target_currency)
+        else:
+            calculation = cls.calculate_transaction(amount_usd, target_currency)
         
-        transaction = Transaction.objects.create(
-            user=user,
-            amount_usd=amount_usd,
-            target_currency=target_currency,
-            exchange_rate=calculation['exchange_rate'],
-            fee_percentage=calculation['fee_percentage'],
-            fee_amount=calculation['fee_amount'],
-            final_amount=calculation['final_amount'],
-            recipient_name=recipient_name,
-            status='COMPLETED'
-        )
+        # The post_save summary update commits together with the row
+        with db_transaction.atomic():
+            transaction = Transaction.objects.create(
+                user=user,
+                amount_usd=amount_usd,
+                target_currency=target_currency,
+                exchange_rate=calculation['exchange_rate'],
+                fee_percentage=calculation['fee_percentage'],
+                fee_amount=calculation['fee_amount'],
+                final_amount=calculation['final_amount'],
+                recipient_name=recipient_name,
+                **SettlementService.initial_state()
+            )
+        if not app_settings('SETTLEMENT')['ASYNC']:
+            SettlementService.settle(transaction)
         
         return {
             'transaction_id': str(transaction.transaction_id),
             'status': transaction.status,
             **calculation
         }
+    
+    @classmethod
+    def create_transactions(cls, user, transfers):
+        """
+        Create many transfers at once: one rate lookup per currency and a
+        single bulk INSERT in one transaction. Results follow input order.
+        """
+        rates = {}
+        for currency in {transfer['target_currency'] for transfer in transfers if not transfer.get('quote_token')}:
+            rates[currency] = ExchangeRateService.get_rate(currency)
+            if not rates[currency]:
+                raise ValueError(f"Exchange rate not available for {currency}")
+        
+        calculations = [
+            cls.redeem_quote(transfer['quote_token'], user, transfer['amount_usd'], transfer['target_currency'])
+            if transfer.get('quote_token') else
+            cls.quote(transfer['amount_usd'], transfer['target_currency'], rates[transfer['target_currency']])
+            for transfer in transfers
+        ]
+        objects = [
+            Transaction(
+                user=user,
+                amount_usd=transfer['amount_usd'],
+                target_currency=transfer['target_currency'],
+                exchange_rate=calculation['exchange_rate'],
+                fee_percentage=calculation['fee_percentage'],
+                fee_amount=calculation['fee_amount'],
+                final_amount=calculation['final_amount'],
+                recipient_name=transfer['recipient_name'],
+                **SettlementService.initial_state()
+            )
+            for transfer, calculation in zip(transfers, calculations)
+        ]
+        with db_transaction.atomic():
+            Transaction.objects.bulk_create(objects)
+            # bulk_create skips post_save
+            TransactionSummaryService.record(objects)
+        if not app_settings('SETTLEMENT')['ASYNC']:
+            for transaction in objects:
+                SettlementService.settle(transaction)
+        
+        return [
+            {
+                'transaction_id': str(transaction.transaction_id),
+                'status': transaction.status,
+                'recipient_name': transaction.recipient_name,
+                **calculation
+            }
+            for transaction, calculation in zip(objects, calculations)
+        ]
+
+class SettlementService:
+    """
+    Moves transfers from PENDING to COMPLETED, or to FAILED after
+    SETTLEMENT['MAX_ATTEMPTS'] failed attempts.
+
+    The Transaction table is the queue: workers (api/settlement.py) claim
+    PENDING rows oldest first by marking them PROCESSING under a fresh
+    claim_token, and a claim older than SETTLEMENT['LEASE'] seconds is
+    assumed abandoned and taken over.
+    """
+    
+    @classmethod
+    def initial_state(cls):
+        if app_settings('SETTLEMENT')['ASYNC']:
+            return {'status': 'PENDING'}
+        # Settled inline by the request, so it starts out claimed
+        return {'status': 'PROCESSING', 'claimed_at': timezone.now(), 'claim_token': uuid.uuid4(), 'attempts': 1}
+    
+    @classmethod
+    def claim(cls, batch_size):
+        """Claim up to batch_size due transfers for this worker and return them."""
+        now = timezone.now()
+        lease = timedelta(seconds=app_settings('SETTLEMENT')['LEASE'])
+        due = Transaction.objects.filter(Q(status='PENDING') | Q(status='PROCESSING', claimed_at__lt=now - lease))
+        # The token, not the timestamp, tells this claim's rows apart: two
+        # workers can claim within the same clock tick
+        token = uuid.uuid4()
+        claimed = {
+            'status': 'PROCESSING', 'claimed_at': now, 'claim_token': token,
+            'attempts': F('attempts') + 1, 'updated_at': now,
+        }
+        oldest = due.order_by('created_at').values('id')
+        if connection.features.has_select_for_update_skip_locked:
+            with db_transaction.atomic():
+                ids = list(oldest.select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    return []
+                due.filter(id__in=ids).update(**claimed)
+        elif not due.filter(id__in=Subquery(oldest[:batch_size])).update(**claimed):
+            # One UPDATE statement: SQLite takes the write lock up front and
+            # waits out busy_timeout, where a SELECT then UPDATE would fail
+            # with "database is locked" once another worker has written
+            return []
+        return list(Transaction.objects.filter(status='PROCESSING', claim_token=token).order_by('created_at'))
+    
+    @classmethod
+    def settle(cls, transaction):
+        """Run the settlement handler for a claimed transfer and record the outcome."""
+        options = app_settings('SETTLEMENT')
+        start = time.perf_counter()
+        try:
+            if options['HANDLER']:
+                import_string(options['HANDLER'])(transaction)
+        except Exception:
+            logger.exception("Settlement of transaction %s failed", transaction.transaction_id)
+            status = 'FAILED' if transaction.attempts >= options['MAX_ATTEMPTS'] else 'PENDING'
+        else:
+            status = 'COMPLETED'
+        settlement_latency.observe(time.perf_counter() - start, outcome=status.lower())
+        
+        # Only the current claim may record an outcome; a worker that
+        # outlived its lease must not overwrite the new owner's work
+        with db_transaction.atomic():
+            updated = Transaction.objects.filter(
+                pk=transaction.pk, status='PROCESSING', claim_token=transaction.claim_token,
+            ).update(status=status, claimed_at=None, claim_token=None, updated_at=timezone.now())
+            if updated and status == 'FAILED':
+                # update() sends no signals; failed transfers leave the dashboard totals
+                TransactionSummaryService.record([transaction], sign=-1)
+        if updated:
+            transaction.status = status
+            transaction.claimed_at = None
+            transaction.claim_token = None
+        return bool(updated)
+
+class TransactionSummaryService:
+    """
+    Maintains TransactionSummary, the per-user totals by currency and month.
+    
+    Every created transfer is added to its summary row in the transaction
+    that inserts it, so the dashboard reads a few rows instead of paging
+    through history. Failed transfers were never sent and are left out:
+    settle() takes a transfer back out when it fails, and the Transaction
+    signals move it when a save changes its amounts, currency, user or
+    status, or when it is deleted. rebuild() recomputes the table from
+    Transaction.
+    """
+    
+    FIELDS = ('transfer_count', 'total_usd', 'total_fees', 'total_final')
+    COUNTED = ~Q(status='FAILED')
+    
+    @classmethod
+    def month_of(cls, moment):
+        # Same bucket as TruncMonth in the current time zone
+        return timezone.localtime(moment).date().replace(day=1)
+    
+    @classmethod
+    def contribution(cls, transaction):
+        """(summary key, (usd, fees, final) in cents) for a transfer, or None if it isn't counted."""
+        if transaction.status == 'FAILED':
+            return None
+        key = (transaction.user_id, cls.month_of(transaction.created_at), transaction.target_currency)
+        amounts = (
+            Money.coerce(transaction.amount_usd).cents,
+            Money.coerce(transaction.fee_amount).cents,
+            Money.coerce(transaction.final_amount).cents,
+        )
+        return key, amounts
+    
+    @classmethod
+    def record(cls, transactions, sign=1):
+        """Add transfers to their summary rows, or take them back out with sign=-1."""
+        deltas = {}
+        for transaction in transactions:
+            contribution = cls.contribution(transaction)
+            if contribution is None:
+                continue
+            key, (usd, fees, final) = contribution
+            total = deltas.get(key, (0, 0, 0, 0))
+            deltas[key] = (total[0] + sign, total[1] + sign * usd, total[2] + sign * fees, total[3] + sign * final)
+        
+        for (user_id, month, currency), (count, usd, fees, final) in deltas.items():
+            row = TransactionSummary.objects.filter(user_id=user_id, month=month, target_currency=currency)
+            increments = {
+                'transfer_count': F('transfer_count') + count,
+                'total_usd': F('total_usd') + Money(usd).to_decimal(),
+                'total_fees': F('total_fees') + Money(fees).to_decimal(),
+                'total_final': F('total_final') + Money(final).to_decimal(),
+            }
+            # Increment in SQL so concurrent transfers for the same row don't lose updates
+            if row.update(**increments):
+                if count < 0:
+                    # rebuild() has no rows for empty groups either
+                    row.filter(transfer_count=0).delete()
+                continue
+            if count < 0:
+                # No row: the transfer was never summarized or was already
+                # taken out, so there is nothing to remove
+                continue
+            try:
+                with db_transaction.atomic():
+                    TransactionSummary.objects.create(
+                        user_id=user_id, month=month, target_currency=currency, transfer_count=count,
+                        total_usd=Money(usd), total_fees=Money(fees), total_final=Money(final),
+                    )
+            except IntegrityError:
+                # Another transfer created the row first
+                row.update(**increments)
+    
+    @classmethod
+    def aggregate(cls, transactions):
+        """Summary rows computed from scratch with a single GROUP BY."""
+        return list(
+            transactions
+            .filter(cls.COUNTED)
+            .annotate(month=TruncMonth('created_at', output_field=DateField()))
+            .values('user_id', 'month', 'target_currency')
+            .annotate(
+                transfer_count=Count('pk'),
+                total_usd=Sum('amount_usd'),
+                total_fees=Sum('fee_amount'),
+                total_final=Sum('final_amount'),
+            )
+            .order_by('user_id', 'month', 'target_currency')
+        )
+    
+    @classmethod
+    def rebuild(cls, user=None):
+        """Replace the summary rows (for one user, or everyone) with fresh totals."""
+        transactions = Transaction.objects.all()
+        summaries = TransactionSummary.objects.all()
+        if user is not None:
+            transactions = transactions.filter(user=user)
+            summaries = summaries.filter(user=user)
+        with db_transaction.atomic():
+            rows = cls.aggregate(transactions)
+            summaries.delete()
+            TransactionSummary.objects.bulk_create((TransactionSummary(**row) for row in rows), batch_size=500)
+        return len(rows)
+    
+    @classmethod
+    def summary(cls, user, target_currency=None):
+        """A user's rows, newest month first, plus all-time totals per currency."""
+        rows = TransactionSummary.objects.filter(user=user)
+        if target_currency:
+            rows = rows.filter(target_currency=target_currency)
+        rows = list(rows)
+        
+        totals = {}
+        for row in rows:
+            total = totals.get(row.target_currency)
+            if total is None:
+                total = totals[row.target_currency] = {
+                    'target_currency': row.target_currency, 'transfer_count': 0,
+                    'total_usd': Money(0), 'total_fees': Money(0), 'total_final': Money(0),
+                }
+            for field in cls.FIELDS:
+                total[field] += getattr(row, field)
+        return rows, sorted(totals.values(), key=lambda total: total['target_currency'])
+
+class AdStatsService:
+    """
+    Adds buffered impression and click counts to AdvertisementStats.
+    
+    Each batch is applied in one transaction: an INSERT that creates the
+    missing (ad, day) rows, then one UPDATE that increments every row in
+    SQL, so flushes from several workers add up instead of overwriting.
+    """
+    
+    FIELDS = ('impressions', 'clicks')
+    BATCH_SIZE = 100  # (ad, day) rows per statement
+    
+    @classmethod
+    def add(cls, counts):
+        """Apply {(advertisement_id, date, field): n}; returns the number of rows touched."""
+        deltas = {}
+        for (ad_id, day, field), n in counts.items():
+            deltas.setdefault((ad_id, day), dict.fromkeys(cls.FIELDS, 0))[field] += n
+        # Events for unknown or deleted ads are dropped rather than failing the batch
+        known = set(Advertisement.objects.filter(pk__in={ad_id for ad_id, _ in deltas}).values_list('pk', flat=True))
+        keys = [key for key in deltas if key[0] in known]
+        
+        for start in range(0, len(keys), cls.BATCH_SIZE):
+            batch = keys[start:start + cls.BATCH_SIZE]
+            match = Q()
+            for ad_id, day in batch:
+                match |= Q(advertisement_id=ad_id, date=day)
+            increments = {}
+            for field in cls.FIELDS:
+                cases = [When(advertisement_id=ad_id, date=day, then=Value(deltas[ad_id, day][field]))
+                         for ad_id, day in batch if deltas[ad_id, day][field]]
+                if cases:
+                    increments[field] = F(field) + Case(*cases, default=Value(0))
+            with db_transaction.atomic():
+                AdvertisementStats.objects.bulk_create(
+                    [AdvertisementStats(advertisement_id=ad_id, date=day) for ad_id, day in batch],
+                    ignore_conflicts=True,
+                )
+                AdvertisementStats.objects.filter(match).update(**increments)
+        return len(keys)
+
+class IdempotencyConflict(Exception):
+    pass
+
+class IdempotencyInProgress(Exception):
+    pass
+
+class IdempotencyService:
+    """
+    Runs a request at most once per (user, Idempotency-Key) and replays its
+    response for repeats within IDEMPOTENCY['TTL'].
+
+    Responses are kept in the cache in front of the IdempotencyKey table.
+    Concurrent duplicates queue on a cache lock and replay the winner's
+    response once it lands. The key's row is inserted in the same database
+    transaction as the request's writes, so the unique constraint still
+    allows a single winner when the lock isn't shared (a per-process cache)
+    or has expired.
+    """
+    
+    POLL_INTERVAL = 0.05
+    
+    @classmethod
+    def fingerprint(cls, data):
+        canonical = json.dumps({name: str(value) for name, value in data.items()}, sort_keys=True)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+    
+    @classmethod
+    def cache_key(cls, user, key, options):
+        return f"{options['KEY_PREFIX']}:{user.pk}:{hashlib.sha256(key.encode()).hexdigest()}"
+    
+    @classmethod
+    def execute(cls, user, key, fingerprint, func):
+        """
+        Return (status, body, replayed). func() -> (status, body) runs only if
+        the key is new; it may raise to leave the key unclaimed. Raises
+        IdempotencyConflict if the key was already used for another request,
+        and IdempotencyInProgress if a duplicate is still running after
+        IDEMPOTENCY['WAIT'] seconds.
+        """
+        options = app_settings('IDEMPOTENCY')
+        cache = caches[options['CACHE_ALIAS']]
+        cache_key = cls.cache_key(user, key, options)
+        lock_key = f'{cache_key}:lock'
+        deadline = time.monotonic() + options['WAIT']
+        
+        while True:
+            stored = cache.get(cache_key)
+            if stored is not None:
+                replayed = True
+                break
+            if cache.add(lock_key, True, options['WAIT']):
+                try:
+                    stored, replayed = cls._execute_once(user, key, fingerprint, func, options)
+                    cache.set(cache_key, stored, options['TTL'])
+                finally:
+                    cache.delete(lock_key)
+                break
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress('A request with this Idempotency-Key is still being processed')
+            time.sleep(cls.POLL_INTERVAL)
+        
+        if replayed and stored[0] != fingerprint:
+            raise IdempotencyConflict('Idempotency-Key has already been used for a different request')
+        return stored[1], stored[2], replayed
+    
+    @classmethod
+    def _execute_once(cls, user, key, fingerprint, func, options):
+        stored = cls._stored(user, key, options)
+        if stored is not None:
+            return stored, True
+        try:
+            return cls._claim(user, key, fingerprint, func), False
+        except IntegrityError:
+            # Lost the race to another process: the winner has committed by now
+            stored = cls._stored(user, key, options)
+            if stored is not None:
+                return stored, True
+        # The key's previous use has expired; free it and go again
+        cls._expired(user, key, options).delete()
+        return cls._claim(user, key, fingerprint, func), False
+    
+    @classmethod
+    def _claim(cls, user, key, fingerprint, func):
+        with db_transaction.atomic():
+            record = IdempotencyKey.objects.create(user=user, key=key, request_fingerprint=fingerprint)
+            status_code, body = func()
+            # Keep exactly what a replay will render
+            record.response_status = status_code
+            record.response_body = json.loads(JSONRenderer().render(body))
+            record.save(update_fields=['response_status', 'response_body'])
+        return fingerprint, status_code, body
+    
+    @classmethod
+    def _stored(cls, user, key, options):
+        record = (
+            IdempotencyKey.objects
+            .filter(user=user, key=key, created_at__gte=timezone.now() - timedelta(seconds=options['TTL']))
+            .values_list('request_fingerprint', 'response_status', 'response_body')
+            .first()
+        )
+        return tuple(record) if record else None
+    
+    @classmethod
+    def _expired(cls, user, key, options):
+        return IdempotencyKey.objects.filter(
+            user=user, key=key, created_at__lt=timezone.now() - timedelta(seconds=options['TTL'])
+        )
+    
+    @classmethod
+    def prune(cls):
+        """Delete keys older than IDEMPOTENCY['TTL']; returns the number deleted."""
+        ttl = timedelta(seconds=app_settings('IDEMPOTENCY')['TTL'])
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - ttl).delete()
+        return deleted
@@ -0,0 +1,68 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from .conf import app_settings
+from .services import SettlementService
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementWorker:
+    """
+    Settles queued transfers on a thread pool, polling the queue while it is
+    empty. With a single worker, transfers are settled in the calling thread.
+    """
+
+    def __init__(self, workers=None, batch_size=None, poll_interval=None):
+        options = app_settings('SETTLEMENT')
+        self.workers = options['WORKERS'] if workers is None else workers
+        self.batch_size = options['BATCH_SIZE'] if batch_size is None else batch_size
+        self.poll_interval = options['POLL_INTERVAL'] if poll_interval is None else poll_interval
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='settlement') if self.workers > 1 else None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _settle(self, transaction):
+        try:
+            return SettlementService.settle(transaction)
+        finally:
+            close_old_connections()
+
+    def run_once(self):
+        """Claim and settle one batch; returns the number of transfers claimed."""
+        transactions = SettlementService.claim(self.batch_size)
+        if self._pool is None:
+            for transaction in transactions:
+                SettlementService.settle(transaction)
+        else:
+            list(self._pool.map(self._settle, transactions))
+        return len(transactions)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception:
+                logger.exception('Settlement worker failed to process the queue')
+                claimed = 0
+            finally:
+                close_old_connections()
+            if not claimed:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='settlement-worker', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
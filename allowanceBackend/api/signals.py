@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from .middleware import record_query
+from .models import Advertisement, ExchangeRate, ExchangeRateHistory, Transaction
+from .rate_cache import rate_cache
+from .renditions import is_stale, schedule
+from .services import TransactionSummaryService
+from .throttling import reset_user_buckets
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_rate_cache(sender, **kwargs):
+    # Rates edited outside ExchangeRateService (e.g. in the admin)
+    rate_cache.invalidate()
+
+
+@receiver(post_save, sender=ExchangeRate)
+def record_rate_history(sender, instance, **kwargs):
+    # ExchangeRateService.store_rates records its own history in bulk. Like
+    # it, only record a point when the rate differs from the series' latest,
+    # so saving another field (or re-saving the same rate) adds nothing.
+    latest = (
+        ExchangeRateHistory.objects.filter(currency_code=instance.currency_code)
+        .order_by('-effective_at').values_list('rate_to_usd', flat=True).first()
+    )
+    if latest is not None and latest == Decimal(str(instance.rate_to_usd)):
+        return
+    ExchangeRateHistory.objects.create(
+        currency_code=instance.currency_code,
+        rate_to_usd=instance.rate_to_usd,
+        effective_at=instance.last_updated,
+    )
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_summarized_transaction(sender, instance, raw=False, **kwargs):
+    # The stored version, so post_save can take it out of its summary row
+    instance._summarized = None
+    if not instance._state.adding and not raw:
+        instance._summarized = Transaction.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Transaction)
+def record_transaction_summary(sender, instance, created, **kwargs):
+    # TransactionService.create_transactions records its own batch
+    if created:
+        TransactionSummaryService.record([instance])
+        return
+    before = getattr(instance, '_summarized', None)
+    if before is None:
+        return
+    contribution = TransactionSummaryService.contribution
+    if contribution(before) != contribution(instance):
+        with transaction.atomic():
+            TransactionSummaryService.record([before], sign=-1)
+            TransactionSummaryService.record([instance])
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_summary(sender, instance, **kwargs):
+    TransactionSummaryService.record([instance], sign=-1)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, using, **kwargs):
+    # Deactivation, password changes and edits reach CachedJWTAuthentication.
+    # Again once committed: a request in between reads the old committed row
+    # and would otherwise cache it for the whole TTL.
+    invalidate_user(instance)
+    transaction.on_commit(lambda: invalidate_user(instance), using=using)
+
+
+@receiver(post_save, sender=User)
+def reset_new_user_throttles(sender, instance, created, **kwargs):
+    if created:
+        reset_user_buckets(instance)
+
+
+@receiver(post_save, sender=Advertisement)
+def schedule_ad_renditions(sender, instance, **kwargs):
+    # Only once the new image is committed, so the worker can see it
+    if is_stale(instance):
+        transaction.on_commit(lambda: schedule(instance.pk))
+
+
+@receiver(connection_created)
+def instrument_queries(sender, connection, **kwargs):
+    # Fires again on reconnect, hence the membership check
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -1,3 +1,1877 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import ROUND_UP, Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .ad_stats import AdEventBuffer, ad_events
+from .authentication import user_cache_key
+from .conf import app_settings
+from .metrics import REGISTRY, Counter, cache_requests, render_text
+from .middleware import MetricsMiddleware, request_latency, request_queries, request_query_seconds
+from .models import Advertisement, AdvertisementStats, ExchangeRate, ExchangeRateHistory, IdempotencyKey, Transaction, TransactionSummary
+from .money import Money
+from .providers import CircuitBreaker, CircuitOpenError, MockApiRateProvider, RateProviderError, get_provider
+from .quotes import quote_factors
+from .rate_cache import rate_cache
+from .refresher import RateRefresher
+from .renderers import JSONRenderer
+from .renditions import generate
+from .services import (
+    ExchangeRateService, IdempotencyService, RateHistoryService, SettlementService, TransactionService,
+    TransactionSummaryService,
+)
+from .serializers import TransactionSerializer
+from .settlement import SettlementWorker
+from .throttling import take_token
+
+
+def create_transactions(user, count, created_at=None, **fields):
+    created_at = created_at or timezone.now()
+    values = {
+        'amount_usd': Decimal('100.00'), 'target_currency': 'GBP', 'exchange_rate': Decimal('0.7400'),
+        'fee_percentage': Decimal('10.00'), 'fee_amount': Decimal('10.00'), 'final_amount': Decimal('66.60'),
+        'recipient_name': 'Jane Doe', 'status': 'COMPLETED', **fields,
+    }
+    transactions = Transaction.objects.bulk_create(Transaction(user=user, **values) for _ in range(count))
+    # created_at is auto_now_add; spread rows one minute apart, newest first
+    for i, transaction in enumerate(transactions):
+        Transaction.objects.filter(pk=transaction.pk).update(created_at=created_at - timedelta(minutes=i))
+    return transactions
+
+
+def create_rates(**rates):
+    rates = rates or {'USD': '1.0000', 'GBP': '0.7400', 'ZAR': '17.7500'}
+    for currency_code, rate in rates.items():
+        ExchangeRate.objects.create(currency_code=currency_code, rate_to_usd=Decimal(rate))
+
+
+settled = []
+
+
+def record_settlement(transaction):
+    settled.append(transaction.transaction_id)
+
+
+def failing_settlement(transaction):
+    raise RuntimeError('payout rejected')
+
+
+def spend_tokens(location, attempts):
+    # Runs in a child process: one "worker" hammering a bucket in the shared cache
+    from django.core.cache.backends.redis import RedisCache
+    shared = RedisCache(location, {})
+    return sum(take_token(shared, 'throttle-test:bucket', 100, 3600) == 0 for _ in range(attempts))
+
+
+def spend_local_tokens(attempts):
+    # Runs in a child process against its own copy of a LocMemCache
+    local = LocMemCache('throttle-per-process', {})
+    return sum(take_token(local, 'throttle-test:bucket', 100, 3600) == 0 for _ in range(attempts))
+
+
+class RateCacheTests(TestCase):
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        rate_cache.reset_stats()
+        ExchangeRateService._last_refresh = None
+
+    def test_quotes_are_served_from_the_snapshot(self):
+        ExchangeRateService.get_rate('GBP')
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                self.assertEqual(ExchangeRateService.get_rate('GBP'), Decimal('0.7400'))
+        self.assertEqual(rate_cache.stats()['misses'], 1)
+        self.assertEqual(rate_cache.stats()['hits'], 10)
+
+    def test_update_rates_invalidates_the_snapshot(self):
+        ExchangeRateService.get_rate('GBP')
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', return_value={'GBP': Decimal('0.8000')}):
+            ExchangeRateService.update_rates()
+        self.assertEqual(ExchangeRateService.get_rate('GBP'), Decimal('0.8000'))
+
+    def test_admin_edits_invalidate_the_snapshot(self):
+        ExchangeRateService.get_rate('ZAR')
+        ExchangeRate.objects.filter(currency_code='ZAR').update(rate_to_usd=Decimal('18.0000'))
+        self.assertEqual(ExchangeRateService.get_rate('ZAR'), Decimal('17.7500'))
+        rate = ExchangeRate.objects.get(currency_code='ZAR')
+        rate.save()
+        self.assertEqual(ExchangeRateService.get_rate('ZAR'), Decimal('18.0000'))
+
+    @override_settings(RATE_CACHE={'TTL': 60, 'STALE_TTL': 300, 'BACKGROUND_REVALIDATE': False})
+    def test_stale_snapshot_is_served_while_it_is_revalidated(self):
+        ExchangeRateService.get_rate('GBP')
+        ExchangeRate.objects.filter(currency_code='GBP').update(rate_to_usd=Decimal('0.9000'))
+        with mock.patch('api.rate_cache.time.time', return_value=time.time() + 120):
+            self.assertEqual(ExchangeRateService.get_rate('GBP'), Decimal('0.7400'))
+            self.assertEqual(ExchangeRateService.get_rate('GBP'), Decimal('0.9000'))
+        self.assertEqual(rate_cache.stats()['stale_hits'], 1)
+
+    @override_settings(RATE_CACHE={'TTL': 60, 'STALE_TTL': 0})
+    def test_expired_snapshot_is_reloaded(self):
+        ExchangeRateService.get_rate('GBP')
+        with mock.patch('api.rate_cache.time.time', return_value=time.time() + 120):
+            ExchangeRateService.get_rate('GBP')
+        self.assertEqual(rate_cache.stats()['misses'], 2)
+
+    @override_settings(
+        RATE_CACHE={'CACHE_ALIAS': 'default'},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rate-cache-tests'}},
+    )
+    def test_shared_cache_backend(self):
+        ExchangeRateService.get_rate('GBP')
+        with self.assertNumQueries(0):
+            self.assertEqual(ExchangeRateService.get_rate('ZAR'), Decimal('17.7500'))
+        rate_cache.invalidate()
+        with self.assertNumQueries(1):
+            ExchangeRateService.get_rate('ZAR')
+
+    @override_settings(RATE_CACHE={'ENABLED': False})
+    def test_disabled_cache_reads_the_table(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(ExchangeRateService.get_rate('GBP'), Decimal('0.7400'))
+
+    def test_calculation_uses_cached_rate(self):
+        result = TransactionService.calculate_transaction(Decimal('100.00'), 'GBP')
+        self.assertEqual(result['exchange_rate'], Decimal('0.7400'))
+        self.assertEqual(result['final_amount'], Decimal('66.60'))
+
+
+class RateRefresherTests(TestCase):
+    def test_backoff_grows_on_failure_and_resets_on_success(self):
+        refresher = RateRefresher(interval=10, jitter=0, max_backoff=60)
+        with mock.patch.object(ExchangeRateService, 'update_rates', return_value=False):
+            for expected in (20, 40, 60, 60):
+                refresher.refresh()
+                self.assertEqual(refresher.next_delay(), expected)
+        with mock.patch.object(ExchangeRateService, 'update_rates', return_value=True):
+            refresher.refresh()
+        self.assertEqual(refresher.next_delay(), 10)
+
+    def test_exceptions_count_as_failures(self):
+        refresher = RateRefresher(interval=10, jitter=0)
+        with mock.patch.object(ExchangeRateService, 'update_rates', side_effect=RuntimeError):
+            with self.assertLogs('api.refresher', 'ERROR'):
+                self.assertFalse(refresher.refresh())
+        self.assertEqual(refresher.failures, 1)
+
+    def test_jitter_stays_within_bounds(self):
+        refresher = RateRefresher(interval=100, jitter=0.2)
+        for _ in range(100):
+            self.assertTrue(80 <= refresher.next_delay() <= 120)
+
+
+class ExchangeRateListTests(APITestCase):
+    def test_list_serves_stored_rates_without_calling_upstream(self):
+        create_rates()
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api') as fetch:
+            response = self.client.get('/api/exchange-rates/')
+        fetch.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['currency_code'] for row in response.data}, {'GBP', 'ZAR'})
+        self.assertFalse(any(row['is_stale'] for row in response.data))
+        self.assertIn('last_updated', response.data[0])
+
+    @override_settings(RATE_REFRESH={'STALE_AFTER': 60})
+    def test_old_rates_are_flagged_stale(self):
+        create_rates(GBP='0.7400')
+        ExchangeRate.objects.update(last_updated=timezone.now() - timedelta(minutes=5))
+        response = self.client.get('/api/exchange-rates/')
+        self.assertTrue(response.data[0]['is_stale'])
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        create_rates()
+        self.ad = Advertisement.objects.create(title='Ad', description='Send more')
+
+    def test_list_sets_validators_and_cache_control(self):
+        response = self.client.get('/api/exchange-rates/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertNotIn('Last-Modified', response)
+        self.assertTrue({'Accept', 'Host'} <= {header.strip() for header in response['Vary'].split(',')})
+        self.assertIn('max-age=30', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_matching_etag_returns_304_without_serializing(self):
+        etag = self.client.get('/api/advertisements/')['ETag']
+        with mock.patch('api.views.AdvertisementSerializer') as serializer:
+            response = self.client.get('/api/advertisements/', HTTP_IF_NONE_MATCH=etag)
+        serializer.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_if_modified_since_alone_never_hides_a_deleted_row(self):
+        Advertisement.objects.create(title='Second', description='Send more', order=1)
+        since = http_date(time.time() + 60)
+        self.ad.delete()
+        response = self.client.get('/api/advertisements/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ad['title'] for ad in response.data], ['Second'])
+
+    def test_rate_update_changes_etag(self):
+        etag = self.client.get('/api/exchange-rates/')['ETag']
+        ExchangeRateService.store_rates({'GBP': Decimal('0.7500')})
+        response = self.client.get('/api/exchange-rates/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(RATE_REFRESH={'STALE_AFTER': 60})
+    def test_rates_going_stale_changes_etag(self):
+        etag = self.client.get('/api/exchange-rates/')['ETag']
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(minutes=5)):
+            response = self.client.get('/api/exchange-rates/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(row['is_stale'] for row in response.data))
+
+    def test_deactivating_an_ad_changes_etag(self):
+        etag = self.client.get('/api/advertisements/')['ETag']
+        self.ad.is_active = False
+        self.ad.save()
+        response = self.client.get('/api/advertisements/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    @override_settings(HTTP_CACHE={'RESPONSE_CACHE': True})
+    def test_response_cache_serves_body_by_version(self):
+        cache.clear()
+        first = self.client.get('/api/advertisements/')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/advertisements/')
+        # Only the version aggregate runs
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(second.data, first.data)
+
+        self.ad.title = 'New title'
+        self.ad.save()
+        self.assertEqual(self.client.get('/api/advertisements/').data[0]['title'], 'New title')
+
+    @override_settings(HTTP_CACHE={'RESPONSE_CACHE': True}, ALLOWED_HOSTS=['testserver', 'ads.example.com'])
+    def test_response_cache_and_etag_are_per_host(self):
+        cache.clear()
+        Advertisement.objects.filter(pk=self.ad.pk).update(image='ads/ad.png')
+        first = self.client.get('/api/advertisements/')
+        other = self.client.get('/api/advertisements/', HTTP_HOST='ads.example.com', secure=True)
+        self.assertEqual(first.data[0]['image_url'], 'http://testserver/media/ads/ad.png')
+        self.assertEqual(other.data[0]['image_url'], 'https://ads.example.com/media/ads/ad.png')
+        self.assertNotEqual(first['ETag'], other['ETag'])
+
+
+class RefreshCoalescingTests(TransactionTestCase):
+    def setUp(self):
+        rate_cache.invalidate()
+        ExchangeRateService._last_refresh = None
+        self.calls = 0
+
+    def slow_fetch(self):
+        self.calls += 1
+        time.sleep(0.2)
+        return {'USD': Decimal('1'), 'GBP': Decimal('0.74'), 'ZAR': Decimal('17.75')}
+
+    def run_concurrently(self, func, workers=20):
+        results = []
+        barrier = threading.Barrier(workers)
+
+        def worker():
+            barrier.wait()
+            try:
+                results.append(func())
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_burst_of_misses_triggers_one_upstream_call(self):
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', side_effect=self.slow_fetch):
+            results = self.run_concurrently(lambda: ExchangeRateService.get_rate('GBP'))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [Decimal('0.7400')] * 20)
+        self.assertEqual(ExchangeRate.objects.count(), 3)
+
+    def test_one_upstream_call_per_refresh_window(self):
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', side_effect=self.slow_fetch):
+            self.run_concurrently(ExchangeRateService.update_rates)
+            self.run_concurrently(ExchangeRateService.update_rates)
+            self.assertEqual(self.calls, 1)
+            ExchangeRateService._last_refresh -= 60
+            self.run_concurrently(ExchangeRateService.update_rates)
+        self.assertEqual(self.calls, 2)
+
+    def test_failed_refresh_is_not_cached(self):
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', return_value=None):
+            self.assertFalse(ExchangeRateService.update_rates())
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', side_effect=self.slow_fetch):
+            self.assertTrue(ExchangeRateService.update_rates())
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(
+        RATE_REFRESH={'LOCK_CACHE_ALIAS': 'default'},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'refresh-lock-tests'}},
+    )
+    def test_cross_process_lock_skips_refresh_held_elsewhere(self):
+        from django.core.cache import cache
+        cache.add(ExchangeRateService.REFRESH_LOCK_KEY, 1, 10)
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', side_effect=self.slow_fetch):
+            self.assertTrue(ExchangeRateService.update_rates())
+            self.assertEqual(self.calls, 0)
+            cache.delete(ExchangeRateService.REFRESH_LOCK_KEY)
+            ExchangeRateService.update_rates()
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(cache.get(ExchangeRateService.REFRESH_LOCK_KEY))
+
+    @override_settings(
+        RATE_REFRESH={'LOCK_CACHE_ALIAS': 'default'},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'refresh-lock-tests'}},
+    )
+    def test_cross_process_lock_is_released_when_storing_fails(self):
+        from django.core.cache import cache
+        from django.db import OperationalError
+        cache.delete(ExchangeRateService.REFRESH_LOCK_KEY)
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', side_effect=self.slow_fetch):
+            with mock.patch.object(ExchangeRateService, 'store_rates', side_effect=OperationalError('database is locked')):
+                with self.assertRaises(OperationalError):
+                    ExchangeRateService.update_rates()
+            self.assertIsNone(cache.get(ExchangeRateService.REFRESH_LOCK_KEY))
+            self.assertTrue(ExchangeRateService.update_rates())
+        self.assertEqual(self.calls, 2)
+
+
+class RateProviderTests(TestCase):
+    def fake_response(self, payload):
+        response = mock.Mock()
+        response.json.return_value = payload
+        response.raise_for_status.return_value = None
+        return response
+
+    def test_mockapi_provider_parses_nested_payload(self):
+        provider = MockApiRateProvider()
+        payload = [{'USD': 1}, {'GBP': 0.74}, {'ZAR': 17.75}]
+        with mock.patch.object(provider.session, 'get', return_value=self.fake_response(payload)) as get:
+            rates = provider.fetch_rates()
+        get.assert_called_once_with(provider.url, timeout=10)
+        self.assertEqual(rates, {'USD': Decimal('1'), 'GBP': Decimal('0.74'), 'ZAR': Decimal('17.75')})
+
+    def test_mockapi_provider_reuses_a_retrying_session(self):
+        provider = MockApiRateProvider(retries=2, backoff_factor=0.1)
+        adapter = provider.session.get_adapter(provider.url)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertEqual(adapter.max_retries.backoff_factor, 0.1)
+
+    def test_errors_are_wrapped_and_counted(self):
+        provider = MockApiRateProvider()
+        errors = REGISTRY['rate_provider_errors_total']
+        before = errors.value(provider='mockapi', reason='ConnectionError')
+        with mock.patch.object(provider.session, 'get', side_effect=ConnectionError('down')):
+            with self.assertRaises(RateProviderError):
+                provider.fetch_rates()
+        self.assertEqual(errors.value(provider='mockapi', reason='ConnectionError'), before + 1)
+
+    def test_latency_is_recorded(self):
+        latency = REGISTRY['rate_provider_request_seconds']
+        before = latency.snapshot(provider='static', outcome='success')['count']
+        with override_settings(RATE_PROVIDER={'CLASS': 'api.providers.StaticRateProvider', 'OPTIONS': {'rates': {'GBP': '0.74'}}}):
+            get_provider().fetch_rates()
+        self.assertEqual(latency.snapshot(provider='static', outcome='success')['count'], before + 1)
+
+    @override_settings(RATE_PROVIDER={'CLASS': 'api.providers.StaticRateProvider', 'OPTIONS': {'rates': {'GBP': '0.74'}}})
+    def test_service_uses_configured_provider(self):
+        self.assertEqual(ExchangeRateService.fetch_rates_from_api(), {'GBP': Decimal('0.74')})
+
+    def test_service_returns_none_when_provider_fails(self):
+        with mock.patch('api.services.get_provider') as provider:
+            provider.return_value.fetch_rates.side_effect = RateProviderError('boom')
+            with self.assertLogs('api.services', 'WARNING'):
+                self.assertIsNone(ExchangeRateService.fetch_rates_from_api())
+
+
+class CircuitBreakerTests(TestCase):
+    def fail(self):
+        raise RateProviderError('down')
+
+    def test_opens_after_threshold_and_recovers_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        for _ in range(2):
+            with self.assertRaises(RateProviderError):
+                breaker.call(self.fail)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        calls = mock.Mock(return_value='ok')
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(calls)
+        calls.assert_not_called()
+
+        breaker.opened_at -= 30
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(breaker.call(calls), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_call_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        with self.assertRaises(RateProviderError):
+            breaker.call(self.fail)
+        breaker.opened_at -= 30
+        with self.assertRaises(RateProviderError):
+            breaker.call(self.fail)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class StoreRatesTests(TestCase):
+    def test_inserts_then_skips_unchanged_rates(self):
+        self.assertEqual(ExchangeRateService.store_rates({'GBP': Decimal('0.74'), 'ZAR': Decimal('17.75')}), 2)
+        self.assertEqual(ExchangeRateService.store_rates({'GBP': Decimal('0.7400'), 'ZAR': Decimal('18.00')}), 1)
+        self.assertEqual(ExchangeRate.objects.get(currency_code='ZAR').rate_to_usd, Decimal('18.0000'))
+        self.assertEqual(ExchangeRate.objects.count(), 2)
+
+    def test_unchanged_rates_are_marked_fresh(self):
+        ExchangeRateService.store_rates({'GBP': Decimal('0.74')})
+        ExchangeRate.objects.update(last_updated=timezone.now() - timedelta(hours=1))
+        self.assertEqual(ExchangeRateService.store_rates({'GBP': Decimal('0.74')}), 0)
+        self.assertLess(timezone.now() - ExchangeRate.objects.get().last_updated, timedelta(minutes=1))
+
+    def test_hundreds_of_currencies_in_constant_queries(self):
+        from .benchmarks import synthetic_feed
+        feed = synthetic_feed(200)
+        # savepoint, SELECT, INSERT ... ON CONFLICT, history INSERT, release
+        with self.assertNumQueries(5):
+            self.assertEqual(ExchangeRateService.store_rates(feed), 200)
+        self.assertEqual(ExchangeRate.objects.count(), 200)
+
+    def test_update_rates_filters_configured_currencies(self):
+        feed = {'USD': Decimal('1'), 'GBP': Decimal('0.74'), 'EUR': Decimal('0.92')}
+        ExchangeRateService._last_refresh = None
+        with mock.patch.object(ExchangeRateService, 'fetch_rates_from_api', return_value=feed):
+            self.assertTrue(ExchangeRateService.update_rates())
+        self.assertEqual(set(ExchangeRate.objects.values_list('currency_code', flat=True)), {'USD', 'GBP'})
+
+
+class RateHistoryTests(APITestCase):
+    def setUp(self):
+        self.t0 = timezone.now() - timedelta(days=30)
+        for hours, rate in ((0, '0.7000'), (1, '0.7100'), (2, '0.7200')):
+            ExchangeRateHistory.objects.create(
+                currency_code='GBP', rate_to_usd=Decimal(rate), effective_at=self.t0 + timedelta(hours=hours)
+            )
+
+    def test_rate_as_of(self):
+        self.assertIsNone(RateHistoryService.rate_as_of('GBP', self.t0 - timedelta(seconds=1)))
+        self.assertEqual(RateHistoryService.rate_as_of('GBP', self.t0), Decimal('0.7000'))
+        self.assertEqual(RateHistoryService.rate_as_of('GBP', self.t0 + timedelta(minutes=90)), Decimal('0.7100'))
+        self.assertEqual(RateHistoryService.rate_as_of('GBP', timezone.now()), Decimal('0.7200'))
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_rate_as_of_uses_the_lookup_index(self):
+        queryset = ExchangeRateHistory.objects.filter(currency_code='GBP', effective_at__lte=self.t0).order_by('-effective_at')
+        self.assertIn('rate_history_lookup_idx', queryset.explain())
+
+    def test_series_includes_opening_point(self):
+        start = self.t0 + timedelta(minutes=30)
+        points = RateHistoryService.rate_series('GBP', start, self.t0 + timedelta(hours=5))
+        self.assertEqual(points[0], (start, Decimal('0.7000')))
+        self.assertEqual([rate for _, rate in points], [Decimal('0.7000'), Decimal('0.7100'), Decimal('0.7200')])
+
+    def test_store_rates_appends_only_changes(self):
+        ExchangeRateHistory.objects.all().delete()
+        ExchangeRateService.store_rates({'GBP': Decimal('0.74'), 'ZAR': Decimal('17.75')})
+        ExchangeRateService.store_rates({'GBP': Decimal('0.74'), 'ZAR': Decimal('17.80')})
+        self.assertEqual(ExchangeRateHistory.objects.filter(currency_code='GBP').count(), 1)
+        self.assertEqual(ExchangeRateHistory.objects.filter(currency_code='ZAR').count(), 2)
+
+    def test_saving_a_rate_records_history_only_when_it_changes(self):
+        ExchangeRateHistory.objects.all().delete()
+        rate = ExchangeRate.objects.create(currency_code='GBP', rate_to_usd=Decimal('0.7400'))
+        rate.save()
+        rate.rate_to_usd = '0.7400'
+        rate.save()
+        rate.rate_to_usd = Decimal('0.7500')
+        rate.save()
+        self.assertEqual(
+            list(ExchangeRateHistory.objects.order_by('effective_at').values_list('rate_to_usd', flat=True)),
+            [Decimal('0.7400'), Decimal('0.7500')],
+        )
+
+    def test_prune_expires_and_downsamples(self):
+        old = timezone.now() - timedelta(days=400)
+        ExchangeRateHistory.objects.create(currency_code='GBP', rate_to_usd=Decimal('0.6'), effective_at=old)
+        for minutes in (5, 10, 15):
+            ExchangeRateHistory.objects.create(
+                currency_code='GBP', rate_to_usd=Decimal('0.7'), effective_at=self.t0 + timedelta(minutes=minutes)
+            )
+        expired, downsampled = RateHistoryService.prune(
+            retention=timedelta(days=365), downsample_after=timedelta(days=7), bucket=timedelta(hours=1)
+        )
+        self.assertEqual((expired, downsampled), (1, 3))
+        self.assertEqual(ExchangeRateHistory.objects.count(), 3)
+
+    def test_history_endpoint(self):
+        start = (self.t0 - timedelta(hours=1)).isoformat()
+        response = self.client.get('/api/exchange-rates/history/', {'currency': 'gbp', 'start': start})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['rate_to_usd'] for p in response.data['points']], ['0.7000', '0.7100', '0.7200'])
+        self.assertEqual(self.client.get('/api/exchange-rates/history/').status_code, 400)
+        self.assertEqual(self.client.get('/api/exchange-rates/history/', {'currency': 'GBP', 'end': 'soon'}).status_code, 400)
+        # Well-formed but not a real date
+        response = self.client.get('/api/exchange-rates/history/', {'currency': 'GBP', 'start': '2024-02-30T00:00'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'start': ['Enter a valid ISO 8601 datetime.']})
+
+    def test_history_endpoint_rejects_reversed_ranges_and_caps_the_points(self):
+        response = self.client.get('/api/exchange-rates/history/', {
+            'currency': 'GBP', 'start': self.t0.isoformat(), 'end': (self.t0 - timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'end': ['Must not be before start.']})
+        
+        start = (self.t0 - timedelta(hours=1)).isoformat()
+        with override_settings(RATE_HISTORY={'MAX_POINTS': 2}):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/exchange-rates/history/', {'currency': 'GBP', 'start': start})
+        self.assertTrue(all('LIMIT' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual([p['rate_to_usd'] for p in response.data['points']], ['0.7000', '0.7100'])
+        self.assertTrue(response.data['truncated'])
+        response = self.client.get('/api/exchange-rates/history/', {'currency': 'GBP', 'start': start})
+        self.assertFalse(response.data['truncated'])
+
+
+class TransactionHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('parent')
+        self.client.force_authenticate(self.user)
+        create_transactions(self.user, 25)
+        # Rows sharing a timestamp must still page deterministically
+        create_transactions(self.user, 5, created_at=timezone.now() - timedelta(minutes=10, seconds=30))
+        create_transactions(User.objects.create_user('other'), 3)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen, cursor, pages = [], '', 0
+        while cursor is not None:
+            response = self.client.get('/api/transactions/history/', {'cursor': cursor, 'page_size': 7})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('total_pages', response.data)
+            seen += [row['id'] for row in response.data['transactions']]
+            cursor = response.data['next_cursor']
+            self.assertEqual(response.data['has_more'], cursor is not None)
+            pages += 1
+        self.assertEqual(pages, 5)
+        expected = Transaction.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(pk) for pk in expected])
+
+    def test_cursor_page_skips_count(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/transactions/history/', {'cursor': ''})
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/transactions/history/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/transactions/history/', {'cursor': '', 'page_size': 'ten'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'page_size': ['A valid integer is required.']})
+
+    def test_page_number_mode_is_unchanged(self):
+        response = self.client.get('/api/transactions/history/', {'page': 2})
+        self.assertEqual(response.data['total_pages'], 3)
+        self.assertEqual(response.data['current_page'], 2)
+        self.assertTrue(response.data['has_next'])
+        self.assertEqual(len(response.data['transactions']), 10)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_keyset_query_uses_the_user_index(self):
+        from .pagination import encode_cursor, seek
+        first = Transaction.objects.filter(user=self.user).order_by('-created_at', '-id').first()
+        queryset = seek(Transaction.objects.filter(user=self.user), encode_cursor(first.created_at, first.id))
+        plan = queryset[:11].explain()
+        self.assertIn('transaction_user_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans and index names are SQLite-specific')
+class TransactionQueryPlanTests(APITestCase):
+    """
+    Guard against full table scans on Transaction: every query these
+    screens run against api_transaction must be answered from an index.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        self.user = User.objects.create_user('parent')
+        create_transactions(self.user, 30)
+        create_transactions(self.admin, 5, target_currency='ZAR', status='PENDING', recipient_name='Sipho')
+
+    def transaction_plans(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        selects = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "api_transaction"' in query['sql'] and 'ORDER BY' in query['sql']
+        ]
+        self.assertTrue(selects, 'No ordered transaction queries were captured')
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                yield '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def assertIndexed(self, func, index_name, allow_sort=False):
+        for plan in self.transaction_plans(func):
+            self.assertIn(index_name, plan)
+            for line in plan.splitlines():
+                if 'api_transaction' in line:
+                    self.assertIn('USING', line, f'Full scan on api_transaction:\n{plan}')
+            if not allow_sort:
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_history_pages(self):
+        self.client.force_authenticate(self.user)
+        self.assertIndexed(lambda: self.client.get('/api/transactions/history/', {'page': 2}), 'transaction_user_created_idx')
+        self.assertIndexed(lambda: self.client.get('/api/transactions/history/', {'cursor': ''}), 'transaction_user_created_idx')
+
+    def test_admin_list_and_filters(self):
+        self.client.force_login(self.admin)
+        url = '/admin/api/transaction/'
+        self.assertIndexed(lambda: self.client.get(url), 'transaction_created_idx')
+        self.assertIndexed(lambda: self.client.get(url, {'status__exact': 'PENDING'}), 'transaction_status_created_idx')
+        self.assertIndexed(lambda: self.client.get(url, {'target_currency__exact': 'ZAR'}), 'transaction_currency_idx')
+        since = (timezone.now() - timedelta(days=7)).isoformat()
+        self.assertIndexed(lambda: self.client.get(url, {'created_at__gte': since}), 'transaction_created_idx')
+
+    def test_admin_search(self):
+        self.client.force_login(self.admin)
+        url = '/admin/api/transaction/'
+        transaction = Transaction.objects.filter(user=self.user).first()
+        response = self.client.get(url, {'q': str(transaction.transaction_id)})
+        self.assertEqual(list(response.context['cl'].result_list), [transaction])
+        self.assertIndexed(lambda: self.client.get(url, {'q': str(transaction.transaction_id)}), 'sqlite_autoindex_api_transaction_2')
+
+        # Without INDEXED_ONLY every other term is a substring search
+        for term, count in (('iph', 5), ('ARE', 30), (str(transaction.transaction_id)[4:12], 1), ('dmi', 5)):
+            response = self.client.get(url, {'q': term})
+            self.assertEqual(response.context['cl'].result_count, count, term)
+    
+    @override_settings(ADMIN_SEARCH={'INDEXED_ONLY': True})
+    def test_indexed_only_admin_search(self):
+        self.client.force_login(self.admin)
+        url = '/admin/api/transaction/'
+        for term in ('Sip', 'sIP', 'sipho'):
+            response = self.client.get(url, {'q': term})
+            self.assertEqual(response.context['cl'].result_count, 5)
+        for term in ('parent', 'Parent'):
+            response = self.client.get(url, {'q': term})
+            self.assertEqual(response.context['cl'].result_count, 30)
+        self.assertEqual(self.client.get(url, {'q': 'iph'}).context['cl'].result_count, 0)
+        self.assertIndexed(lambda: self.client.get(url, {'q': 'sip'}), 'transaction_recipient_idx', allow_sort=True)
+
+
+class SQLiteProfileTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_hook_applies_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite profile only')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+
+    def test_wal_mode_on_file_databases(self):
+        import tempfile
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': f'{directory}/wal.sqlite3'})
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+            finally:
+                wrapper.close()
+
+
+class TransactionBatchTests(APITestCase):
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        self.user = User.objects.create_user('employer')
+        self.client.force_authenticate(self.user)
+
+    def transfers(self, count):
+        return [
+            {'amount_usd': f'{10 + i}.00', 'target_currency': 'GBP' if i % 2 else 'ZAR', 'recipient_name': f'Student {i}'}
+            for i in range(count)
+        ]
+
+    def test_batch_is_one_insert_with_one_rate_lookup_per_currency(self):
+        with mock.patch.object(ExchangeRateService, 'get_rate', wraps=ExchangeRateService.get_rate) as get_rate:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post('/api/transactions/send-batch/', {'transfers': self.transfers(40)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(get_rate.call_count, 2)
+        inserts = [q for q in context.captured_queries if q['sql'].startswith('INSERT INTO "api_transaction"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 40)
+
+        results = response.data['transactions']
+        self.assertEqual([r['recipient_name'] for r in results], [f'Student {i}' for i in range(40)])
+        single = TransactionService.calculate_transaction(Decimal('11.00'), 'GBP')
+        self.assertEqual(results[1]['final_amount'], single['final_amount'])
+        self.assertTrue(Transaction.objects.filter(transaction_id=results[1]['transaction_id']).exists())
+
+    def test_invalid_items_reject_the_whole_batch(self):
+        transfers = self.transfers(3)
+        transfers[1]['amount_usd'] = '5.00'
+        response = self.client.post('/api/transactions/send-batch/', {'transfers': transfers}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['transfers'][0], {})
+        self.assertIn('amount_usd', response.data['transfers'][1])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_missing_rate_rejects_the_whole_batch(self):
+        ExchangeRate.objects.filter(currency_code='ZAR').delete()
+        with mock.patch.object(ExchangeRateService, 'update_rates', return_value=False):
+            response = self.client.post('/api/transactions/send-batch/', {'transfers': self.transfers(4)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_batch_size_limits(self):
+        for transfers in ([], self.transfers(101)):
+            response = self.client.post('/api/transactions/send-batch/', {'transfers': transfers}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class IdempotencyTests(APITestCase):
+    body = {'amount_usd': '25.00', 'target_currency': 'GBP', 'recipient_name': 'Tendai'}
+
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        cache.clear()
+        self.user = User.objects.create_user('retrier')
+        self.client.force_authenticate(self.user)
+
+    def send(self, key='key-1', **changes):
+        return self.client.post('/api/transactions/send/', {**self.body, **changes}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response_without_recomputing(self):
+        first = self.send()
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+        with mock.patch.object(TransactionService, 'calculate_transaction') as calculate:
+            with CaptureQueriesContext(connection) as queries:
+                retry = self.send()
+        calculate.assert_not_called()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_replay_falls_back_to_the_database(self):
+        first = self.send()
+        cache.clear()
+        retry = self.send()
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.send()
+        response = self.send(amount_usd='26.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_equivalent_amounts_count_as_the_same_request(self):
+        self.send()
+        self.assertEqual(self.send(amount_usd='25').status_code, 201)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self.send()
+        self.client.force_authenticate(User.objects.create_user('other'))
+        self.assertNotIn('Idempotent-Replayed', self.send())
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client.post('/api/transactions/send/', self.body, format='json')
+        self.client.post('/api/transactions/send/', self.body, format='json')
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_failed_send_leaves_the_key_unclaimed(self):
+        with mock.patch.object(TransactionService, 'create_transaction', side_effect=ValueError('no rate')):
+            with self.assertRaises(ValueError):
+                self.send()
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.send().status_code, 201)
+
+    @override_settings(IDEMPOTENCY={'TTL': 60})
+    def test_expired_key_sends_again_and_is_pruned(self):
+        self.send()
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        cache.clear()
+        self.assertNotIn('Idempotent-Replayed', self.send())
+        self.assertEqual(Transaction.objects.count(), 2)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(IdempotencyService.prune(), 1)
+
+    def test_invalid_key(self):
+        self.assertEqual(self.send(key='x' * 256).status_code, 400)
+
+    def test_unique_constraint_resolves_a_race_the_lock_missed(self):
+        first = self.send()
+        cache.clear()
+        # The loser read the table before the winner committed
+        stored = IdempotencyService._stored
+        with mock.patch.object(IdempotencyService, '_stored', side_effect=[None, stored(self.user, 'key-1', {'TTL': 60})]):
+            retry = self.send()
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY={'WAIT': 0.1})
+    def test_duplicate_still_running_gets_409(self):
+        lock_key = IdempotencyService.cache_key(self.user, 'key-1', {'KEY_PREFIX': 'idempotency'}) + ':lock'
+        cache.add(lock_key, True, 10)
+        self.assertEqual(self.send().status_code, 409)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+
+class IdempotencyConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        cache.clear()
+        self.user = User.objects.create_user('double-clicker')
+
+    def test_concurrent_duplicates_have_one_winner(self):
+        workers = 16
+        barrier = threading.Barrier(workers)
+        responses = []
+
+        def worker():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                responses.append(client.post(
+                    '/api/transactions/send/',
+                    {'amount_usd': '40.00', 'target_currency': 'ZAR', 'recipient_name': 'Rudo'},
+                    format='json', HTTP_IDEMPOTENCY_KEY='burst',
+                ))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([r.status_code for r in responses], [201] * workers)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(len({r.data['transaction_id'] for r in responses}), 1)
+        self.assertEqual(sum(1 for r in responses if 'Idempotent-Replayed' not in r), 1)
+
+
+class SettlementTests(APITestCase):
+    transfer = {'amount_usd': '30.00', 'target_currency': 'ZAR', 'recipient_name': 'Chipo'}
+
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        settled.clear()
+        self.user = User.objects.create_user('sender')
+        self.client.force_authenticate(self.user)
+
+    def send(self):
+        return self.client.post('/api/transactions/send/', self.transfer, format='json')
+
+    def poll(self, transaction_id):
+        return self.client.get(f'/api/transactions/status/{transaction_id}/')
+
+    @override_settings(SETTLEMENT={'HANDLER': 'api.tests.record_settlement'})
+    def test_send_queues_and_worker_settles(self):
+        response = self.send()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'PENDING')
+        transaction_id = response.data['transaction_id']
+        self.assertEqual(settled, [])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.poll(transaction_id).data['status'], 'PENDING')
+        self.assertEqual(len(queries), 1)
+
+        self.assertEqual(SettlementWorker(workers=1).run_once(), 1)
+        self.assertEqual([str(t) for t in settled], [transaction_id])
+        body = self.poll(transaction_id).data
+        self.assertEqual(body['status'], 'COMPLETED')
+        self.assertEqual(str(body['transaction_id']), transaction_id)
+        self.assertEqual(SettlementWorker(workers=1).run_once(), 0)
+
+    @override_settings(SETTLEMENT={'HANDLER': 'api.tests.failing_settlement', 'MAX_ATTEMPTS': 2})
+    def test_failed_settlement_is_retried_then_marked_failed(self):
+        self.send()
+        with self.assertLogs('api.services', 'ERROR'):
+            SettlementWorker(workers=1).run_once()
+        transaction = Transaction.objects.get()
+        self.assertEqual((transaction.status, transaction.attempts), ('PENDING', 1))
+        with self.assertLogs('api.services', 'ERROR'):
+            SettlementWorker(workers=1).run_once()
+        transaction.refresh_from_db()
+        self.assertEqual((transaction.status, transaction.attempts), ('FAILED', 2))
+
+    @override_settings(SETTLEMENT={'LEASE': 60})
+    def test_abandoned_claim_is_taken_over(self):
+        self.send()
+        [stale] = SettlementService.claim(10)
+        self.assertEqual(SettlementService.claim(10), [])
+        Transaction.objects.update(claimed_at=timezone.now() - timedelta(minutes=5))
+        stale.claimed_at = timezone.now() - timedelta(minutes=5)
+        [fresh] = SettlementService.claim(10)
+        self.assertEqual(fresh.attempts, 2)
+        self.assertTrue(SettlementService.settle(fresh))
+        # The worker that lost its lease can't record an outcome
+        self.assertFalse(SettlementService.settle(stale))
+        self.assertEqual(Transaction.objects.get().status, 'COMPLETED')
+
+    def test_claims_in_the_same_clock_tick_do_not_overlap(self):
+        self.send()
+        self.send()
+        with mock.patch('api.services.timezone.now', return_value=timezone.now()):
+            first, second = SettlementService.claim(1), SettlementService.claim(1)
+        self.assertEqual((len(first), len(second)), (1, 1))
+        self.assertNotEqual(first[0].pk, second[0].pk)
+        self.assertTrue(SettlementService.settle(first[0]))
+        self.assertTrue(SettlementService.settle(second[0]))
+
+    @override_settings(SETTLEMENT={'ASYNC': False, 'HANDLER': 'api.tests.record_settlement'})
+    def test_inline_settlement(self):
+        response = self.send()
+        self.assertEqual(response.data['status'], 'COMPLETED')
+        self.assertEqual(len(settled), 1)
+        self.assertEqual(SettlementService.claim(10), [])
+
+    def test_status_is_scoped_to_the_sender(self):
+        transaction_id = self.send().data['transaction_id']
+        self.assertEqual(self.poll('not-a-uuid').status_code, 404)
+        self.client.force_authenticate(User.objects.create_user('nosy'))
+        self.assertEqual(self.poll(transaction_id).status_code, 404)
+
+
+class SettlementWorkerConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Shared-cache in-memory SQLite fails concurrent writers instead of waiting; set SQLITE_TEST_PATH')
+
+    @override_settings(SETTLEMENT={'HANDLER': 'api.tests.record_settlement'})
+    def test_each_transfer_is_settled_exactly_once(self):
+        settled.clear()
+        user = User.objects.create_user('payroll')
+        create_transactions(user, 60, status='PENDING')
+        workers = [SettlementWorker(workers=3, batch_size=7) for _ in range(3)]
+        barrier = threading.Barrier(len(workers))
+
+        def drain(worker):
+            barrier.wait()
+            try:
+                while worker.run_once():
+                    pass
+            finally:
+                worker.stop()
+                connection.close()
+
+        threads = [threading.Thread(target=drain, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(settled), 60)
+        self.assertEqual(len(set(settled)), 60)
+        self.assertEqual(Transaction.objects.filter(status='COMPLETED', attempts=1).count(), 60)
+
+
+class TransactionSummaryTests(APITestCase):
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        self.user = User.objects.create_user('saver')
+        self.client.force_authenticate(self.user)
+    
+    def stored(self):
+        return list(
+            TransactionSummary.objects
+            .values('user_id', 'month', 'target_currency', *TransactionSummaryService.FIELDS)
+            .order_by('user_id', 'month', 'target_currency')
+        )
+    
+    def send_at(self, moment, user, amount, currency):
+        with mock.patch('django.utils.timezone.now', return_value=moment):
+            TransactionService.create_transaction(user, Money.coerce(Decimal(amount)), currency, 'Tendai')
+    
+    def test_incremental_totals_match_a_full_group_by(self):
+        other = User.objects.create_user('spender')
+        rng = random.Random(18)
+        for _ in range(40):
+            moment = timezone.now() - timedelta(days=rng.randrange(0, 120))
+            self.send_at(moment, rng.choice([self.user, other]), f'{rng.randrange(1000, 100000) / 100:.2f}',
+                         rng.choice(['GBP', 'ZAR']))
+        TransactionService.create_transactions(self.user, [
+            {'amount_usd': Money(1234), 'target_currency': 'ZAR', 'recipient_name': 'Rudo'},
+            {'amount_usd': Money(5678), 'target_currency': 'ZAR', 'recipient_name': 'Rudo'},
+        ])
+        
+        self.assertGreater(TransactionSummary.objects.count(), 4)
+        self.assertEqual(self.stored(), TransactionSummaryService.aggregate(Transaction.objects.all()))
+    
+    def test_summary_endpoint_serves_months_and_totals(self):
+        now = timezone.now()
+        last_month = now.replace(day=1) - timedelta(days=1)
+        self.send_at(now, self.user, '100.00', 'GBP')
+        self.send_at(now, self.user, '50.00', 'GBP')
+        self.send_at(last_month, self.user, '20.00', 'GBP')
+        self.send_at(now, self.user, '10.00', 'ZAR')
+        self.send_at(now, User.objects.create_user('stranger'), '999.00', 'GBP')
+        
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/transactions/summary/')
+        self.assertEqual(response.status_code, 200)
+        months = response.data['months']
+        self.assertEqual(
+            [(row['month'], row['target_currency'], row['transfer_count'], row['total_usd']) for row in months],
+            [
+                (now.date().replace(day=1).isoformat(), 'GBP', 2, '150.00'),
+                (now.date().replace(day=1).isoformat(), 'ZAR', 1, '10.00'),
+                (last_month.date().replace(day=1).isoformat(), 'GBP', 1, '20.00'),
+            ],
+        )
+        self.assertEqual(response.data['totals'][0], {
+            'target_currency': 'GBP', 'transfer_count': 3, 'total_usd': '170.00',
+            'total_fees': '17.00', 'total_final': '113.22',
+        })
+        
+        response = self.client.get('/api/transactions/summary/?currency=zar')
+        self.assertEqual([row['target_currency'] for row in response.data['months']], ['ZAR'])
+        self.assertEqual(self.client.get('/api/transactions/summary/?currency=EUR').status_code, 400)
+    
+    @override_settings(SETTLEMENT={'HANDLER': 'api.tests.failing_settlement', 'MAX_ATTEMPTS': 1})
+    def test_edits_deletes_and_failed_settlements_keep_rows_in_sync(self):
+        now = timezone.now()
+        for amount, currency in (('100.00', 'GBP'), ('50.00', 'GBP'), ('20.00', 'ZAR'), ('10.00', 'ZAR')):
+            self.send_at(now, self.user, amount, currency)
+        gbp, other_gbp, zar, other_zar = Transaction.objects.order_by('-amount_usd')
+        
+        gbp.target_currency = 'ZAR'
+        gbp.save()
+        other_gbp.recipient_name = 'Not a summary input'
+        with self.assertNumQueries(2):  # the stored row and the UPDATE itself; no summary writes
+            other_gbp.save()
+        Transaction.objects.filter(pk=zar.pk).delete()
+        with self.assertLogs('api.services', 'ERROR'):
+            [claimed] = SettlementService.claim(1)
+            SettlementService.settle(claimed)
+        
+        self.assertEqual(Transaction.objects.filter(status='FAILED').count(), 1)
+        self.assertEqual(self.stored(), TransactionSummaryService.aggregate(Transaction.objects.all()))
+        self.assertEqual(sum(row['transfer_count'] for row in self.stored()), 2)
+    
+    def test_rebuild_recomputes_rows_from_transactions(self):
+        now = timezone.now()
+        create_transactions(self.user, 3, created_at=now)
+        create_transactions(self.user, 2, created_at=now - timedelta(days=62), target_currency='ZAR')
+        self.assertEqual(TransactionSummary.objects.count(), 0)  # bulk inserts bypass the service
+        TransactionSummary.objects.create(
+            user=self.user, month=now.date().replace(day=1, year=2001), target_currency='GBP',
+            transfer_count=1, total_usd=Money(100), total_fees=Money(10), total_final=Money(60),
+        )
+        
+        call_command('rebuild_transaction_summaries', stdout=io.StringIO())
+        self.assertEqual(self.stored(), TransactionSummaryService.aggregate(Transaction.objects.all()))
+        self.assertEqual(sum(row['transfer_count'] for row in self.stored()), 5)
+        self.assertFalse(TransactionSummary.objects.filter(month__year=2001).exists())
+
+class TransactionExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now()
+        create_transactions(self.user, 3, created_at=self.now)
+        create_transactions(self.user, 2, created_at=self.now - timedelta(days=30), target_currency='ZAR')
+        create_transactions(User.objects.create_user('other'), 4, created_at=self.now)
+    
+    def export(self, query=''):
+        response = self.client.get(f'/api/transactions/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+    
+    def test_csv_export_streams_every_row_oldest_first(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.csv"')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual([row['target_currency'] for row in rows], ['ZAR', 'ZAR', 'GBP', 'GBP', 'GBP'])
+        self.assertEqual({row['username'] for row in rows}, {'exporter'})
+        self.assertEqual(rows[0]['amount_usd'], '100.00')
+    
+    def test_ndjson_export_matches_the_transaction_serializer(self):
+        _, body = self.export('?type=ndjson')
+        lines = [json.loads(line) for line in body.splitlines()]
+        newest = TransactionSerializer(Transaction.objects.filter(user=self.user).first()).data
+        self.assertEqual(len(lines), 5)
+        for field in ('transaction_id', 'created_at', 'amount_usd', 'exchange_rate', 'fee_amount', 'final_amount'):
+            self.assertEqual(lines[-1][field], newest[field])
+    
+    def test_csv_cells_cannot_start_a_formula(self):
+        Transaction.objects.filter(user=self.user).update(recipient_name='=HYPERLINK("http://example.com")')
+        Transaction.objects.filter(user=self.user, target_currency='ZAR').update(recipient_name='-Thandi')
+        _, body = self.export()
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual([row['recipient_name'] for row in rows[:3]], ["'-Thandi", "'-Thandi", '\'=HYPERLINK("http://example.com")'])
+        _, body = self.export('?type=ndjson')
+        self.assertEqual(json.loads(body.splitlines()[0])['recipient_name'], '-Thandi')
+    
+    @override_settings(EXPORT={'CHUNK_SIZE': 2})
+    def test_filters_by_date_and_currency(self):
+        _, body = self.export(f'?type=ndjson&start={(self.now - timedelta(days=1)).date().isoformat()}')
+        self.assertEqual(len(body.splitlines()), 3)
+        _, body = self.export('?currency=ZAR')
+        self.assertEqual(len(body.splitlines()), 3)  # header + 2
+        self.assertEqual(self.client.get('/api/transactions/export/?type=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/transactions/export/?start=2026-02-01&end=2026-01-01').status_code, 400)
+    
+    def test_admin_action_exports_the_selection(self):
+        admin = User.objects.create_superuser('finance', password='x')
+        self.client.force_login(admin)
+        selected = Transaction.objects.filter(target_currency='ZAR').values_list('pk', flat=True)
+        response = self.client.post('/admin/api/transaction/', {
+            'action': 'export_csv', '_selected_action': [str(pk) for pk in selected],
+        })
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['target_currency'] for row in rows], ['ZAR', 'ZAR'])
+
+class ValuesSerializerTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.client.force_authenticate(self.user)
+        rng = random.Random(20)
+        for i in range(25):
+            create_transactions(
+                self.user, 1, created_at=timezone.now() - timedelta(hours=i, microseconds=rng.randrange(10**6)),
+                amount_usd=Decimal(rng.randrange(1000, 1000000)) / 100, exchange_rate=Decimal('17.7500'),
+                fee_amount=Decimal('0.05'), final_amount=Decimal('1234567.89'), target_currency=rng.choice(['GBP', 'ZAR']),
+                status=rng.choice(['PENDING', 'PROCESSING', 'COMPLETED']), attempts=i % 3,
+                claimed_at=timezone.now() if i % 2 else None, recipient_name=f'Chipo "{i}" Moyo',
+            )
+    
+    def test_values_rows_render_byte_identical_json(self):
+        queryset = Transaction.objects.filter(user=self.user)
+        renderer = JSONRenderer()
+        expected = renderer.render(TransactionSerializer(queryset, many=True).data)
+        with self.assertNumQueries(1):
+            lean = renderer.render(TransactionSerializer.values_data(TransactionSerializer.values_queryset(queryset)))
+        self.assertEqual(lean, expected)
+    
+    def test_history_pages_match_the_model_serializer(self):
+        expected = TransactionSerializer(Transaction.objects.filter(user=self.user), many=True).data
+        for page in (1, 2, 3):
+            response = self.client.get(f'/api/transactions/history/?page={page}')
+            self.assertEqual(response.data['transactions'], expected[(page - 1) * 10:page * 10])
+        
+        cursor, rows = '', []
+        while cursor is not None:
+            data = self.client.get(f'/api/transactions/history/?cursor={cursor}&page_size=7').data
+            rows.extend(data['transactions'])
+            cursor = data['next_cursor']
+        self.assertEqual(rows, expected)
+
+class CachedAuthenticationTests(APITestCase):
+    url = '/api/transactions/summary/'
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bearer', password='secret-pass-123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+    
+    def test_repeat_requests_skip_the_user_query(self):
+        with self.assertNumQueries(2):  # user + summary
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+    
+    @override_settings(AUTH_CACHE={'ENABLED': False})
+    def test_disabled_cache_loads_the_user_every_time(self):
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                self.client.get(self.url)
+    
+    def test_deactivating_a_user_takes_effect_immediately(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+    
+    def test_deactivation_inside_a_transaction_outlives_a_racing_request(self):
+        self.client.get(self.url)
+        committed = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.user.is_active = False
+                self.user.save()
+                # A request on another connection before the commit caches the old row
+                cache.set(user_cache_key(self.user.pk, app_settings('AUTH_CACHE')), committed)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+    
+    def test_edits_and_deletes_invalidate_the_cached_user(self):
+        self.client.get(self.url)
+        User.objects.filter(pk=self.user.pk).update(first_name='Stale')  # no signal: served from cache
+        self.client.get(self.url)
+        self.user.first_name = 'Fresh'
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.wsgi_request.user.first_name, 'Fresh')
+        
+        self.user.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+class ThrottleTests(APITestCase):
+    transfer = {'amount_usd': '100.00', 'target_currency': 'GBP', 'recipient_name': 'Nyasha'}
+    
+    def setUp(self):
+        cache.clear()
+        create_rates()
+        rate_cache.invalidate()
+    
+    @override_settings(THROTTLE={'RATES': {'login': '3/min'}})
+    def test_login_is_limited_per_ip_with_retry_after(self):
+        credentials = {'username': 'nobody', 'password': 'wrong-password'}
+        for _ in range(3):
+            self.assertEqual(self.client.post('/api/auth/login/', credentials).status_code, 400)
+        response = self.client.post('/api/auth/login/', credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(response['Retry-After'], {'19', '20'})
+        self.assertEqual(self.client.post('/api/auth/login/', credentials, REMOTE_ADDR='10.0.0.2').status_code, 400)
+    
+    @override_settings(THROTTLE={'RATES': {'send': '2/min'}})
+    def test_send_is_limited_per_user(self):
+        first, second = User.objects.create_user('first'), User.objects.create_user('second')
+        self.client.force_authenticate(first)
+        statuses = [self.client.post('/api/transactions/send/', self.transfer, format='json').status_code
+                    for _ in range(3)]
+        self.assertEqual(statuses, [201, 201, 429])
+        # send-batch draws from the same bucket
+        batch = {'transfers': [self.transfer]}
+        self.assertEqual(self.client.post('/api/transactions/send-batch/', batch, format='json').status_code, 429)
+        self.client.force_authenticate(second)
+        self.assertEqual(self.client.post('/api/transactions/send/', self.transfer, format='json').status_code, 201)
+    
+    def test_bucket_refills_at_the_configured_rate_without_banking_idle_time(self):
+        bucket = LocMemCache('throttle-refill', {})
+        clock = [1_000_000.0]
+        with mock.patch('api.throttling.time.time', side_effect=lambda: clock[0]):
+            self.assertEqual([take_token(bucket, 'k', 4, 60) == 0 for _ in range(5)], [True] * 4 + [False])
+            self.assertAlmostEqual(take_token(bucket, 'k', 4, 60), 15, places=3)
+            clock[0] += 15
+            self.assertEqual([take_token(bucket, 'k', 4, 60) == 0 for _ in range(2)], [True, False])
+            clock[0] += 3600  # a long idle spell still only refills the 4 token capacity
+            self.assertEqual([take_token(bucket, 'k', 4, 60) == 0 for _ in range(5)], [True] * 4 + [False])
+    
+    def test_overlapping_requests_after_an_idle_spell_do_not_lock_the_bucket(self):
+        class OverlappingCache:
+            # Runs `overlap` between the first incr() and its caller seeing the result
+            def __init__(self, cache):
+                self.cache, self.overlap = cache, None
+            
+            def __getattr__(self, name):
+                return getattr(self.cache, name)
+            
+            def incr(self, key, delta=1):
+                tat = self.cache.incr(key, delta)
+                overlap, self.overlap = self.overlap, None
+                if overlap:
+                    overlap()
+                return tat
+        
+        bucket = OverlappingCache(LocMemCache('throttle-overlap', {}))
+        clock = [1_000_000.0]
+        with mock.patch('api.throttling.time.time', side_effect=lambda: clock[0]):
+            self.assertEqual(take_token(bucket, 'k', 4, 60), 0)
+            clock[0] += 50 * 60
+            bucket.overlap = lambda: self.assertEqual(take_token(bucket, 'k', 4, 60), 0)
+            self.assertEqual(take_token(bucket, 'k', 4, 60), 0)
+            clock[0] += 5 * 60
+            self.assertEqual([take_token(bucket, 'k', 4, 60) == 0 for _ in range(5)], [True] * 4 + [False])
+    
+    def test_concurrent_workers_never_exceed_the_capacity(self):
+        bucket = LocMemCache('throttle-threads', {})
+        allowed = []
+        
+        def worker():
+            allowed.append(sum(take_token(bucket, 'k', 100, 3600) == 0 for _ in range(50)))
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed), 100)
+    
+    @skipUnless(os.environ.get('THROTTLE_TEST_REDIS_URL'), 'set THROTTLE_TEST_REDIS_URL to check limits across processes')
+    def test_limit_holds_across_worker_processes(self):
+        location = os.environ['THROTTLE_TEST_REDIS_URL']
+        from django.core.cache.backends.redis import RedisCache
+        RedisCache(location, {}).delete('throttle-test:bucket')
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            allowed = pool.starmap(spend_tokens, [(location, 50)] * 4)
+        self.assertEqual(sum(allowed), 100)
+    
+    def test_locmem_limits_are_per_process(self):
+        # Why settings.THROTTLE needs a shared cache: each worker process
+        # keeps its own LocMemCache buckets, so N workers allow N times a rate
+        LocMemCache('throttle-per-process', {}).clear()
+        with multiprocessing.get_context('fork').Pool(2) as pool:
+            allowed = pool.map(spend_local_tokens, [150, 150])
+        self.assertEqual(allowed, [100, 100])
+        self.assertEqual(spend_local_tokens(150), 100)
+    
+    def test_throttle_check_is_cheap(self):
+        bucket = LocMemCache('throttle-latency', {})
+        start = time.perf_counter()
+        for i in range(2000):
+            take_token(bucket, f'k{i % 50}', 1000, 60)
+        self.assertLess((time.perf_counter() - start) / 2000, 0.0005)  # well under a millisecond
+
+class AdRenditionTests(APITestCase):
+    
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, AD_RENDITIONS={'ASYNC': False})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+    
+    def upload(self, width=800, height=400, name='banner.png'):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (width, height), (200, 40, 40, 255)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+    
+    def create_ad(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Advertisement.objects.create(title='Ad', description='Send more', image=self.upload(**kwargs))
+    
+    def test_saving_an_ad_renders_each_width_and_format_without_upscaling(self):
+        ad = self.create_ad()
+        ad.refresh_from_db()
+        files = ad.renditions['files']
+        self.assertEqual([(f['width'], f['type']) for f in files], [
+            (320, 'image/webp'), (320, 'image/jpeg'),
+            (640, 'image/webp'), (640, 'image/jpeg'),
+            (800, 'image/webp'), (800, 'image/jpeg'),
+        ])
+        with default_storage.open(files[2]['name']) as f:
+            self.assertEqual(Image.open(f).size, (640, 320))
+        self.assertRegex(files[0]['name'], r'^ads/renditions/[0-9a-f]{20}-320w\.webp$')
+        self.assertTrue(ad.renditions['placeholder'].startswith('data:image/jpeg;base64,'))
+    
+    def test_unchanged_image_is_not_rendered_again(self):
+        ad = self.create_ad()
+        ad.refresh_from_db()
+        with mock.patch('api.renditions.render') as render, self.captureOnCommitCallbacks(execute=True):
+            ad.title = 'Renamed'
+            ad.save()
+            generate(ad.pk)
+        render.assert_not_called()
+    
+    def test_api_lists_srcsets_and_falls_back_to_the_original(self):
+        self.create_ad()
+        Advertisement.objects.create(title='Plain', description='No image', order=1)
+        first, second = self.client.get('/api/advertisements/').json()
+        self.assertNotIn('renditions', first)
+        self.assertEqual(first['image_srcset']['image/webp'].count('w, '), 2)
+        self.assertRegex(first['image_src'], r'^http://testserver/media/ads/renditions/[0-9a-f]{20}-800w\.jpg$')
+        self.assertEqual((second['image_src'], second['image_srcset'], second['image_placeholder']), (None, {}, None))
+    
+    def test_renditions_of_a_replaced_image_are_not_served(self):
+        ad = self.create_ad()
+        # Replaced, but the job that would render the new image never runs
+        ad.refresh_from_db()
+        ad.image = self.upload(name='new-banner.png')
+        ad.save()
+        data = self.client.get('/api/advertisements/').json()[0]
+        self.assertRegex(data['image_src'], r'^http://testserver/media/ads/new-banner[^/]*\.png$')
+        self.assertEqual(data['image_src'], data['image_url'])
+        self.assertEqual((data['image_srcset'], data['image_placeholder']), ({}, None))
+
+    def test_backfill_command_renders_ads_saved_without_signals(self):
+        ad = self.create_ad()
+        Advertisement.objects.filter(pk=ad.pk).update(renditions={})
+        out = io.StringIO()
+        call_command('generate_ad_renditions', stdout=out)
+        self.assertIn('Updated renditions for 1 advertisements', out.getvalue())
+        ad.refresh_from_db()
+        self.assertEqual(len(ad.renditions['files']), 6)
+
+# The interval flusher would write from another thread into the test transaction
+@override_settings(AD_STATS={'BACKGROUND_FLUSH': False})
+class AdStatsTests(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+        ad_events.discard()
+        self.addCleanup(ad_events.discard)
+        self.banner = Advertisement.objects.create(title='Banner', description='Send more')
+        self.promo = Advertisement.objects.create(title='Promo', description='Zero fees', order=1)
+    
+    def totals(self):
+        return {
+            (row.advertisement_id, row.impressions, row.clicks)
+            for row in AdvertisementStats.objects.filter(date=timezone.localdate())
+        }
+    
+    @override_settings(AD_STATS={'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 10 ** 9, 'BACKGROUND_FLUSH': False})
+    def test_concurrent_impressions_are_flushed_without_losing_counts(self):
+        workers, events = 8, 1000
+        barrier = threading.Barrier(workers + 1)
+        done = threading.Event()
+        
+        def worker():
+            barrier.wait()
+            for i in range(events):
+                ad_events.record([self.banner.pk] if i % 4 else [self.banner.pk, self.promo.pk], 'impressions')
+                if i % 100 == 0:
+                    ad_events.record([self.promo.pk], 'clicks')
+        
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        # Flush repeatedly while the workers are still counting
+        flushed = 0
+        while any(thread.is_alive() for thread in threads):
+            flushed += ad_events.flush()
+        for thread in threads:
+            thread.join()
+        flushed += ad_events.flush()
+        
+        self.assertEqual(flushed, workers * (events + events // 4 + events // 100))
+        self.assertEqual(self.totals(), {
+            (self.banner.pk, workers * events, 0),
+            (self.promo.pk, workers * events // 4, workers * events // 100),
+        })
+    
+    @override_settings(AD_STATS={'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 10 ** 9, 'BACKGROUND_FLUSH': False})
+    def test_recording_does_not_touch_the_database_and_flushing_is_batched(self):
+        with self.assertNumQueries(0):
+            for _ in range(500):
+                ad_events.record([self.banner.pk, self.promo.pk], 'impressions')
+        self.assertEqual(ad_events.flush(), 1000)
+        ad_events.record([self.banner.pk], 'clicks')
+        ad_events.record([self.promo.pk], 'impressions')
+        # Known-ads lookup, row insert and a single increment UPDATE, plus the savepoint
+        with CaptureQueriesContext(connection) as queries:
+            ad_events.flush()
+        self.assertEqual(sum(not q['sql'].upper().startswith(('SAVEPOINT', 'RELEASE')) for q in queries), 3)
+        self.assertEqual(self.totals(), {(self.banner.pk, 500, 1), (self.promo.pk, 501, 0)})
+    
+    @override_settings(AD_STATS={'MAX_PENDING': 4, 'BACKGROUND_FLUSH': False})
+    def test_beacons_validate_ids_and_flush_once_enough_events_are_pending(self):
+        response = self.client.post('/api/advertisements/impressions/', {'ids': ['nope']}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/advertisements/nope/click/').status_code, 404)
+        
+        ids = [str(self.banner.pk), str(self.promo.pk), str(uuid.uuid4())]
+        response = self.client.post('/api/advertisements/impressions/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(AdvertisementStats.objects.exists())
+        self.assertEqual(self.client.post(f'/api/advertisements/{self.promo.pk}/click/').status_code, 204)
+        # The fourth event made the flush due; the unknown ad was dropped
+        self.assertEqual(self.totals(), {(self.banner.pk, 1, 0), (self.promo.pk, 1, 1)})
+        self.assertEqual(ad_events.pending, 0)
+    
+    @override_settings(AD_STATS={'FLUSH_INTERVAL': 0.01})
+    def test_counts_are_flushed_on_an_interval_without_further_traffic(self):
+        buffer = AdEventBuffer()
+        self.addCleanup(buffer.stop)
+        flushed = threading.Event()
+        
+        def flush(block=True):
+            if threading.current_thread().name == 'ad-stats-flusher':
+                flushed.set()
+        
+        with mock.patch.object(buffer, 'flush', side_effect=flush):
+            buffer.record([self.banner.pk], 'impressions')
+            self.assertTrue(flushed.wait(5))
+    
+    def test_failed_flush_keeps_counts_for_the_next_one(self):
+        ad_events.record([self.banner.pk], 'impressions')
+        with mock.patch('api.ad_stats.AdStatsService.add', side_effect=RuntimeError('database is locked')), \
+                self.assertLogs('api.ad_stats', 'ERROR'):
+            self.assertEqual(ad_events.flush(), 0)
+        ad_events.record([self.banner.pk], 'impressions')
+        self.assertEqual(ad_events.flush(), 2)
+        self.assertEqual(self.totals(), {(self.banner.pk, 2, 0)})
+    
+    def test_admin_lists_recent_totals_and_click_through_rate(self):
+        AdvertisementStats.objects.create(advertisement=self.banner, date=timezone.localdate(), impressions=200, clicks=5)
+        AdvertisementStats.objects.create(
+            advertisement=self.banner, date=timezone.localdate() - timedelta(days=90), impressions=1000, clicks=900,
+        )
+        self.client.force_login(User.objects.create_superuser('admin', password='pass'))
+        response = self.client.get('/admin/api/advertisement/')
+        self.assertContains(response, '<td class="field-recent_impressions">200</td>', html=True)
+        self.assertContains(response, '<td class="field-click_through_rate">2.5%</td>', html=True)
+
+class QuoteTokenTests(APITestCase):
+    transfer = {'amount_usd': '100.00', 'target_currency': 'GBP', 'recipient_name': 'Nyasha'}
+
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        self.user = User.objects.create_user('quoter')
+        self.client.force_authenticate(self.user)
+
+    def quote(self, **changes):
+        return self.client.post('/api/transactions/calculate/', {**self.transfer, **changes}, format='json').data
+
+    def send(self, quote_token, **changes):
+        return self.client.post(
+            '/api/transactions/send/', {**self.transfer, **changes, 'quote_token': quote_token}, format='json',
+        )
+
+    def test_send_with_token_skips_rate_lookup_and_keeps_the_quoted_price(self):
+        quote = self.quote()
+        self.assertIn('quote_expires_at', quote)
+        ExchangeRateService.store_rates({'GBP': Decimal('0.8000')})
+        with mock.patch.object(ExchangeRateService, 'get_rate') as get_rate:
+            response = self.send(quote['quote_token'])
+        get_rate.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        transaction = Transaction.objects.get()
+        self.assertEqual(transaction.exchange_rate, Decimal('0.7400'))
+        self.assertEqual(transaction.final_amount, quote['final_amount'])
+        self.assertEqual(response.data['amount_after_fee'], quote['amount_after_fee'])
+
+    def test_send_without_token_quotes_again(self):
+        ExchangeRateService.store_rates({'GBP': Decimal('0.8000')})
+        self.assertEqual(self.client.post('/api/transactions/send/', self.transfer, format='json').status_code, 201)
+        self.assertEqual(Transaction.objects.get().exchange_rate, Decimal('0.8000'))
+
+    @override_settings(QUOTE_TOKEN={'MAX_AGE': 60})
+    def test_expired_token_is_rejected(self):
+        token = self.quote()['quote_token']
+        with mock.patch('time.time', return_value=time.time() + 120):
+            response = self.send(token)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expired', response.data['detail'])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_token_must_match_the_transfer_and_user(self):
+        token = self.quote()['quote_token']
+        self.assertEqual(self.send(token + 'x').status_code, 400)
+        self.assertEqual(self.send(token, amount_usd='100.01').status_code, 400)
+        self.assertEqual(self.send(token, target_currency='ZAR').status_code, 400)
+        self.client.force_authenticate(User.objects.create_user('someone-else'))
+        self.assertEqual(self.send(token).status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_batch_honors_tokens(self):
+        transfers = [
+            {**self.transfer, 'quote_token': self.quote()['quote_token']},
+            {**self.transfer, 'amount_usd': '50.00', 'quote_token': self.quote(amount_usd='50.00')['quote_token']},
+        ]
+        with mock.patch.object(ExchangeRateService, 'get_rate') as get_rate:
+            response = self.client.post('/api/transactions/send-batch/', {'transfers': transfers}, format='json')
+        get_rate.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+class QuoteEngineTests(TestCase):
+    @staticmethod
+    def decimal_quote(amount, fee_rate, rate):
+        # The original Decimal implementation of TransactionService.quote
+        fee_amount = amount * fee_rate
+        amount_after_fee = amount - fee_amount
+        cent = Decimal('0.01')
+        return {
+            'fee_amount': fee_amount.quantize(cent, rounding=ROUND_UP),
+            'amount_after_fee': amount_after_fee.quantize(cent, rounding=ROUND_UP),
+            'final_amount': (amount_after_fee * rate).quantize(cent, rounding=ROUND_UP),
+        }
+
+    def test_batch_and_scalar_quotes_match_decimal_arithmetic(self):
+        rng = random.Random(1234)
+        for _ in range(200):
+            rate = Decimal(rng.randint(1, 10 ** 9)).scaleb(-4)
+            currency = rng.choice(['GBP', 'ZAR', 'EUR'])
+            amounts = [Decimal(rng.randint(0, 10 ** 10)).scaleb(-2) for _ in range(50)]
+            amounts += [Decimal('10.00'), Decimal('0.01'), Decimal('10000.00')]
+            batch = TransactionService.quote_many(amounts, currency, rate)
+            for amount, quote in zip(amounts, batch):
+                self.assertEqual(quote, TransactionService.quote(amount, currency, rate))
+                expected = self.decimal_quote(amount, TransactionService.fee_rate(currency), rate)
+                for name, value in expected.items():
+                    # Same digits and exponent, not just the same value
+                    self.assertEqual(quote[name].to_decimal().as_tuple(), value.as_tuple())
+                    self.assertEqual(str(quote[name]), str(value))
+
+    def test_factors_match_quantize_round_up_for_any_fee(self):
+        rng = random.Random(99)
+        for _ in range(500):
+            fee = Decimal(rng.randint(0, 100)).scaleb(-2)
+            rate = Decimal(rng.randint(1, 10 ** 7)).scaleb(-4)
+            amount = Decimal(rng.randint(-10 ** 6, 10 ** 6)).scaleb(-2)
+            cents = int(amount.scaleb(2))
+            fee_cents, _, final_cents = quote_factors(fee, rate).quote_cents([cents])
+            exact = (amount - amount * fee) * rate
+            self.assertEqual(Decimal(final_cents[0]).scaleb(-2), exact.quantize(Decimal('0.01'), rounding=ROUND_UP))
+            self.assertEqual(Decimal(fee_cents[0]).scaleb(-2), (amount * fee).quantize(Decimal('0.01'), rounding=ROUND_UP))
+
+    def test_rejects_fractional_cents(self):
+        with self.assertRaises(ValueError):
+            TransactionService.quote_many([Decimal('10.005')], 'GBP', Decimal('0.7400'))
+
+
+class MoneyTests(APITestCase):
+    def test_formatting_and_arithmetic(self):
+        self.assertEqual(str(Money(1200)), '12.00')
+        self.assertEqual(str(Money(-5)), '-0.05')
+        self.assertEqual(Money(1234) + Money(66) - Money(300), Money(1000))
+        self.assertEqual(Money.coerce('12.5'), Money(1250))
+        self.assertEqual(Money(1250), Decimal('12.50'))
+        self.assertLess(Money(999), 10)
+        self.assertEqual(hash(Money(1250)), hash(Decimal('12.5')))
+        with self.assertRaises(ValueError):
+            Money.from_decimal(Decimal('0.001'))
+
+    def test_decimal_round_trip_exact(self):
+        for value in ('0.00', '0.01', '10.10', '99999999.99', '1234.50'):
+            self.assertEqual(str(Money.from_decimal(Decimal(value)).to_decimal()), value)
+
+    def test_model_fields_round_trip_through_the_database(self):
+        user = User.objects.create_user('saver')
+        transaction = Transaction.objects.create(
+            user=user, amount_usd=Decimal('12.30'), target_currency='GBP', exchange_rate=Decimal('0.7400'),
+            fee_percentage=Decimal('10.00'), fee_amount=Money(123), final_amount=Money(819), recipient_name='R',
+        )
+        transaction.refresh_from_db()
+        self.assertIsInstance(transaction.amount_usd, Money)
+        self.assertEqual((transaction.amount_usd, transaction.fee_amount), (Money(1230), Money(123)))
+        self.assertTrue(Transaction.objects.filter(final_amount=Decimal('8.19'), amount_usd__gt=Money(1000)).exists())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT amount_usd FROM api_transaction')
+            self.assertEqual(Decimal(str(cursor.fetchone()[0])), Decimal('12.30'))
+
+    def test_responses_render_like_decimals(self):
+        create_rates()
+        rate_cache.invalidate()
+        self.client.force_authenticate(User.objects.create_user('renderer'))
+        response = self.client.post(
+            '/api/transactions/calculate/',
+            {'amount_usd': '123.45', 'target_currency': 'ZAR', 'recipient_name': 'R'}, format='json',
+        )
+        decimal_quote = QuoteEngineTests.decimal_quote(Decimal('123.45'), Decimal('0.20'), Decimal('17.7500'))
+        body = json.loads(response.content)
+        self.assertEqual(body['amount_usd'], 123.45)
+        self.assertEqual(body['final_amount'], float(decimal_quote['final_amount']))
+
+        self.client.post(
+            '/api/transactions/send/',
+            {'amount_usd': '20.00', 'target_currency': 'GBP', 'recipient_name': 'R'}, format='json',
+        )
+        row = json.loads(self.client.get('/api/transactions/history/').content)['transactions'][0]
+        self.assertEqual((row['amount_usd'], row['fee_amount'], row['final_amount']), ('20.00', '2.00', '13.32'))
+
+
+class QuoteGridTests(APITestCase):
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        self.client.force_authenticate(User.objects.create_user('slider'))
+
+    def test_grid_matches_single_quotes(self):
+        response = self.client.get('/api/transactions/quote-grid/', {'currency': 'ZAR', 'min': '10', 'max': '1000', 'step': '12.50'})
+        self.assertEqual(response.status_code, 200)
+        points = response.data['points']
+        self.assertEqual(len(points), 80)
+        self.assertEqual(points[-1]['amount_usd'], Decimal('997.50'))
+        for point in points:
+            quote = TransactionService.calculate_transaction(point['amount_usd'], 'ZAR')
+            self.assertEqual(point['final_amount'], quote['final_amount'])
+            self.assertEqual(point['fee_amount'], quote['fee_amount'])
+
+    def test_grid_defaults_cover_the_transfer_limits(self):
+        response = self.client.get('/api/transactions/quote-grid/', {'currency': 'GBP'})
+        self.assertEqual(len(response.data['points']), 1000)
+        self.assertEqual(response.data['fee_percentage'], Decimal('10.00'))
+
+    def test_invalid_grids_are_rejected(self):
+        for params in ({'currency': 'GBP', 'step': '0.01'}, {'currency': 'GBP', 'min': '500', 'max': '100'}, {}):
+            response = self.client.get('/api/transactions/quote-grid/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        create_rates()
+        rate_cache.invalidate()
+        self.user = User.objects.create_user('parent')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.body = {'amount_usd': '123.45', 'target_currency': 'ZAR', 'recipient_name': 'Thandi'}
+
+    def test_async_calculate_matches_drf_view(self):
+        drf = self.client.post('/api/transactions/calculate/', self.body, format='json', **self.auth)
+        native = self.async_client_call('post', '/api/async/transactions/calculate/', json.dumps(self.body),
+                                        content_type='application/json', **self.auth)
+        self.assertEqual(native.status_code, 200, native.content)
+        # Quote tokens are signed at issue time, so only the prices must match
+        native, drf = native.json(), drf.json()
+        for quote in (native, drf):
+            quote.pop('quote_expires_at')
+            self.assertTrue(quote.pop('quote_token'))
+        self.assertEqual(native, drf)
+
+    def test_async_calculate_validates_and_authenticates(self):
+        response = self.async_client_call('post', '/api/async/transactions/calculate/', json.dumps({'amount_usd': '1'}),
+                                          content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('target_currency', response.json())
+
+        response = self.async_client_call('post', '/api/async/transactions/calculate/', json.dumps(self.body),
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        response = self.async_client_call('post', '/api/async/transactions/calculate/', json.dumps(self.body),
+                                          content_type='application/json', HTTP_AUTHORIZATION='Bearer junk')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+    def test_async_rate_list_matches_drf_view(self):
+        drf = self.client.get('/api/exchange-rates/')
+        native = self.async_client_call('get', '/api/async/exchange-rates/')
+        self.assertEqual(native.json(), drf.json())
+
+    def async_client_call(self, method, path, *args, **extra):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+        headers = {key[5:].replace('_', '-').lower(): value for key, value in extra.items() if key.startswith('HTTP_')}
+        kwargs = {key: value for key, value in extra.items() if not key.startswith('HTTP_')}
+        return async_to_sync(getattr(AsyncClient(), method))(path, *args, headers=headers, **kwargs)
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        create_rates()
+        rate_cache.invalidate()
+        for metric in (request_latency, request_queries, request_query_seconds):
+            metric.clear()
+
+    def test_requests_are_timed_per_route_with_their_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/exchange-rates/')
+            self.client.get('/api/exchange-rates/')
+        self.assertEqual(request_latency.snapshot(route='exchange-rates-list', method='GET', status=200)['count'], 2)
+        self.assertEqual(request_queries.snapshot(route='exchange-rates-list')['sum'], len(queries))
+        self.assertGreater(request_query_seconds.snapshot(route='exchange-rates-list')['sum'], 0)
+        self.client.get('/api/no-such-page/')
+        self.assertEqual(request_latency.snapshot(route='unmatched', method='GET', status=404)['count'], 1)
+        self.client.generic('FOO', '/api/no-such-page/')
+        self.client.generic('BAR', '/api/no-such-page/')
+        self.assertEqual(request_latency.snapshot(route='unmatched', method='other', status=404)['count'], 2)
+
+    def test_queries_of_async_views_are_counted(self):
+        from asgiref.sync import async_to_sync
+        from django.test import AsyncClient
+        self.assertEqual(async_to_sync(AsyncClient().get)('/api/async/exchange-rates/').status_code, 200)
+        self.assertEqual(request_queries.snapshot(route='async-exchange-rates')['sum'], 1)
+
+    def test_metrics_endpoint_serves_prometheus_text_to_allowed_ips(self):
+        self.client.get('/api/exchange-rates/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'http_request_duration_seconds_count{route="exchange-rates-list",method="GET",status="200"} 1', body,
+        )
+        self.assertIn('http_request_db_queries_bucket{route="exchange-rates-list",le="+Inf"} 1', body)
+        self.assertIn('# TYPE cache_requests_total counter', body)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+    def test_proxied_scrapes_need_the_token(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='203.0.113.9').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_FORWARDED='for=203.0.113.9').status_code, 403)
+        with override_settings(METRICS={'TOKEN': 'scrape-secret'}):
+            for headers in ({'HTTP_AUTHORIZATION': 'Bearer wrong'}, {}):
+                response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.9', **headers)
+                self.assertEqual(response.status_code, 403)
+            response = self.client.get(
+                '/metrics', REMOTE_ADDR='203.0.113.9', HTTP_X_FORWARDED_FOR='203.0.113.9',
+                HTTP_AUTHORIZATION='Bearer scrape-secret',
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_label_values_are_escaped(self):
+        requests_total = Counter('requests_total', 'Requests', ('path',))
+        requests_total.inc(path='say "hi"\n')
+        self.assertEqual(
+            render_text({'requests_total': requests_total}),
+            '# HELP requests_total Requests\n# TYPE requests_total counter\nrequests_total{path="say \\"hi\\"\\n"} 1\n',
+        )
+
+    def test_cache_hits_and_misses_are_counted(self):
+        before = {result: cache_requests.value(cache='rates', result=result) for result in ('hit', 'miss')}
+        self.client.get('/api/exchange-rates/')
+        TransactionService.calculate_transaction(Decimal('10.00'), 'GBP')
+        TransactionService.calculate_transaction(Decimal('10.00'), 'GBP')
+        self.assertEqual(cache_requests.value(cache='rates', result='miss'), before['miss'] + 1)
+        self.assertEqual(cache_requests.value(cache='rates', result='hit'), before['hit'] + 1)
+
+    @override_settings(METRICS={'SLOW_REQUEST_SECONDS': 0})
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs('api.middleware', 'WARNING') as logs:
+            self.client.get('/api/exchange-rates/')
+        self.assertIn('Slow request GET /api/exchange-rates/ (exchange-rates-list): 200', logs.output[0])
+        self.assertIn('FROM "api_exchangerate"', logs.output[0])
+
+    @override_settings(METRICS={'ENABLED': False})
+    def test_disabled_metrics_record_nothing(self):
+        self.client.get('/api/exchange-rates/')
+        self.assertEqual(request_latency.snapshot(route='exchange-rates-list', method='GET', status=200)['count'], 0)
+
+    def test_middleware_overhead_is_small(self):
+        request = RequestFactory().get('/api/exchange-rates/')
+        response = HttpResponse()
+        middleware = MetricsMiddleware(lambda request: response)
+        start = time.perf_counter()
+        for _ in range(2000):
+            middleware(request)
+        self.assertLess((time.perf_counter() - start) / 2000, 0.0002)  # well under the cost of one query
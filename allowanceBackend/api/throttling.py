@@ -0,0 +1,141 @@
+import math
+import time
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+from .conf import app_settings
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+MICROSECONDS = 1_000_000
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60.0): a bucket of 10 tokens refilled at 10 per 60 seconds."""
+    try:
+        num, period = rate.split('/')
+        return int(num), float(PERIODS[period[0]])
+    except (ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured(f'Invalid THROTTLE rate {rate!r}; expected e.g. "10/min"')
+
+
+def bucket_key(options, scope, ident):
+    return f"{options['KEY_PREFIX']}:{scope}:{ident}"
+
+
+def reset_user_buckets(user):
+    """Give a new user full buckets, even if the database reused a deleted user's pk."""
+    options = app_settings('THROTTLE')
+    caches[options['CACHE_ALIAS']].delete_many(
+        [bucket_key(options, scope, f'user:{user.pk}') for scope in options['RATES']]
+    )
+
+
+def take_token(cache, key, capacity, period):
+    """
+    Take one token from the bucket at `key`; return 0 if it was available,
+    otherwise the seconds until it will be.
+
+    The bucket is kept as a single integer, its theoretical arrival time
+    (GCRA): the moment, in microseconds, at which it would be full again.
+    Each request moves it one refill interval later with incr(), so the
+    common path costs one cache round trip. Concurrent workers never lose
+    an update as long as incr() is atomic across them: true of Redis and
+    Memcached, but not of Django's file and database caches, and a
+    LocMemCache is only shared by the threads of one process. A request is
+    allowed while the bucket time stays within `capacity` intervals of now.
+    """
+    interval = int(period * MICROSECONDS / capacity)
+    now = int(time.time() * MICROSECONDS)
+    # Keys outlive a full refill by far, so only a bucket kept busy for the
+    # whole timeout is ever restarted early.
+    timeout = max(math.ceil(period) * 2, 3600)
+    try:
+        tat = cache.incr(key, interval)
+    except ValueError:
+        # A new bucket starts full
+        if cache.add(key, now + interval, timeout=timeout):
+            return 0
+        tat = cache.incr(key, interval)
+    if tat < now + interval:
+        # The bucket sat full: restart it at now so idle time can't bank more
+        # than `capacity` tokens. An absolute set rather than an incr by the
+        # gap, so requests racing through here after an idle spell each write
+        # the same value instead of adding the gap once per request; a token
+        # taken in that window can be lost, which only errs towards allowing.
+        cache.set(key, now + interval, timeout=timeout)
+        return 0
+    if tat - now <= capacity * interval:
+        return 0
+    cache.decr(key, interval)  # give the token back
+    return (tat - capacity * interval - now) / MICROSECONDS
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket throttle shared by every worker through THROTTLE['CACHE_ALIAS'].
+
+    The bucket size and refill rate come from THROTTLE['RATES'][scope],
+    where the scope is the throttle's `scope` or the view's
+    `throttle_scope`; views without a configured rate are not throttled.
+    A refused request is answered with 429 and a Retry-After header.
+    """
+
+    scope = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        options = app_settings('THROTTLE')
+        scope = self.scope or getattr(view, 'throttle_scope', None)
+        rate = options['RATES'].get(scope)
+        if not options['ENABLED'] or not rate:
+            return True
+        capacity, period = parse_rate(rate)
+        key = bucket_key(options, scope, self.get_cache_key(request, view))
+        self.wait_seconds = take_token(caches[options['CACHE_ALIAS']], key, capacity, period)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user; anonymous requests share one per IP."""
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per client IP (honouring NUM_PROXIES like DRF's own throttles)."""
+
+    def get_cache_key(self, request, view):
+        return f'ip:{self.get_ident(request)}'
+
+
+class LoginThrottle(IPTokenBucketThrottle):
+    scope = 'login'
+
+
+class RegisterThrottle(IPTokenBucketThrottle):
+    scope = 'register'
+
+
+class CalculateThrottle(UserTokenBucketThrottle):
+    scope = 'calculate'
+
+
+class SendThrottle(UserTokenBucketThrottle):
+    scope = 'send'
+
+
+class AdEventThrottle(IPTokenBucketThrottle):
+    scope = 'ad-events'
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 # Create router for ViewSets
 router = DefaultRouter()
@@ -13,6 +13,10 @@ urlpatterns = [
     path('auth/register/', views.register, name='register'),
     path('auth/login/', views.login, name='login'),
     
+    # ASGI-native quote and rates endpoints (see api/async_views.py)
+    path('async/transactions/calculate/', async_views.calculate_transaction, name='async-calculate'),
+    path('async/exchange-rates/', async_views.exchange_rate_list, name='async-exchange-rates'),
+    
     # Include router URLs for ViewSets
     path('', include(router.urls)),
 ]
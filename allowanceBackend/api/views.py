@@ -1,25 +1,57 @@
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from django.db.models import Count, Q
 from .models import Transaction, ExchangeRate, Advertisement
 from .serializers import (
     UserRegistrationSerializer, 
     UserLoginSerializer,
     TransactionCalculationSerializer,
+    TransactionBatchSerializer,
+    TransactionExportSerializer,
+    QuoteGridSerializer,
     TransactionSerializer,
+    TransactionSummarySerializer,
+    TransactionTotalSerializer,
     ExchangeRateSerializer,
+    RatePointSerializer,
+    AdImpressionSerializer,
     AdvertisementSerializer
 )
-from .services import ExchangeRateService, TransactionService
+from .ad_stats import ad_events
+from .conf import app_settings
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_text
+from .exports import export_response
+from .http_cache import ConditionalListMixin
+from .pagination import InvalidCursor, paginate_keyset
+from .throttling import AdEventThrottle, CalculateThrottle, LoginThrottle, RegisterThrottle, SendThrottle
+from .services import (
+    ExchangeRateService,
+    IdempotencyConflict,
+    IdempotencyInProgress,
+    IdempotencyService,
+    QuoteTokenError,
+    RateHistoryService,
+    TransactionService,
+    TransactionSummaryService,
+)
+from datetime import timedelta
 from decimal import Decimal
+import uuid
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
 
 # Authentication Views (keeping as function-based for simplicity)
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterThrottle])
 def register(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
@@ -40,6 +72,7 @@ def register(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginThrottle])
 def login(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
@@ -70,7 +103,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
         # This won't be used directly, we'll use custom actions
         serializer.save(user=self.request.user)
     
-    @action(detail=False, methods=['post'], url_path='calculate')
+    @action(detail=False, methods=['post'], url_path='calculate', throttle_classes=[CalculateThrottle])
     def calculate_transaction(self, request):
         serializer = TransactionCalculationSerializer(data=request.data)
         if serializer.is_valid():
@@ -78,50 +111,239 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 serializer.validated_data['amount_usd'],
                 serializer.validated_data['target_currency']
             )
+            result.update(TransactionService.issue_quote(request.user, result))
             return Response(result)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    @action(detail=False, methods=['post'], url_path='send')
+    @action(detail=False, methods=['get'], url_path='quote-grid')
+    def quote_grid(self, request):
+        serializer = QuoteGridSerializer(data=request.GET)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            try:
+                result = TransactionService.quote_grid(data['currency'], data['min'], data['max'], data['step'])
+            except ValueError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(result)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'], url_path='send', throttle_classes=[SendThrottle])
     def create_transaction(self, request):
         calculation_serializer = TransactionCalculationSerializer(data=request.data)
         if calculation_serializer.is_valid():
-            transaction_data = TransactionService.create_transaction(
-                user=request.user,
-                **calculation_serializer.validated_data
-            )
-            return Response(transaction_data, status=status.HTTP_201_CREATED)
+            def send():
+                return status.HTTP_201_CREATED, TransactionService.create_transaction(
+                    user=request.user,
+                    **calculation_serializer.validated_data
+                )
+            
+            # Retries carrying the same Idempotency-Key replay the first response
+            key = request.headers.get('Idempotency-Key')
+            if key is not None and (not key or len(key) > 255):
+                return Response({'detail': 'Idempotency-Key must be 1 to 255 characters.'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                if key is None:
+                    status_code, body = send()
+                    return Response(body, status=status_code)
+                status_code, body, replayed = IdempotencyService.execute(
+                    request.user, key, IdempotencyService.fingerprint(calculation_serializer.validated_data), send
+                )
+            except QuoteTokenError as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except IdempotencyConflict as e:
+                return Response({'detail': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            except IdempotencyInProgress as e:
+                return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+            response = Response(body, status=status_code)
+            if replayed:
+                response['Idempotent-Replayed'] = 'true'
+            return response
         return Response(calculation_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], url_path='send-batch', throttle_classes=[SendThrottle])
+    def create_transaction_batch(self, request):
+        batch_serializer = TransactionBatchSerializer(data=request.data)
+        if batch_serializer.is_valid():
+            try:
+                results = TransactionService.create_transactions(
+                    request.user, batch_serializer.validated_data['transfers']
+                )
+            except ValueError as e:  # includes QuoteTokenError
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'transactions': results}, status=status.HTTP_201_CREATED)
+        return Response(batch_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'], url_path=r'status/(?P<transaction_id>[0-9a-fA-F-]+)')
+    def transaction_status(self, request, transaction_id):
+        # Cheap poll target while a transfer settles: one indexed lookup, three columns
+        try:
+            transaction_id = uuid.UUID(transaction_id)
+        except ValueError:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        row = (
+            self.get_queryset()
+            .filter(transaction_id=transaction_id)
+            .values('transaction_id', 'status', 'updated_at')
+            .first()
+        )
+        if row is None:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(row)
+    
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        # Whole history as a streamed download, oldest first
+        serializer = TransactionExportSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        filters = serializer.validated_data
+        transactions = self.get_queryset()
+        if 'start' in filters:
+            transactions = transactions.filter(created_at__gte=filters['start'])
+        if 'end' in filters:
+            transactions = transactions.filter(created_at__lt=filters['end'])
+        if 'currency' in filters:
+            transactions = transactions.filter(target_currency=filters['currency'])
+        return export_response(transactions, filters['type'], 'transactions')
+    
+    @action(detail=False, methods=['get'], url_path='summary')
+    def transaction_summary(self, request):
+        # Served from the TransactionSummary aggregate table, not Transaction
+        currency = request.GET.get('currency', '').upper()
+        if currency and currency not in dict(Transaction.CURRENCY_CHOICES):
+            return Response({'currency': [f'"{currency}" is not a valid choice.']}, status=status.HTTP_400_BAD_REQUEST)
+        rows, totals = TransactionSummaryService.summary(request.user, currency)
+        return Response({
+            'months': TransactionSummarySerializer(rows, many=True).data,
+            'totals': TransactionTotalSerializer(totals, many=True).data,
+        })
+    
     @action(detail=False, methods=['get'], url_path='history')
     def transaction_history(self, request):
-        transactions = self.get_queryset()
+        # Rendered from .values() rows; identical output to TransactionSerializer(instances)
+        transactions = TransactionSerializer.values_queryset(self.get_queryset())
+        
+        # Keyset pagination: ?cursor= (empty for the first page)
+        if 'cursor' in request.GET:
+            try:
+                page_size = min(max(int(request.GET.get('page_size', 10)), 1), 100)
+            except ValueError:
+                return Response({'page_size': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                rows, next_cursor = paginate_keyset(transactions, request.GET['cursor'], page_size)
+            except InvalidCursor as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'transactions': TransactionSerializer.values_data(rows),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+            })
         
         # Pagination
         page = request.GET.get('page', 1)
         paginator = Paginator(transactions, 10)  # 10 transactions per page
         page_obj = paginator.get_page(page)
         
-        serializer = TransactionSerializer(page_obj, many=True)
-        
         return Response({
-            'transactions': serializer.data,
+            'transactions': TransactionSerializer.values_data(page_obj),
             'total_pages': paginator.num_pages,
             'current_page': int(page),
             'has_next': page_obj.has_next(),
             'has_previous': page_obj.has_previous(),
         })
 
-class ExchangeRateViewSet(viewsets.ReadOnlyModelViewSet):
+class ExchangeRateViewSet(ConditionalListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = ExchangeRate.objects.filter(currency_code__in=['GBP', 'ZAR'])
     serializer_class = ExchangeRateSerializer
     permission_classes = [AllowAny]
+    version_field = 'last_updated'
     
-    def list(self, request, *args, **kwargs):
-        # Update rates before returning
-        ExchangeRateService.update_rates()
-        return super().list(request, *args, **kwargs)
+    def get_version_aggregates(self):
+        # Rows only get older between writes, so the number of stale rows
+        # pins down every is_stale flag in the body
+        stale_before = timezone.now() - timedelta(seconds=app_settings('RATE_REFRESH')['STALE_AFTER'])
+        return {'stale': Count('pk', filter=Q(last_updated__lt=stale_before))}
+    
+    @action(detail=False, methods=['get'], url_path='history')
+    def history(self, request):
+        currency_code = request.GET.get('currency', '').upper()
+        if not currency_code:
+            return Response({'currency': ['This query parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        end = timezone.now()
+        start = end - timedelta(days=7)
+        for name in ('start', 'end'):
+            if name in request.GET:
+                try:
+                    # None when malformed; ValueError when well-formed but out of range (Feb 30)
+                    value = parse_datetime(request.GET[name])
+                except ValueError:
+                    value = None
+                if value is None:
+                    return Response({name: ['Enter a valid ISO 8601 datetime.']}, status=status.HTTP_400_BAD_REQUEST)
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                if name == 'start':
+                    start = value
+                else:
+                    end = value
+        
+        if start > end:
+            return Response({'end': ['Must not be before start.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # A public endpoint: never load more than MAX_POINTS rows, however
+        # wide the range. The client continues from the last point it got.
+        max_points = app_settings('RATE_HISTORY')['MAX_POINTS']
+        points = RateHistoryService.rate_series(currency_code, start, end, limit=max_points + 1)
+        serializer = RatePointSerializer(
+            [{'effective_at': effective_at, 'rate_to_usd': rate} for effective_at, rate in points[:max_points]], many=True
+        )
+        return Response({
+            'currency_code': currency_code, 'points': serializer.data, 'truncated': len(points) > max_points,
+        })
 
-class AdvertisementViewSet(viewsets.ReadOnlyModelViewSet):
+class AdvertisementViewSet(ConditionalListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Advertisement.objects.filter(is_active=True)
     serializer_class = AdvertisementSerializer
     permission_classes = [AllowAny]
+    
+    def get_version_queryset(self):
+        # Include inactive ads so deactivating one changes the version
+        return Advertisement.objects.all()
+    
+    # Impressions and clicks are buffered in memory (api/ad_stats.py) and
+    # written to AdvertisementStats in batches, so these never touch the
+    # database themselves; ids of unknown ads are dropped at flush time.
+    @action(detail=False, methods=['post'], throttle_classes=[AdEventThrottle])
+    def impressions(self, request):
+        serializer = AdImpressionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        ad_events.record(set(serializer.validated_data['ids']), 'impressions')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=True, methods=['post'], throttle_classes=[AdEventThrottle])
+    def click(self, request, pk=None):
+        try:
+            ad_id = uuid.UUID(pk)
+        except ValueError:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        ad_events.record([ad_id], 'clicks')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@require_GET
+def metrics(request):
+    # Plain Django view: a scrape shouldn't go through JWT authentication or throttling
+    options = app_settings('METRICS')
+    token = options['TOKEN']
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(render_text(), content_type=METRICS_CONTENT_TYPE)
+    allowed = options['ALLOWED_IPS']
+    if allowed is not None:
+        # Behind a reverse proxy on the same host every client arrives from
+        # 127.0.0.1, so a forwarded request is never allowed by its address
+        forwarded = 'HTTP_X_FORWARDED_FOR' in request.META or 'HTTP_FORWARDED' in request.META
+        if forwarded or request.META.get('REMOTE_ADDR') not in allowed:
+            return HttpResponseForbidden()
+    return HttpResponse(render_text(), content_type=METRICS_CONTENT_TYPE)
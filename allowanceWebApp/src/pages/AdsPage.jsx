@@ -1,10 +1,18 @@
-import React from 'react';
+import React, { useEffect } from 'react';
 import { Card, CardContent, Typography, Grid, Box, CircularProgress, CardMedia } from '@mui/material';
 import { FaBullhorn } from 'react-icons/fa';
-import { useGetAdsQuery } from '../store/slices/adsApiSlice';
+import { useGetAdsQuery, useRecordImpressionsMutation, useRecordClickMutation } from '../store/slices/adsApiSlice';
 
 const AdsPage = () => {
   const { data: ads, isLoading } = useGetAdsQuery();
+  const [recordImpressions] = useRecordImpressionsMutation();
+  const [recordClick] = useRecordClickMutation();
+
+  useEffect(() => {
+    if (ads && ads.length > 0) {
+      recordImpressions(ads.map((ad) => ad.id));
+    }
+  }, [ads, recordImpressions]);
 
   return (
     <Box sx={{ p: 3, background: 'linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%)', minHeight: '100vh' }}>
@@ -48,13 +56,27 @@ const AdsPage = () => {
                 alignItems: 'center',
                 width: '100%',
               }}>
-                {ad.image_url && (
-                  <CardMedia
-                    component="img"
-                    image={ad.image_url}
-                    alt={ad.title || 'Ad'}
-                    sx={{ height: 120, objectFit: 'cover', borderRadius: 3, mb: 2, width: '100%' }}
-                  />
+                {ad.image_src && (
+                  <Box component="picture" sx={{ width: '100%', display: 'block' }}>
+                    {Object.entries(ad.image_srcset || {}).map(([type, srcSet]) => (
+                      <source key={type} type={type} srcSet={srcSet} sizes="(max-width: 600px) 100vw, 400px" />
+                    ))}
+                    <CardMedia
+                      component="img"
+                      image={ad.image_src}
+                      alt={ad.title || 'Ad'}
+                      loading="lazy"
+                      sx={{
+                        height: 120,
+                        objectFit: 'cover',
+                        borderRadius: 3,
+                        mb: 2,
+                        width: '100%',
+                        backgroundImage: ad.image_placeholder ? `url(${ad.image_placeholder})` : undefined,
+                        backgroundSize: 'cover',
+                      }}
+                    />
+                  </Box>
                 )}
                 <CardContent sx={{ width: '100%', p: 3 }}>
                   <Box sx={{ display: 'flex', alignItems: 'center', justifyContent: 'center', mb: 2 }}>
@@ -66,9 +88,15 @@ const AdsPage = () => {
                   <Typography variant="body1" sx={{ color: '#4a5568', fontSize: 17, mb: 1 }}>
                     {ad.description || 'No description provided.'}
                   </Typography>
-                  {ad.link && (
+                  {ad.link_url && (
                     <Box sx={{ mt: 2, textAlign: 'center' }}>
-                      <a href={ad.link} target="_blank" rel="noopener noreferrer" style={{ textDecoration: 'none' }}>
+                      <a
+                        href={ad.link_url}
+                        target="_blank"
+                        rel="noopener noreferrer"
+                        style={{ textDecoration: 'none' }}
+                        onClick={() => recordClick(ad.id)}
+                      >
                         <Typography variant="button" sx={{ color: '#38a169', fontWeight: 700, fontSize: 16 }}>
                           Learn More
                         </Typography>
@@ -2,6 +2,7 @@ import React from 'react';
 import { Link } from 'react-router-dom';
 import 'bootstrap/dist/css/bootstrap.min.css';
 import { FaMoneyCheckAlt, FaHistory, FaExchangeAlt, FaBullhorn } from 'react-icons/fa';
+import { useSummaryQuery } from '../store/slices/transactionApiSlice';
 
 
 const cardData = [
@@ -39,6 +40,22 @@ const cardData = [
   },
 ];
 
+// All-time totals per currency, served from the pre-aggregated summary table
+const SummaryStrip = () => {
+  const { data } = useSummaryQuery();
+  if (!data || data.totals.length === 0) return null;
+  return (
+    <div className="d-flex flex-wrap justify-content-center gap-4 mt-3">
+      {data.totals.map((total) => (
+        <div key={total.target_currency} className="text-secondary" style={{ fontSize: '1.05rem' }}>
+          <strong className="text-primary">{total.target_currency}</strong>: {total.transfer_count} transfers,
+          ${total.total_usd} sent, {total.total_final} {total.target_currency} received
+        </div>
+      ))}
+    </div>
+  );
+};
+
 const DashboardPage = () => (
   <div className="container-fluid" style={{ marginTop: 0, minHeight: '100vh', background: '#fff', padding: '0 0 48px 0' }}>
     <div className="row justify-content-center align-items-center" style={{ minHeight: 220, background: 'linear-gradient(90deg, #e0eafc 0%, #cfdef3 100%)', borderRadius: 0, marginBottom: 32 }}>
@@ -47,6 +64,7 @@ const DashboardPage = () => (
         <p className="text-secondary" style={{ fontSize: '1.2rem', maxWidth: 600, margin: '0 auto' }}>
           Manage your transfers, view transaction history, check rates, and explore promotions. Everything you need in one place.
         </p>
+        <SummaryStrip />
       </div>
     </div>
     <div className="row g-4 justify-content-center">
@@ -50,11 +50,18 @@ const TransferPage = () => {
     e.preventDefault();
     setError(null);
     setSuccess(null);
+    // Send at the calculated price if the quote is for the same transfer
+    const quoteToken = calcResult
+      && calcResult.target_currency === targetCurrency
+      && Number(calcResult.amount_usd) === Number(amountUsd)
+      ? calcResult.quote_token
+      : undefined;
     try {
       const result = await send({
         amount_usd: amountUsd,
         target_currency: targetCurrency,
         recipient_name: recipientName,
+        quote_token: quoteToken,
       }, {
         headers: { Authorization: `Bearer ${accessToken}` }
       }).unwrap();
@@ -10,7 +10,14 @@ export const adsApiSlice = createApi({
       query: () => 'advertisements/',
       providesTags: ['Ads'],
     }),
+    // Counted in batches on the server; nothing to refetch afterwards
+    recordImpressions: builder.mutation({
+      query: (ids) => ({ url: 'advertisements/impressions/', method: 'POST', body: { ids } }),
+    }),
+    recordClick: builder.mutation({
+      query: (id) => ({ url: `advertisements/${id}/click/`, method: 'POST' }),
+    }),
   }),
 });
 
-export const { useGetAdsQuery } = adsApiSlice;
+export const { useGetAdsQuery, useRecordImpressionsMutation, useRecordClickMutation } = adsApiSlice;
@@ -35,6 +35,10 @@ export const transactionApiSlice = createApi({
       query: (page = 1) => `transactions/history/?page=${page}`,
       providesTags: ['Transaction'],
     }),
+    summary: builder.query({
+      query: () => 'transactions/summary/',
+      providesTags: ['Transaction'],
+    }),
     detail: builder.query({
       query: (uuid) => `transactions/${uuid}/`,
       providesTags: ['Transaction'],
@@ -42,4 +46,4 @@ export const transactionApiSlice = createApi({
   }),
 });
 
-export const { useCalculateMutation, useSendMutation, useHistoryQuery, useDetailQuery } = transactionApiSlice;
+export const { useCalculateMutation, useSendMutation, useHistoryQuery, useSummaryQuery, useDetailQuery } = transactionApiSlice;